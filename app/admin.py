@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Produit
+from .models import CompteurCodeBarre, Produit, RenduCodeBarre
 
 # Register your models here
 # 
@@ -8,4 +8,17 @@ from .models import Produit
 class ProduitAdmin(admin.ModelAdmin):
     model = Produit
     list_display = ['nom', 'prix','date_creation']
-admin.site.register(Produit, ProduitAdmin)
\ No newline at end of file
+admin.site.register(Produit, ProduitAdmin)
+
+
+class RenduCodeBarreAdmin(admin.ModelAdmin):
+    model = RenduCodeBarre
+    list_display = ['produit', 'statut', 'tentatives', 'date_maj']
+    list_filter = ['statut']
+admin.site.register(RenduCodeBarre, RenduCodeBarreAdmin)
+
+
+class CompteurCodeBarreAdmin(admin.ModelAdmin):
+    model = CompteurCodeBarre
+    list_display = ['prefixe', 'prochain']
+admin.site.register(CompteurCodeBarre, CompteurCodeBarreAdmin)
\ No newline at end of file
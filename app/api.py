@@ -0,0 +1,283 @@
+"""
+API JSON pour les scanners (douchettes USB, terminaux portables).
+
+Les réponses sont volontairement compactes. L'authentification se fait par
+session Django ou par jeton (en-tête « Authorization: Token <jeton> », jetons
+définis dans SCAN_API_JETONS) ; un client à jeton n'entraîne aucune requête
+SQL d'authentification. Sous ASGI, le scan unitaire et le scan par lot sont
+servis par leurs versions asynchrones (suffixe _asynchrone, voir urls.py).
+"""
+import hmac
+import json
+from functools import lru_cache, wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import FileResponse, JsonResponse, HttpResponseNotModified
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import catalogue, changements, ean13
+from .cache_prix import cache_prix
+from .generation import ageneration_catalogue, generation_catalogue
+from .models import InstantaneCatalogue
+from .registre import SCANS
+
+# Nombre maximal de codes acceptés par appel à api_scan_lot
+SCAN_LOT_MAX = 1000
+
+
+def jeton_valide(request):
+    entete = request.headers.get('Authorization', '')
+    if not entete.startswith('Token '):
+        return False
+    jeton = entete[len('Token '):].strip()
+    return any(hmac.compare_digest(jeton, attendu) for attendu in settings.SCAN_API_JETONS)
+
+
+def connexion_ou_jeton_requis(vue):
+    """
+    Comme login_required, mais accepte un jeton d'API et répond 401 en JSON.
+    Une vue asynchrone lit la session avec request.auser(), sans bloquer la boucle.
+    """
+    if iscoroutinefunction(vue):
+        @wraps(vue)
+        async def verifier_async(request, *args, **kwargs):
+            if jeton_valide(request) or (await request.auser()).is_authenticated:
+                return await vue(request, *args, **kwargs)
+            return authentification_requise()
+        return verifier_async
+
+    @wraps(vue)
+    def verifier(request, *args, **kwargs):
+        # Le jeton est testé d'abord : request.user lirait la session en base
+        if jeton_valide(request) or request.user.is_authenticated:
+            return vue(request, *args, **kwargs)
+        return authentification_requise()
+    return verifier
+
+
+def authentification_requise():
+    return JsonResponse({'erreur': "Authentification requise."}, status=401)
+
+
+def produit_en_json(produit):
+    return {'id': produit.id, 'nom': produit.nom, 'prix': str(produit.prix), 'code': produit.ean13}
+
+
+def reponse_scan(code, produit):
+    SCANS.inc(canal='api', resultat='trouve' if produit else 'inconnu')
+    if produit is None:
+        return JsonResponse({'erreur': "Produit introuvable.", 'code': ean13.code_complet(code)}, status=404)
+    return JsonResponse(produit_en_json(produit))
+
+
+def avec_etag(reponse, etag):
+    reponse['ETag'] = etag
+    reponse['Cache-Control'] = 'private, no-cache'
+    return reponse
+
+
+# ===================================
+#
+# scan unitaire
+@require_GET
+@connexion_ou_jeton_requis
+def api_scan(request, code):
+    """
+    Recherche d'un code (12 ou 13 chiffres). L'ETag dépend du code et de la
+    génération du catalogue : un client qui renvoie If-None-Match reçoit un 304
+    sans requête SQL tant qu'aucun produit n'a changé.
+    """
+    try:
+        code = ean13.normaliser(code)
+    except ValueError as exc:
+        SCANS.inc(canal='api', resultat='invalide')
+        return JsonResponse({'erreur': str(exc)}, status=400)
+
+    generation = generation_catalogue()
+    etag = f'"{code}-{generation}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return avec_etag(HttpResponseNotModified(), etag)
+    # Prix lu sous la génération de l'ETag : jamais plus ancien que celle-ci
+    return avec_etag(reponse_scan(code, cache_prix().obtenir(code, generation)), etag)
+
+
+@require_GET
+@connexion_ou_jeton_requis
+async def api_scan_asynchrone(request, code):
+    """ Version asynchrone de api_scan, routée à sa place sous ASGI. """
+    try:
+        code = ean13.normaliser(code)
+    except ValueError as exc:
+        SCANS.inc(canal='api', resultat='invalide')
+        return JsonResponse({'erreur': str(exc)}, status=400)
+
+    generation = await ageneration_catalogue()
+    etag = f'"{code}-{generation}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return avec_etag(HttpResponseNotModified(), etag)
+    return avec_etag(reponse_scan(code, await cache_prix().aobtenir(code, generation)), etag)
+
+
+# ===================================
+#
+# scan par lot (resynchronisation des terminaux hors ligne)
+def lire_lot(request):
+    """
+    Lit et normalise les codes du corps {"codes": [...]} : renvoie (erreur, resultats,
+    normalises), où resultats contient déjà les codes invalides.
+    """
+    try:
+        codes = json.loads(request.body)['codes']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'erreur': 'Corps JSON attendu : {"codes": [...]}.'}, status=400), None, None
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return JsonResponse({'erreur': "codes doit être une liste de chaînes."}, status=400), None, None
+    if len(codes) > SCAN_LOT_MAX:
+        return JsonResponse({'erreur': f"Au plus {SCAN_LOT_MAX} codes par appel."}, status=400), None, None
+
+    resultats = {}
+    normalises = {}
+    for code in codes:
+        try:
+            normalises[code] = ean13.normaliser(code)
+        except ValueError as exc:
+            resultats[code] = {'erreur': str(exc)}
+    if resultats:
+        SCANS.inc(len(resultats), canal='lot', resultat='invalide')
+    return None, resultats, normalises
+
+
+def reponse_lot(resultats, normalises, trouves):
+    inconnus = 0
+    for code, normalise in normalises.items():
+        produit = trouves[normalise]
+        resultats[code] = produit_en_json(produit) if produit else None
+        inconnus += produit is None
+    if normalises:
+        SCANS.inc(len(normalises) - inconnus, canal='lot', resultat='trouve')
+        SCANS.inc(inconnus, canal='lot', resultat='inconnu')
+    return JsonResponse({'resultats': resultats})
+
+
+@csrf_exempt  # lecture seule : aucune modification possible via cette vue
+@require_POST
+@connexion_ou_jeton_requis
+def api_scan_lot(request):
+    """
+    Résout une liste de codes de 12 ou 13 chiffres : cache des prix, puis une seule
+    requête barcode__in pour les codes absents du cache.
+    Corps : {"codes": ["6015572891097", ...]}. Réponse : {"resultats": {code: produit}},
+    avec null pour un code inconnu et {"erreur": ...} pour un code invalide.
+    """
+    erreur, resultats, normalises = lire_lot(request)
+    if erreur:
+        return erreur
+    trouves = cache_prix().obtenir_plusieurs(list(set(normalises.values())))
+    return reponse_lot(resultats, normalises, trouves)
+
+
+@csrf_exempt  # lecture seule : aucune modification possible via cette vue
+@require_POST
+@connexion_ou_jeton_requis
+async def api_scan_lot_asynchrone(request):
+    """ Version asynchrone de api_scan_lot, routée à sa place sous ASGI. """
+    erreur, resultats, normalises = lire_lot(request)
+    if erreur:
+        return erreur
+    trouves = await cache_prix().aobtenir_plusieurs(list(set(normalises.values())))
+    return reponse_lot(resultats, normalises, trouves)
+
+
+# ===================================
+#
+# catalogue hors ligne
+@require_GET
+@connexion_ou_jeton_requis
+def api_catalogue(request):
+    """
+    Télécharge un instantané du catalogue (JSON gzip trié par code) :
+    le plus récent, ou ?version=N s'il est encore conservé.
+    """
+    version = request.GET.get('version')
+    if version:
+        instantane = InstantaneCatalogue.objects.filter(pk=version).first() if version.isdigit() else None
+        if instantane is None:
+            return JsonResponse({'erreur': f"Version {version} indisponible."}, status=404)
+        cache_control = 'private, max-age=31536000, immutable'
+    else:
+        instantane = catalogue.instantane_courant()
+        cache_control = 'private, no-cache'
+
+    etag = f'"catalogue-v{instantane.pk}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        reponse = HttpResponseNotModified()
+    else:
+        reponse = FileResponse(
+            instantane.fichier.open('rb'), content_type='application/gzip',
+            as_attachment=True, filename=f'catalogue-v{instantane.pk}.json.gz',
+        )
+    reponse['ETag'] = etag
+    reponse['Cache-Control'] = cache_control
+    reponse['X-Catalogue-Version'] = str(instantane.pk)
+    return reponse
+
+
+@lru_cache(maxsize=32)
+def delta_entre(depuis, vers):
+    """ Delta entre deux instantanés (immuables : le résultat peut être gardé en mémoire). """
+    anciens = InstantaneCatalogue.objects.get(pk=depuis)
+    nouveaux = InstantaneCatalogue.objects.get(pk=vers)
+    return catalogue.delta(catalogue.lire(anciens), catalogue.lire(nouveaux))
+
+
+@require_GET
+@connexion_ou_jeton_requis
+def api_catalogue_delta(request):
+    """
+    Changements depuis la version ?depuis=N d'un terminal : lignes ajoutées ou
+    modifiées et codes supprimés. Répond 410 si la version N n'est plus
+    conservée : le terminal doit alors retélécharger l'instantané complet.
+    """
+    depuis = request.GET.get('depuis', '')
+    if not depuis.isdigit():
+        return JsonResponse({'erreur': "Paramètre depuis=<version> attendu."}, status=400)
+    depuis = int(depuis)
+    courant = catalogue.instantane_courant()
+
+    if depuis == courant.pk:
+        modifies, supprimes = [], []
+    elif depuis > courant.pk or not InstantaneCatalogue.objects.filter(pk=depuis).exists():
+        return JsonResponse({'erreur': f"Version {depuis} indisponible.", 'version': courant.pk}, status=410)
+    else:
+        modifies, supprimes = delta_entre(depuis, courant.pk)
+
+    return JsonResponse({
+        'depuis': depuis,
+        'version': courant.pk,
+        'colonnes': catalogue.COLONNES,
+        'modifies': modifies,
+        'supprimes': supprimes,
+    })
+
+
+# ===================================
+#
+# flux des changements
+@require_GET
+@connexion_ou_jeton_requis
+def api_changements(request):
+    """
+    Changements depuis ?curseur=<curseur> (tout l'historique sans curseur) :
+    produits créés ou modifiés et suppressions, dans l'ordre. Le client rappelle
+    avec le curseur renvoyé tant que termine vaut false.
+    """
+    try:
+        curseur = changements.decoder_curseur(request.GET['curseur']) if request.GET.get('curseur') else None
+        limite = max(1, min(int(request.GET.get('limite', 500)), 5000))
+    except ValueError as exc:
+        return JsonResponse({'erreur': str(exc)}, status=400)
+
+    liste, suivant, termine = changements.changements_depuis(curseur, limite)
+    return JsonResponse({'changements': liste, 'curseur': suivant, 'termine': termine})
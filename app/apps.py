@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AppConfig(AppConfig):
     name = 'app'
+
+    def ready(self):
+        # Enregistre les récepteurs de signaux (index de recherche, caches)
+        from . import signals  # noqa: F401
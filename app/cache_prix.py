@@ -0,0 +1,232 @@
+"""
+Cache des prix pour le scan : code-barres (12 chiffres) -> (id, nom, prix, ean13).
+
+Deux implémentations, choisies par CACHE_PRIX_BACKEND :
+
+* 'local'  : LRU + TTL en mémoire, propre à chaque worker (par défaut) ;
+* 'django' : framework de cache Django (CACHE_PRIX_ALIAS), partageable entre
+  les workers gunicorn si ce cache l'est (Redis, Memcached, fichiers).
+
+Les codes inconnus sont aussi mis en cache (valeur None). Les entrées sont
+rattachées à la génération du catalogue (app.generation), partagée par tous
+les processus et changée après le COMMIT de toute modification : le cache
+'local' se vide dès qu'il lit une nouvelle génération, le cache 'django'
+change de clés. Un prix servi correspond donc toujours à une génération au
+moins aussi récente que celle de l'ETag de l'API de scan. Les signaux de
+Produit invalident en plus les codes modifiés dans le processus qui enregistre. Les compteurs
+de succès / échecs sont propres au processus. Les lectures existent aussi en
+version asynchrone (aobtenir, aobtenir_plusieurs) pour les vues ASGI.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .generation import ageneration_catalogue, generation_catalogue
+from .registre import CACHE_PRIX
+
+PrixProduit = namedtuple('PrixProduit', ['id', 'nom', 'prix', 'ean13'])
+
+_ABSENT = object()
+
+
+class CachePrix:
+    """ Logique commune : lecture groupée, chargement des absents en une requête. """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.succes = 0
+        self.echecs = 0
+        self._verrou_compteurs = threading.Lock()
+
+    def obtenir(self, code, generation=None):
+        """ Renvoie le PrixProduit du code, ou None s'il n'existe pas. """
+        return self.obtenir_plusieurs([code], generation)[code]
+
+    def obtenir_plusieurs(self, codes, generation=None):
+        """
+        Renvoie {code: PrixProduit | None} ; les absents sont lus en une seule requête.
+        generation : génération du catalogue déjà lue par l'appelant (ETag), relue sinon.
+        """
+        if generation is None:
+            generation = generation_catalogue()
+        resultats = self._lire(codes, generation)
+        manquants = self._compter(codes, resultats)
+        if manquants:
+            charges = dict.fromkeys(manquants)
+            charges.update(self.charger(manquants))
+            self._ecrire(charges, generation)
+            resultats.update(charges)
+        return resultats
+
+    async def aobtenir(self, code, generation=None):
+        return (await self.aobtenir_plusieurs([code], generation))[code]
+
+    async def aobtenir_plusieurs(self, codes, generation=None):
+        """ Version asynchrone de obtenir_plusieurs, pour les vues servies sous ASGI. """
+        if generation is None:
+            generation = await ageneration_catalogue()
+        resultats = await self._alire(codes, generation)
+        manquants = self._compter(codes, resultats)
+        if manquants:
+            charges = dict.fromkeys(manquants)
+            charges.update(await self.acharger(manquants))
+            await self._aecrire(charges, generation)
+            resultats.update(charges)
+        return resultats
+
+    def _compter(self, codes, resultats):
+        """ Met à jour les compteurs et renvoie les codes absents du cache. """
+        manquants = [code for code in codes if code not in resultats]
+        with self._verrou_compteurs:
+            self.succes += len(resultats)
+            self.echecs += len(manquants)
+        if resultats:
+            CACHE_PRIX.inc(len(resultats), resultat='succes')
+        if manquants:
+            CACHE_PRIX.inc(len(manquants), resultat='echec')
+        return manquants
+
+    def _lignes(self, codes):
+        from .models import Produit
+
+        return Produit.objects.filter(barcode__in=codes).values_list('barcode', 'id', 'nom', 'prix', 'ean13')
+
+    def charger(self, codes):
+        return {code: PrixProduit(*valeurs) for code, *valeurs in self._lignes(codes)}
+
+    async def acharger(self, codes):
+        return {code: PrixProduit(*valeurs) async for code, *valeurs in self._lignes(codes)}
+
+    def statistiques(self):
+        total = self.succes + self.echecs
+        return {
+            'succes': self.succes,
+            'echecs': self.echecs,
+            'taux_succes': round(self.succes / total, 4) if total else None,
+        }
+
+
+class CachePrixLocal(CachePrix):
+    """ LRU borné en nombre d'entrées, avec expiration (TTL), propre au processus. """
+
+    def __init__(self, taille, ttl):
+        super().__init__(ttl)
+        self.taille = taille
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        # Génération du catalogue des entrées présentes
+        self._generation = 0
+
+    def _lire(self, codes, generation):
+        maintenant = time.monotonic()
+        resultats = {}
+        with self._verrou:
+            if generation > self._generation:
+                # Le catalogue a changé, peut-être dans un autre processus : toutes les entrées sont périmées
+                self._entrees.clear()
+                self._generation = generation
+            for code in codes:
+                entree = self._entrees.get(code)
+                if entree is None:
+                    continue
+                expire_le, valeur = entree
+                if expire_le < maintenant:
+                    del self._entrees[code]
+                    continue
+                self._entrees.move_to_end(code)
+                resultats[code] = valeur
+        return resultats
+
+    def _ecrire(self, valeurs, generation):
+        expire_le = time.monotonic() + self.ttl
+        with self._verrou:
+            if generation != self._generation:
+                # Lu sous une génération dépassée entre-temps : la valeur peut être périmée
+                return
+            for code, valeur in valeurs.items():
+                self._entrees[code] = (expire_le, valeur)
+                self._entrees.move_to_end(code)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+
+    # Lecture et écriture en mémoire, sans attente : les versions asynchrones les appellent directement
+    async def _alire(self, codes, generation):
+        return self._lire(codes, generation)
+
+    async def _aecrire(self, valeurs, generation):
+        self._ecrire(valeurs, generation)
+
+    def invalider(self, *codes):
+        with self._verrou:
+            for code in codes:
+                self._entrees.pop(code, None)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+
+    def statistiques(self):
+        return {**super().statistiques(), 'backend': 'local', 'entrees': len(self._entrees), 'taille_max': self.taille}
+
+
+class CachePrixDjango(CachePrix):
+    """
+    Cache partagé via le framework de cache Django. La génération fait partie
+    des clés : les entrées des générations passées ne sont plus lues et
+    expirent d'elles-mêmes.
+    """
+
+    PREFIXE = 'app:prix:'
+
+    def __init__(self, alias, ttl):
+        super().__init__(ttl)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _prefixe(self, generation):
+        return f'{self.PREFIXE}{generation}:'
+
+    def _lire(self, codes, generation):
+        prefixe = self._prefixe(generation)
+        valeurs = self.cache.get_many([prefixe + code for code in codes])
+        return {cle[len(prefixe):]: valeur for cle, valeur in valeurs.items()}
+
+    def _ecrire(self, valeurs, generation):
+        prefixe = self._prefixe(generation)
+        self.cache.set_many({prefixe + code: valeur for code, valeur in valeurs.items()}, timeout=self.ttl)
+
+    async def _alire(self, codes, generation):
+        prefixe = self._prefixe(generation)
+        valeurs = await self.cache.aget_many([prefixe + code for code in codes])
+        return {cle[len(prefixe):]: valeur for cle, valeur in valeurs.items()}
+
+    async def _aecrire(self, valeurs, generation):
+        prefixe = self._prefixe(generation)
+        await self.cache.aset_many({prefixe + code: valeur for code, valeur in valeurs.items()}, timeout=self.ttl)
+
+    def invalider(self, *codes):
+        prefixe = self._prefixe(generation_catalogue())
+        self.cache.delete_many([prefixe + code for code in codes])
+
+    def statistiques(self):
+        return {**super().statistiques(), 'backend': 'django', 'alias': self.alias}
+
+
+_cache = None
+
+
+def cache_prix():
+    """ Cache de prix du processus, construit selon les réglages CACHE_PRIX_*. """
+    global _cache
+    if _cache is None:
+        if settings.CACHE_PRIX_BACKEND == 'django':
+            _cache = CachePrixDjango(settings.CACHE_PRIX_ALIAS, settings.CACHE_PRIX_TTL)
+        else:
+            _cache = CachePrixLocal(settings.CACHE_PRIX_TAILLE, settings.CACHE_PRIX_TTL)
+    return _cache
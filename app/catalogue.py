@@ -0,0 +1,130 @@
+"""
+Instantanés du catalogue pour la consultation des prix hors ligne.
+
+Un instantané est la liste [code EAN-13, nom, prix] de tous les produits,
+triée par code pour permettre une recherche dichotomique sur le terminal,
+sérialisée en JSON compact puis compressée en gzip. Chaque instantané est
+numéroté et immuable ; les CATALOGUE_VERSIONS_CONSERVEES derniers sont gardés
+pour calculer les deltas (produits ajoutés / modifiés et codes supprimés)
+entre la version d'un terminal et la version courante.
+"""
+import gzip
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .generation import generation_catalogue
+from .models import InstantaneCatalogue, Produit
+
+COLONNES = ['code', 'nom', 'prix']
+
+
+def lignes_catalogue():
+    """ [code EAN-13, nom, prix] de chaque produit, triées par code (index unique ean13). """
+    return [
+        [code, nom, str(prix)]
+        for code, nom, prix in Produit.objects.exclude(ean13=None)
+        .order_by('ean13').values_list('ean13', 'nom', 'prix').iterator(chunk_size=5000)
+    ]
+
+
+def serialiser(lignes):
+    return json.dumps(lignes, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def lire(instantane):
+    """ Renvoie les lignes d'un instantané. """
+    with instantane.fichier.open('rb') as fichier:
+        return json.loads(gzip.decompress(fichier.read())).get('produits')
+
+
+def a_verifier(instantane, generation):
+    """ Faut-il relire la base pour savoir si le catalogue a changé ? """
+    if instantane is None:
+        return True
+    anciennete = timezone.now() - instantane.verifie_le
+    if anciennete < timedelta(seconds=settings.CATALOGUE_INTERVALLE_MIN):
+        return False
+    # La génération n'est fiable que si le cache est partagé : vérification forcée au-delà d'un âge maximal
+    return generation != instantane.generation or anciennete > timedelta(seconds=settings.CATALOGUE_AGE_MAX)
+
+
+def instantane_courant():
+    """
+    Renvoie le dernier instantané, en en créant un nouveau si le catalogue a changé.
+    Les vérifications sont espacées d'au moins CATALOGUE_INTERVALLE_MIN secondes.
+    """
+    generation = generation_catalogue()
+    instantane = InstantaneCatalogue.objects.first()
+    if not a_verifier(instantane, generation):
+        return instantane
+
+    with transaction.atomic():
+        # Verrou sur la dernière version : les autres workers attendent la fin de
+        # la publication puis relisent. Sans verrou possible (table vide, SQLite),
+        # l'unicité de precedent refuse un second successeur de la même version.
+        instantane = InstantaneCatalogue.objects.select_for_update().first()
+        if not a_verifier(instantane, generation):
+            return instantane
+
+        lignes = lignes_catalogue()
+        empreinte = hashlib.sha256(serialiser(lignes)).hexdigest()
+        maintenant = timezone.now()
+        if instantane is not None and instantane.empreinte == empreinte:
+            InstantaneCatalogue.objects.filter(pk=instantane.pk).update(generation=generation, verifie_le=maintenant)
+            instantane.generation, instantane.verifie_le = generation, maintenant
+            return instantane
+
+        try:
+            with transaction.atomic():
+                instantane = InstantaneCatalogue.objects.create(
+                    empreinte=empreinte, nombre_produits=len(lignes),
+                    generation=generation, verifie_le=maintenant,
+                    precedent=instantane.pk if instantane is not None else 0,
+                )
+                document = {'version': instantane.pk, 'genere_le': maintenant.isoformat(),
+                            'colonnes': COLONNES, 'produits': lignes}
+                instantane.fichier.save(
+                    f'catalogue-v{instantane.pk}.json.gz',
+                    ContentFile(gzip.compress(serialiser(document), compresslevel=9)),
+                )
+        except IntegrityError:
+            # Un autre worker a publié cette version entre-temps
+            return InstantaneCatalogue.objects.first()
+    purger()
+    return instantane
+
+
+def purger():
+    """ Supprime les instantanés au-delà des CATALOGUE_VERSIONS_CONSERVEES derniers. """
+    anciens = InstantaneCatalogue.objects.all()[settings.CATALOGUE_VERSIONS_CONSERVEES:]
+    for instantane in anciens:
+        instantane.fichier.delete(save=False)
+        instantane.delete()
+
+
+def delta(anciennes, nouvelles):
+    """
+    Différence entre deux listes triées par code (fusion en un seul passage) :
+    renvoie (lignes ajoutées ou modifiées, codes supprimés).
+    """
+    modifies, supprimes = [], []
+    i = j = 0
+    while i < len(anciennes) or j < len(nouvelles):
+        if j == len(nouvelles) or (i < len(anciennes) and anciennes[i][0] < nouvelles[j][0]):
+            supprimes.append(anciennes[i][0])
+            i += 1
+        elif i == len(anciennes) or nouvelles[j][0] < anciennes[i][0]:
+            modifies.append(nouvelles[j])
+            j += 1
+        else:
+            if anciennes[i] != nouvelles[j]:
+                modifies.append(nouvelles[j])
+            i += 1
+            j += 1
+    return modifies, supprimes
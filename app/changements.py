@@ -0,0 +1,89 @@
+"""
+Flux des changements du catalogue (produits modifiés et supprimés).
+
+Les produits créés ou modifiés sont repérés par date_modification, les
+suppressions par les pierres tombales ProduitSupprime. Les deux flux sont
+fusionnés dans l'ordre (date, type, id) et parcourus par clé à l'aide d'un
+curseur opaque. Les changements des CHANGEMENTS_MARGE dernières secondes ne
+sont pas encore servis : une transaction plus ancienne mais validée plus tard
+ne peut donc pas être sautée par un curseur déjà avancé.
+"""
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import Produit, ProduitSupprime
+
+MODIFIE = 0
+SUPPRIME = 1
+
+
+def encoder_curseur(date, genre, identifiant):
+    return urlsafe_base64_encode(json.dumps([date.isoformat(), genre, identifiant]).encode())
+
+
+def decoder_curseur(curseur):
+    """ Renvoie (date, genre, id) ; lève ValueError si le curseur est invalide. """
+    try:
+        date, genre, identifiant = json.loads(urlsafe_base64_decode(curseur))
+        date = datetime.fromisoformat(date)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Curseur invalide.") from exc
+    # Un curseur forgé : date sans fuseau (comparée dans le mauvais fuseau), Infinity, entiers hors colonne
+    if (timezone.is_naive(date) or type(genre) is not int or genre not in (MODIFIE, SUPPRIME)
+            or type(identifiant) is not int or not 0 <= identifiant < 2 ** 63):
+        raise ValueError("Curseur invalide.")
+    return date, genre, identifiant
+
+
+def apres(champ_date, genre_flux, curseur):
+    """ Condition « (date, genre_flux, id) > curseur » pour l'un des deux flux. """
+    date, genre, identifiant = curseur
+    condition = Q(**{f'{champ_date}__gt': date})
+    if genre < genre_flux:
+        condition |= Q(**{champ_date: date})
+    elif genre == genre_flux:
+        condition |= Q(**{champ_date: date, 'id__gt': identifiant})
+    return condition
+
+
+def changements_depuis(curseur=None, limite=500):
+    """
+    Renvoie (changements, curseur suivant, termine) ; curseur vaut None pour
+    parcourir tout l'historique disponible.
+    """
+    borne = timezone.now() - timedelta(seconds=settings.CHANGEMENTS_MARGE)
+    produits = Produit.objects.filter(date_modification__lte=borne)
+    supprimes = ProduitSupprime.objects.filter(date_suppression__lte=borne)
+    if curseur is not None:
+        produits = produits.filter(apres('date_modification', MODIFIE, curseur))
+        supprimes = supprimes.filter(apres('date_suppression', SUPPRIME, curseur))
+
+    elements = [
+        ((p.date_modification, MODIFIE, p.id), {
+            'type': 'modifie', 'id': p.id, 'nom': p.nom, 'prix': str(p.prix),
+            'code': p.ean13, 'date': p.date_modification,
+        })
+        for p in produits.order_by('date_modification', 'id')
+        .only('id', 'nom', 'prix', 'ean13', 'date_modification')[:limite + 1]
+    ] + [
+        ((s.date_suppression, SUPPRIME, s.id), {
+            'type': 'supprime', 'id': s.produit_id, 'code': s.ean13, 'date': s.date_suppression,
+        })
+        for s in supprimes.order_by('date_suppression', 'id')[:limite + 1]
+    ]
+    elements.sort(key=lambda element: element[0])
+
+    termine = len(elements) <= limite
+    elements = elements[:limite]
+    if elements:
+        suivant = encoder_curseur(*elements[-1][0])
+    elif curseur is not None:
+        suivant = encoder_curseur(*curseur)
+    else:
+        suivant = None
+    return [changement for _, changement in elements], suivant, termine
@@ -0,0 +1,113 @@
+"""
+Allocation des 12 chiffres de données des codes-barres, choisie par
+BARCODE_ALLOCATEUR :
+
+* 'aleatoire'  : chiffres tirés au hasard (par défaut). Une collision avec un
+  code existant est interceptée par save() qui tire un autre code ;
+* 'sequentiel' : préfixe d'entreprise GS1 (BARCODE_PREFIXE_GS1) suivi d'une
+  référence d'article croissante. Chaque processus réserve un bloc de
+  BARCODE_TAILLE_BLOC références dans la table CompteurCodeBarre, en une
+  transaction : les créateurs concurrents ne reçoivent jamais le même code,
+  et un bloc ne coûte que deux requêtes quel que soit le nombre de codes.
+  Les codes croissants s'ajoutent en fin d'index au lieu de s'y disperser.
+
+Un bloc réservé dans une transaction englobante est annulé avec elle : seuls
+les codes demandés sont alors réservés, rien n'est gardé pour la suite.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.crypto import get_random_string
+
+LONGUEUR = 12
+
+
+class AllocateurAleatoire:
+
+    def code(self):
+        return get_random_string(length=LONGUEUR, allowed_chars='0123456789')
+
+    def codes(self, nombre):
+        """
+        nombre codes libres. Chaque passage vérifie tout le lot en une seule
+        requête barcode__in, au lieu d'un exists() par code.
+        """
+        from .models import Produit
+
+        codes = set()
+        while len(codes) < nombre:
+            candidats = {self.code() for _ in range(nombre - len(codes))} - codes
+            pris = set(Produit.objects.filter(barcode__in=candidats).values_list('barcode', flat=True))
+            codes |= candidats - pris
+        return list(codes)
+
+
+class AllocateurSequentiel:
+
+    def __init__(self, prefixe, taille_bloc):
+        if not (prefixe.isdigit() and 1 <= len(prefixe) < LONGUEUR):
+            raise ImproperlyConfigured(
+                f"BARCODE_PREFIXE_GS1 doit compter de 1 à {LONGUEUR - 1} chiffres (reçu : {prefixe!r})."
+            )
+        self.prefixe = prefixe
+        self.taille_bloc = max(1, taille_bloc)
+        self.capacite = 10 ** (LONGUEUR - len(prefixe))
+        self._verrou = threading.Lock()
+        self._bloc = range(0)
+        self._pid = os.getpid()
+
+    def _formater(self, numero):
+        return f'{self.prefixe}{numero:0{LONGUEUR - len(self.prefixe)}d}'
+
+    def _reserver(self, nombre):
+        """ Réserve au moins nombre références ; renvoie celles qui ne sont pas gardées dans le bloc. """
+        from .models import CompteurCodeBarre
+
+        if self._pid != os.getpid():
+            # Bloc hérité du maître gunicorn (preload_app) : il serait distribué par chaque worker
+            self._pid = os.getpid()
+            self._bloc = range(0)
+
+        pris = list(self._bloc[:nombre])
+        self._bloc = self._bloc[nombre:]
+        manque = nombre - len(pris)
+        if manque:
+            # Dans une transaction englobante, une annulation rendrait le bloc gardé à un autre processus
+            garder = 0 if transaction.get_connection().in_atomic_block else self.taille_bloc
+            debut, fin = CompteurCodeBarre.reserver(self.prefixe, manque + garder, self.capacite)
+            nouveaux = range(debut, fin)
+            pris.extend(nouveaux[:manque])
+            self._bloc = nouveaux[manque:]
+        return pris
+
+    def code(self):
+        with self._verrou:
+            return self._formater(self._reserver(1)[0])
+
+    def codes(self, nombre):
+        with self._verrou:
+            return [self._formater(numero) for numero in self._reserver(nombre)]
+
+
+_allocateur = None
+_reglages = None
+
+
+def allocateur():
+    """ Allocateur du processus, reconstruit si les réglages BARCODE_* changent. """
+    global _allocateur, _reglages
+    reglages = (settings.BARCODE_ALLOCATEUR, settings.BARCODE_PREFIXE_GS1, settings.BARCODE_TAILLE_BLOC)
+    if reglages != _reglages:
+        if settings.BARCODE_ALLOCATEUR == 'sequentiel':
+            _allocateur = AllocateurSequentiel(settings.BARCODE_PREFIXE_GS1, settings.BARCODE_TAILLE_BLOC)
+        elif settings.BARCODE_ALLOCATEUR == 'aleatoire':
+            _allocateur = AllocateurAleatoire()
+        else:
+            raise ImproperlyConfigured(
+                f"BARCODE_ALLOCATEUR inconnu : {settings.BARCODE_ALLOCATEUR!r} ('aleatoire' ou 'sequentiel')."
+            )
+        _reglages = reglages
+    return _allocateur
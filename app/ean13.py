@@ -0,0 +1,106 @@
+"""
+Utilitaires EAN-13 en arithmétique pure.
+
+Le calcul du chiffre de contrôle ne construit aucun objet python-barcode :
+il travaille directement sur les codes des caractères, ce qui le rend
+utilisable dans les chemins chauds (scan, __str__, listes, admin).
+"""
+
+LONGUEUR_DONNEES = 12
+LONGUEUR_COMPLETE = 13
+
+# ord('0') * (6 positions de poids 1 + 6 positions de poids 3)
+_DECALAGE_ASCII = 48 * 24
+
+
+def est_numerique(code):
+    """ Vrai si code ne contient que des chiffres ASCII (0-9). """
+    return code.isascii() and code.isdigit()
+
+
+def calculer_checksum(code):
+    """
+    Renvoie le chiffre de contrôle (0-9) des 12 premiers chiffres de code.
+
+    Aucune validation n'est faite ici : l'appelant garantit 12 chiffres au moins.
+    """
+    o = ord
+    total = (
+        o(code[0]) + o(code[2]) + o(code[4]) + o(code[6]) + o(code[8]) + o(code[10])
+        + 3 * (o(code[1]) + o(code[3]) + o(code[5]) + o(code[7]) + o(code[9]) + o(code[11]))
+        - _DECALAGE_ASCII
+    )
+    return -total % 10
+
+
+def code_complet(code):
+    """ Renvoie le code EAN-13 complet (12 chiffres de données + checksum). """
+    return code + '0123456789'[calculer_checksum(code)]
+
+
+def est_valide(code):
+    """ Vrai si code est un EAN-13 complet dont le chiffre de contrôle est correct. """
+    return (
+        len(code) == LONGUEUR_COMPLETE
+        and est_numerique(code)
+        and ord(code[12]) - 48 == calculer_checksum(code)
+    )
+
+
+def normaliser(code):
+    """
+    Nettoie une saisie (scan ou clavier) et renvoie les 12 chiffres de données.
+
+    Accepte 12 chiffres, ou 13 chiffres avec un checksum correct.
+    Lève ValueError pour toute autre saisie.
+    """
+    code = code.strip().replace(' ', '')
+    if not est_numerique(code):
+        raise ValueError(f"Le code-barres doit être numérique : {code!r}")
+    if len(code) == LONGUEUR_DONNEES:
+        return code
+    if len(code) == LONGUEUR_COMPLETE:
+        if ord(code[12]) - 48 != calculer_checksum(code):
+            raise ValueError(f"Chiffre de contrôle EAN-13 invalide : {code}")
+        return code[:LONGUEUR_DONNEES]
+    raise ValueError(f"Le code-barres doit contenir 12 ou 13 chiffres : {code}")
+
+
+# Codage des chiffres (jeux L et R ; G est R inversé) et parité du premier chiffre
+_CODES_L = ('0001101', '0011001', '0010011', '0111101', '0100011',
+            '0110001', '0101111', '0111011', '0110111', '0001011')
+_CODES_R = tuple(code.translate(str.maketrans('01', '10')) for code in _CODES_L)
+_CODES_G = tuple(code[::-1] for code in _CODES_R)
+_PARITES = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+            'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+
+def motif(code):
+    """
+    Renvoie les 95 modules ('1' = barre, '0' = espace) du code EAN-13
+    correspondant aux 12 chiffres de données code.
+    """
+    complet = code_complet(code)
+    parite = _PARITES[ord(complet[0]) - 48]
+    gauche = ''.join(
+        (_CODES_L if p == 'L' else _CODES_G)[ord(c) - 48]
+        for p, c in zip(parite, complet[1:7])
+    )
+    droite = ''.join(_CODES_R[ord(c) - 48] for c in complet[7:])
+    return '101' + gauche + '01010' + droite + '101'
+
+
+def barres(code):
+    """
+    Barres du code EAN-13 sous forme de (debut, largeur) en modules : les
+    modules pleins contigus sont fusionnés en une seule barre.
+    """
+    resultat = []
+    debut = None
+    for i, module_plein in enumerate(motif(code) + '0'):
+        if module_plein == '1' and debut is None:
+            debut = i
+        elif module_plein == '0' and debut is not None:
+            resultat.append((debut, i - debut))
+            debut = None
+    return resultat
@@ -0,0 +1,44 @@
+"""
+Génération du catalogue : compteur incrémenté à chaque modification de produit.
+
+Il est conservé dans le cache Django (CACHES['default']) afin que les ETag de
+l'API de scan soient vérifiés sans aucune requête SQL. Ce cache est partagé
+entre les processus (fichiers par défaut, voir conf/settings.py) pour que
+tous les workers voient la même génération.
+"""
+import time
+
+from django.core.cache import cache
+
+CLE_GENERATION = 'app:catalogue:generation'
+
+
+def generation_catalogue():
+    """ Renvoie la génération courante (initialisée si le cache est vide). """
+    generation = cache.get(CLE_GENERATION)
+    if generation is None:
+        # Valeur de départ horodatée : un cache vidé ne réutilise pas d'anciens ETag
+        cache.add(CLE_GENERATION, time.time_ns())
+        generation = cache.get(CLE_GENERATION)
+    return generation
+
+
+async def ageneration_catalogue():
+    """ Version asynchrone de generation_catalogue (vues ASGI). """
+    generation = await cache.aget(CLE_GENERATION)
+    if generation is None:
+        await cache.aadd(CLE_GENERATION, time.time_ns())
+        generation = await cache.aget(CLE_GENERATION)
+    return generation
+
+
+def incrementer_generation():
+    """
+    À appeler après toute modification du catalogue. La nouvelle valeur est
+    horodatée plutôt qu'incrémentée : le cache par fichiers n'a pas d'incr
+    atomique, et deux workers qui écrivent en même temps obtiennent tout de
+    même une valeur différente de toutes celles déjà servies.
+    """
+    generation = max(time.time_ns(), (cache.get(CLE_GENERATION) or 0) + 1)
+    cache.set(CLE_GENERATION, generation)
+    return generation
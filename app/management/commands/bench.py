@@ -0,0 +1,209 @@
+"""
+Benchmarks reproductibles du catalogue et du scan.
+
+    python manage.py bench [--tailles 1000 100000 1000000] [--sortie bench.json]
+    python manage.py bench --tailles 1000 --reference bench.json [--tolerance 0.25]
+
+Les mesures tournent sur une base de test créée pour l'occasion (comme
+manage.py test) : les données réelles ne sont jamais touchées. Le catalogue
+synthétique est généré avec une graine fixe et agrandi d'une taille à la
+suivante. Pour chaque taille :
+
+* scan_12 / scan_13 : page de scan, cache des prix vidé (lecture indexée) ;
+* creation : Produit.objects.create (rendu d'image confié à la file) ;
+* liste_debut / liste_milieu : page de liste, au début et au milieu du catalogue ;
+* rendu_png / rendu_svg : image d'un code-barres ;
+* planche_pdf : planche PDF de 44 étiquettes.
+
+Chaque mesure donne p50 / p95 en millisecondes. Avec --reference, une mesure
+dont le p50 dépasse celui de la référence de plus de --tolerance est signalée
+comme régression et la commande échoue.
+"""
+import json
+import platform
+import random
+import time
+from datetime import datetime, timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.test.runner import DiscoverRunner
+
+from app import ean13
+from app.cache_prix import cache_prix
+from app.models import Produit
+from app.metriques import centiles
+from app.rendu import rendre_png, rendre_svg
+from app.views import encoder_curseur
+
+GRAINE = 20240601
+LOT_INSERTION = 5000
+MOTS = ['popcorn', 'savon', 'riz', 'sucre', 'huile', 'lait', 'farine', 'sel', 'biscuit',
+        'jus', 'eau', 'cafe', 'chargeur', 'cable', 'caramel', 'bleu', 'sachet', 'boite']
+
+
+class Command(BaseCommand):
+    help = "Mesure les performances du scan, de la création, de la liste et des étiquettes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tailles', type=int, nargs='+', default=[1000, 100000, 1000000],
+                            help="Tailles de catalogue mesurées (défaut : 1000 100000 1000000).")
+        parser.add_argument('--repetitions', type=int, default=200,
+                            help="Nombre de mesures par opération (défaut : 200).")
+        parser.add_argument('--sortie', help="Fichier JSON des résultats.")
+        parser.add_argument('--reference', help="Résultats JSON de référence à comparer.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Hausse relative du p50 tolérée avant régression (défaut : 0.25).")
+
+    def handle(self, *args, **options):
+        reference = self.lire_reference(options['reference']) if options['reference'] else None
+        self.repetitions = options['repetitions']
+        self.aleatoire = random.Random(GRAINE)
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        anciennes_bases = runner.setup_databases()
+        try:
+            # Pas de rendu PNG dans save() : la création mesurée est celle de l'enregistrement
+            with override_settings(BARCODE_RENDU_ASYNCHRONE=True):
+                resultats = self.mesurer_tailles(sorted(set(options['tailles'])))
+        finally:
+            runner.teardown_databases(anciennes_bases)
+            teardown_test_environment()
+
+        document = {
+            'meta': {
+                'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'base': connection.vendor,
+                'machine': platform.machine(),
+                'repetitions': self.repetitions,
+            },
+            'resultats': resultats,
+        }
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(document, fichier, indent=2)
+            self.stdout.write(f"Résultats écrits dans {options['sortie']}.")
+        if reference is not None:
+            self.comparer(reference, resultats, options['tolerance'])
+
+    def lire_reference(self, chemin):
+        try:
+            with open(chemin, encoding='utf-8') as fichier:
+                return json.load(fichier)['resultats']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Référence illisible ({chemin}) : {exc}")
+
+    # --- catalogue synthétique ---
+    def agrandir(self, taille):
+        """ Complète le catalogue jusqu'à taille produits (codes et noms tirés avec la graine fixe). """
+        existants = Produit.objects.count()
+        codes_pris = set(Produit.objects.values_list('barcode', flat=True))
+        debut = time.perf_counter()
+        while existants < taille:
+            nombre = min(LOT_INSERTION, taille - existants)
+            codes = []
+            while len(codes) < nombre:
+                code = f'{self.aleatoire.randrange(10 ** 11, 10 ** 12)}'
+                if code not in codes_pris:
+                    codes_pris.add(code)
+                    codes.append(code)
+            produits = []
+            for code in codes:
+                produit = Produit(
+                    nom=' '.join(self.aleatoire.choices(MOTS, k=self.aleatoire.randint(1, 3)))
+                    + f' {self.aleatoire.randint(1, 999)}g',
+                    prix=self.aleatoire.randint(50, 50000) / 100,
+                    barcode=code,
+                    ean13=ean13.code_complet(code),
+                )
+                produit.barcode_image.name = produit.chemin_image()
+                produits.append(produit)
+            Produit.objects.bulk_create(produits)
+            existants += nombre
+        self.stdout.write(f"Catalogue de {taille} produits prêt ({time.perf_counter() - debut:.1f} s).")
+
+    # --- mesures ---
+    def chronometrer(self, operation, preparations=None):
+        """ p50 / p95 (ms) de repetitions appels à operation(preparation). """
+        preparations = preparations or [None] * self.repetitions
+        operation(preparations[0])  # préchauffage
+        durees = []
+        for preparation in preparations:
+            debut = time.perf_counter()
+            operation(preparation)
+            durees.append(time.perf_counter() - debut)
+        resultat = centiles(durees)
+        return {
+            'p50_ms': round(resultat['p50'] * 1000, 3),
+            'p95_ms': round(resultat['p95'] * 1000, 3),
+            'n': len(durees),
+        }
+
+    def mesurer_tailles(self, tailles):
+        client = Client()
+        client.force_login(User.objects.create_user('bench', password=None))
+        resultats = {}
+        for taille in tailles:
+            self.agrandir(taille)
+            resultats[str(taille)] = mesures = {}
+            echantillon = list(
+                Produit.objects.order_by('?').values_list('barcode', flat=True)[:self.repetitions]
+            ) if taille <= 100000 else self.echantillon_indexe()
+
+            def scanner(code):
+                cache_prix().vider()
+                reponse = client.get('/scan/', {'code_barre': code})
+                assert reponse.status_code == 200, reponse.status_code
+
+            mesures['scan_12'] = self.chronometrer(scanner, echantillon)
+            mesures['scan_13'] = self.chronometrer(scanner, [ean13.code_complet(code) for code in echantillon])
+            mesures['creation'] = self.chronometrer(
+                lambda _: Produit.objects.create(nom='Produit bench', prix='1.00'))
+
+            milieu = Produit.objects.order_by('nom', 'id')[taille // 2]
+            mesures['liste_debut'] = self.chronometrer(lambda _: client.get('/produits/'))
+            mesures['liste_milieu'] = self.chronometrer(
+                lambda _: client.get('/produits/', {'apres': encoder_curseur(milieu)}))
+
+            mesures['rendu_png'] = self.chronometrer(rendre_png, echantillon)
+            mesures['rendu_svg'] = self.chronometrer(rendre_svg, echantillon)
+            ids = ','.join(str(pk) for pk in Produit.objects.values_list('id', flat=True)[:44])
+            mesures['planche_pdf'] = self.chronometrer(lambda _: b''.join(
+                client.get('/produits/imprimer/', {'ids': ids, 'format': 'pdf'}).streaming_content))
+
+            for nom, mesure in mesures.items():
+                self.stdout.write(f"{taille:>8} {nom:14} p50 {mesure['p50_ms']:9.3f} ms   p95 {mesure['p95_ms']:9.3f} ms")
+        return resultats
+
+    def echantillon_indexe(self):
+        """ Codes tirés par identifiant : ORDER BY RANDOM() parcourrait toute une grande table. """
+        plus_grand = Produit.objects.order_by('-id').values_list('id', flat=True).first()
+        ids = [self.aleatoire.randint(1, plus_grand) for _ in range(self.repetitions * 2)]
+        codes = list(Produit.objects.filter(pk__in=ids).values_list('barcode', flat=True))
+        return (codes * 2)[:self.repetitions]
+
+    # --- comparaison ---
+    def comparer(self, reference, resultats, tolerance):
+        regressions = []
+        for taille, mesures in resultats.items():
+            for nom, mesure in mesures.items():
+                attendu = reference.get(taille, {}).get(nom)
+                if not attendu:
+                    continue
+                ecart = mesure['p50_ms'] / attendu['p50_ms'] - 1 if attendu['p50_ms'] else 0
+                ligne = f"{taille:>8} {nom:14} {attendu['p50_ms']:9.3f} -> {mesure['p50_ms']:9.3f} ms ({ecart:+.0%})"
+                if ecart > tolerance:
+                    regressions.append(ligne)
+                    self.stdout.write(self.style.ERROR(ligne + "  RÉGRESSION"))
+                else:
+                    self.stdout.write(ligne)
+        if regressions:
+            raise CommandError(f"{len(regressions)} régression(s) au-delà de {tolerance:.0%}.")
+        self.stdout.write(self.style.SUCCESS("Aucune régression par rapport à la référence."))
@@ -0,0 +1,77 @@
+"""
+Conversion des images de codes-barres déjà enregistrées vers un autre format.
+
+    python manage.py convertir_codes_barres [--format svg] [--lot 500] [--supprimer-anciens]
+
+Les produits dont l'image n'est pas au format demandé (BARCODE_FORMAT par
+défaut) sont parcourus par lots, dans l'ordre des identifiants. Chaque image
+est rendue à nouveau depuis les chiffres du code, écrite à son adresse
+(app.stockage_images), puis les chemins du lot sont mis à jour en une seule
+requête. Les anciens fichiers restent en place, à la charge de
+nettoyer_codes_barres, sauf avec --supprimer-anciens.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from app import stockage_images
+from app.models import Produit
+from app.rendu import RENDUS
+
+
+class Command(BaseCommand):
+    help = "Convertit les images de codes-barres enregistrées (PNG <-> SVG)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(RENDUS), default=None,
+                            help="Format cible (défaut : BARCODE_FORMAT).")
+        parser.add_argument('--lot', type=int, default=500,
+                            help="Nombre de produits convertis par lot (défaut : 500).")
+        parser.add_argument('--supprimer-anciens', action='store_true',
+                            help="Supprimer les anciens fichiers une fois les chemins mis à jour.")
+
+    def handle(self, *args, **options):
+        format_cible = options['format'] or settings.BARCODE_FORMAT
+        rendre = RENDUS[format_cible]
+        storage = Produit._meta.get_field('barcode_image').storage
+        a_convertir = (
+            Produit.objects.filter(barcode__isnull=False)
+            .exclude(barcode_image='').exclude(barcode_image__isnull=True)
+            .exclude(barcode_image__endswith=f'.{format_cible}')
+            .only('id', 'barcode', 'barcode_image')
+            .order_by('id')
+        )
+
+        convertis, octets_avant, octets_apres = 0, 0, 0
+        dernier = 0
+        while True:
+            # Pagination par clé : les produits convertis sortent du filtre, l'identifiant avance quand même
+            lot = list(a_convertir.filter(id__gt=dernier)[:options['lot']])
+            if not lot:
+                break
+            dernier = lot[-1].id
+
+            anciens = []
+            for produit in lot:
+                ancien = produit.barcode_image.name
+                if storage.exists(ancien):
+                    octets_avant += storage.size(ancien)
+                    anciens.append(ancien)
+                contenu = rendre(produit.barcode)
+                produit.barcode_image.name = produit.barcode_image.field.generate_filename(
+                    produit, stockage_images.adresse(produit.barcode, format_cible)
+                )
+                stockage_images.enregistrer(storage, produit.barcode_image.name, contenu)
+                octets_apres += len(contenu)
+
+            Produit.objects.bulk_update(lot, ['barcode_image'])
+            if options['supprimer_anciens']:
+                for ancien in anciens:
+                    storage.delete(ancien)
+            convertis += len(lot)
+            self.stdout.write(f"{convertis} image(s) converties en {format_cible}...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{convertis} image(s) converties en {format_cible} : "
+            f"{filesizeformat(octets_avant)} -> {filesizeformat(octets_apres)}."
+        ))
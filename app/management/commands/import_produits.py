@@ -0,0 +1,198 @@
+"""
+Import en masse de produits depuis un fichier CSV ou JSON lines.
+
+    python manage.py import_produits catalogue.csv [--lot 1000] [--processus 4]
+    python manage.py import_produits - --format jsonl < catalogue.jsonl
+
+Colonnes / clés attendues : nom, prix et, en option, barcode (12 ou 13 chiffres
+fournis par le fournisseur). Les lignes invalides sont signalées sans
+interrompre l'import. Les codes manquants sont alloués par lots, les produits
+insérés avec bulk_create et les images rendues dans des processus parallèles.
+"""
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from app import ean13
+from app.forms import ProduitForm
+from app.generation import incrementer_generation
+from app.models import Produit, RenduCodeBarre
+from app.registre import registre
+from app.rendu import RENDUS
+
+
+class Command(BaseCommand):
+    help = "Importe des produits en masse depuis un fichier CSV ou JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Chemin du fichier, ou - pour l'entrée standard.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Format du fichier (déduit de l'extension par défaut).")
+        parser.add_argument('--delimiteur', default=',', help="Délimiteur CSV (défaut : ,).")
+        parser.add_argument('--lot', type=int, default=1000,
+                            help="Nombre de lignes insérées par bulk_create (défaut : 1000).")
+        parser.add_argument('--rendu', choices=['processus', 'file', 'aucun'], default='processus',
+                            help="processus : rendu immédiat en parallèle ; file : travaux pour "
+                                 "rendre_codes_barres ; aucun : pas d'image.")
+        parser.add_argument('--processus', type=int, default=os.cpu_count() or 1,
+                            help="Nombre de processus de rendu (défaut : nombre de CPU).")
+
+    def handle(self, *args, **options):
+        format_fichier = options['format'] or self.deduire_format(options['fichier'])
+        self.rendu = options['rendu']
+        self.inseres = 0
+        self.echecs = 0
+        debut = time.perf_counter()
+
+        pool = ProcessPoolExecutor(max_workers=options['processus']) if self.rendu == 'processus' else None
+        fichier = sys.stdin if options['fichier'] == '-' else open(options['fichier'], encoding='utf-8-sig', newline='')
+        try:
+            lignes = self.lire(fichier, format_fichier, options['delimiteur'])
+            en_cours = None
+            while True:
+                lot = list(islice(lignes, options['lot']))
+                if not lot:
+                    break
+                produits = self.inserer_lot(lot)
+                # Le rendu du lot précédent se termine pendant l'insertion du suivant
+                precedent, en_cours = en_cours, self.lancer_rendu(pool, produits)
+                self.ecrire_images(precedent)
+                duree = time.perf_counter() - debut
+                self.stdout.write(f"{self.inseres} produit(s) insérés, {self.echecs} rejet(s) "
+                                  f"- {self.inseres / duree:.0f} lignes/s")
+            self.ecrire_images(en_cours)
+        finally:
+            if fichier is not sys.stdin:
+                fichier.close()
+            if pool is not None:
+                pool.shutdown()
+            # Compteurs et durées de rendu de la commande, lus ensuite par /metrics
+            registre.archiver()
+
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"Import terminé : {self.inseres} produit(s) en {duree:.1f} s "
+            f"({self.inseres / duree if duree else 0:.0f} lignes/s), {self.echecs} ligne(s) rejetée(s)."
+        ))
+
+    def deduire_format(self, chemin):
+        if chemin.endswith(('.jsonl', '.ndjson', '.json')):
+            return 'jsonl'
+        if chemin.endswith('.csv'):
+            return 'csv'
+        raise CommandError("Impossible de deviner le format : utilisez --format csv|jsonl.")
+
+    def lire(self, fichier, format_fichier, delimiteur):
+        """ Produit des couples (numéro de ligne, dictionnaire) sans charger le fichier. """
+        if format_fichier == 'csv':
+            for numero, ligne in enumerate(csv.DictReader(fichier, delimiter=delimiteur), start=2):
+                yield numero, ligne
+            return
+        for numero, texte in enumerate(fichier, start=1):
+            if not texte.strip():
+                continue
+            try:
+                yield numero, json.loads(texte)
+            except ValueError as exc:
+                yield numero, exc
+
+    def rejeter(self, numero, raison):
+        self.echecs += 1
+        self.stderr.write(f"Ligne {numero} rejetée : {raison}")
+
+    def valider(self, lot):
+        """ Valide chaque ligne avec ProduitForm ; renvoie [(numéro, produit non sauvegardé)]. """
+        valides = []
+        for numero, donnees in lot:
+            if not isinstance(donnees, dict):
+                self.rejeter(numero, f"JSON invalide ({donnees})")
+                continue
+            form = ProduitForm(data=donnees)
+            if not form.is_valid():
+                erreurs = '; '.join(f"{champ}: {' '.join(msgs)}" for champ, msgs in form.errors.items())
+                self.rejeter(numero, erreurs)
+                continue
+            produit = form.save(commit=False)
+            # Un code numérique en JSON (sans guillemets) est accepté comme une chaîne
+            code = str(donnees.get('barcode') or '').strip()
+            if code:
+                try:
+                    produit.barcode = ean13.normaliser(code)
+                except ValueError as exc:
+                    self.rejeter(numero, exc)
+                    continue
+            valides.append((numero, produit))
+        return valides
+
+    def exclure_codes_fournis_existants(self, valides):
+        """ Rejette les lignes dont le code fourni existe déjà (en base ou plus haut dans le lot). """
+        fournis = {produit.barcode for _, produit in valides if produit.barcode}
+        if not fournis:
+            return valides
+        vus = set(Produit.objects.filter(barcode__in=fournis).values_list('barcode', flat=True))
+        conserves = []
+        for numero, produit in valides:
+            if produit.barcode:
+                if produit.barcode in vus:
+                    self.rejeter(numero, f"code-barres déjà utilisé : {produit.barcode}")
+                    continue
+                vus.add(produit.barcode)
+            conserves.append((numero, produit))
+        return conserves
+
+    def inserer_lot(self, lot):
+        valides = self.exclure_codes_fournis_existants(self.valider(lot))
+        produits = [produit for _, produit in valides]
+        generes = [produit for produit in produits if not produit.barcode]
+
+        for tentative in range(1, Produit.MAX_TENTATIVES_BARCODE + 1):
+            for produit, code in zip(generes, Produit.allouer_codes_barres(len(generes))):
+                produit.barcode = code
+            for produit in produits:
+                produit.ean13 = produit.get_full_barcode()
+                # Sans rendu, l'image reste vide : un save() ultérieur la mettra en file
+                if self.rendu != 'aucun':
+                    produit.barcode_image.name = produit.chemin_image()
+            try:
+                with transaction.atomic():
+                    Produit.objects.bulk_create(produits)
+                    if self.rendu == 'file':
+                        RenduCodeBarre.objects.bulk_create(
+                            [RenduCodeBarre(produit=produit) for produit in produits]
+                        )
+                break
+            except IntegrityError:
+                # Un autre créateur a pris un code entre l'allocation et l'insertion
+                if tentative == Produit.MAX_TENTATIVES_BARCODE:
+                    raise
+                for produit in produits:
+                    produit.pk = None
+
+        # bulk_create n'envoie pas post_save : la génération est changée ici, après le COMMIT.
+        # Les workers web y périment leur cache des prix et rattrapent leur index des noms
+        # (date_modification) ; les caches de cette commande disparaissent avec elle.
+        if produits:
+            incrementer_generation()
+        self.inseres += len(produits)
+        return produits
+
+    def lancer_rendu(self, pool, produits):
+        """ Soumet le rendu du lot sans attendre : pool.map renvoie un itérateur paresseux. """
+        if pool is None or not produits:
+            return None
+        return produits, pool.map(RENDUS[settings.BARCODE_FORMAT], [produit.barcode for produit in produits], chunksize=64)
+
+    def ecrire_images(self, en_cours):
+        if en_cours is None:
+            return
+        produits, rendus = en_cours
+        for produit, contenu in zip(produits, rendus):
+            produit.ecrire_image(contenu)
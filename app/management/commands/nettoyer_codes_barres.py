@@ -0,0 +1,64 @@
+"""
+Suppression des images de codes-barres orphelines.
+
+    python manage.py nettoyer_codes_barres [--age-min 3600] [--simulation]
+
+Relève d'abord les références (colonne Produit.barcode_image), puis parcourt
+le dossier des images dans le stockage. Un fichier non référencé et plus
+ancien que --age-min est supprimé : le délai protège les images écrites juste
+avant l'enregistrement de leur produit. Les candidats sont revérifiés par
+paquets, en une requête chacun, juste avant leur suppression.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from app import stockage_images
+from app.models import Produit
+
+
+class Command(BaseCommand):
+    help = "Supprime les images de codes-barres qu'aucun produit ne référence."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age-min', type=int, default=3600,
+                            help="Ne supprimer que les fichiers plus anciens que N secondes (défaut : 3600).")
+        parser.add_argument('--simulation', action='store_true',
+                            help="Afficher ce qui serait supprimé sans rien supprimer.")
+
+    def handle(self, *args, **options):
+        champ = Produit._meta.get_field('barcode_image')
+        storage = champ.storage
+        dossier = champ.upload_to.rstrip('/')
+        limite = timezone.now() - timedelta(seconds=options['age_min'])
+
+        references = stockage_images.references()
+        examines = 0
+        candidats = []
+        for nom in stockage_images.fichiers(storage, dossier):
+            examines += 1
+            if nom not in references and storage.get_modified_time(nom) < limite:
+                candidats.append(nom)
+        del references
+
+        supprimes, octets = 0, 0
+        for debut in range(0, len(candidats), stockage_images.LOT_VERIFICATION):
+            lot = candidats[debut:debut + stockage_images.LOT_VERIFICATION]
+            # Un produit créé pendant le parcours peut désigner un ancien fichier de même adresse
+            reutilises = stockage_images.encore_references(lot)
+            for nom in lot:
+                if nom in reutilises:
+                    continue
+                taille = storage.size(nom)
+                if not options['simulation']:
+                    storage.delete(nom)
+                supprimes += 1
+                octets += taille
+
+        verbe = "seraient supprimées" if options['simulation'] else "supprimées"
+        self.stdout.write(self.style.SUCCESS(
+            f"{examines} image(s) examinée(s), {supprimes} orpheline(s) {verbe}, "
+            f"{filesizeformat(octets)} récupéré(s)."
+        ))
@@ -0,0 +1,111 @@
+"""
+Worker de rendu des images de codes-barres.
+
+    python manage.py rendre_codes_barres [--threads 4 | --processus 4] [--une-fois]
+
+Le worker réserve des lots de travaux RenduCodeBarre, rend les images (PNG
+ou SVG selon BARCODE_FORMAT) dans un pool de threads (ou de processus) puis
+enregistre les fichiers et met à jour les produits depuis le thread
+principal, seul à écrire en base.
+"""
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from app.models import RenduCodeBarre
+from app.registre import registre
+from app.rendu import RENDUS
+
+
+class Command(BaseCommand):
+    help = "Génère en arrière-plan les images des codes-barres en attente."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help="Nombre de threads de rendu (défaut : 4).")
+        parser.add_argument('--processus', type=int, default=0,
+                            help="Utiliser un pool de N processus au lieu de threads.")
+        parser.add_argument('--lot', type=int, default=50,
+                            help="Nombre de travaux réservés à chaque passage.")
+        parser.add_argument('--intervalle', type=float, default=2.0,
+                            help="Pause (secondes) quand la file est vide.")
+        parser.add_argument('--max-tentatives', type=int, default=3,
+                            help="Nombre d'essais avant de laisser un travail en échec.")
+        parser.add_argument('--reprise-apres', type=int, default=300,
+                            help="Remettre en attente les travaux en cours depuis plus de N secondes.")
+        parser.add_argument('--une-fois', action='store_true',
+                            help="Vider la file puis s'arrêter.")
+
+    def handle(self, *args, **options):
+        if options['processus']:
+            pool = ProcessPoolExecutor(max_workers=options['processus'])
+        else:
+            pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+        total = 0
+        try:
+            with pool:
+                while True:
+                    self.reprendre_travaux_bloques(options['reprise_apres'])
+                    travaux = self.reserver_lot(options['lot'])
+                    if travaux:
+                        total += self.traiter_lot(pool, travaux, options['max_tentatives'])
+                        continue
+                    if options['une_fois']:
+                        break
+                    time.sleep(options['intervalle'])
+        finally:
+            # Durées de rendu conservées pour /metrics (le fichier du processus est sinon écrit chaque seconde)
+            registre.archiver()
+
+        self.stdout.write(self.style.SUCCESS(f"{total} image(s) de code-barres générée(s)."))
+
+    def reprendre_travaux_bloques(self, secondes):
+        """ Remet en attente les travaux d'un worker arrêté en cours de lot. """
+        limite = timezone.now() - timedelta(seconds=secondes)
+        RenduCodeBarre.objects.filter(
+            statut=RenduCodeBarre.EN_COURS, date_maj__lt=limite
+        ).update(statut=RenduCodeBarre.EN_ATTENTE, jeton='')
+
+    def reserver_lot(self, taille):
+        """
+        Réserve au plus taille travaux en attente. Le jeton est posé par un seul
+        UPDATE conditionnel : deux workers ne peuvent pas réserver le même travail.
+        """
+        ids = list(
+            RenduCodeBarre.objects.filter(statut=RenduCodeBarre.EN_ATTENTE)
+            .values_list('id', flat=True)[:taille]
+        )
+        if not ids:
+            return []
+        jeton = uuid.uuid4().hex
+        RenduCodeBarre.objects.filter(id__in=ids, statut=RenduCodeBarre.EN_ATTENTE).update(
+            statut=RenduCodeBarre.EN_COURS,
+            jeton=jeton,
+            tentatives=F('tentatives') + 1,
+            date_maj=timezone.now(),
+        )
+        return list(RenduCodeBarre.objects.filter(jeton=jeton).select_related('produit'))
+
+    def traiter_lot(self, pool, travaux, max_tentatives):
+        rendre = RENDUS[settings.BARCODE_FORMAT]
+        futures = {pool.submit(rendre, travail.produit.barcode): travail for travail in travaux}
+        rendus = 0
+        for future in as_completed(futures):
+            travail = futures[future]
+            try:
+                travail.produit.enregistrer_image(future.result())
+                rendus += 1
+            except Exception as exc:
+                statut = RenduCodeBarre.ECHEC if travail.tentatives >= max_tentatives else RenduCodeBarre.EN_ATTENTE
+                RenduCodeBarre.objects.filter(pk=travail.pk).update(
+                    statut=statut, jeton='', erreur=str(exc), date_maj=timezone.now()
+                )
+                self.stderr.write(f"Échec du rendu pour le produit {travail.produit_id} : {exc}")
+        return rendus
@@ -0,0 +1,73 @@
+"""
+Histogrammes glissants des temps de réponse, par vue et par processus.
+
+Pour chaque vue, les METRIQUES_FENETRE dernières requêtes sont conservées
+(durée totale, nombre de requêtes SQL, temps SQL, taille de la réponse) ;
+les centiles p50 / p95 / p99 sont calculés à la lecture.
+"""
+import threading
+from collections import deque
+
+from django.conf import settings
+
+CENTILES = (50, 95, 99)
+
+
+def centiles(valeurs):
+    """ Centiles (rang le plus proche) d'une liste de valeurs. """
+    valeurs = sorted(valeurs)
+    if not valeurs:
+        return dict.fromkeys((f'p{p}' for p in CENTILES))
+    return {f'p{p}': valeurs[min(len(valeurs) - 1, len(valeurs) * p // 100)] for p in CENTILES}
+
+
+class Histogrammes:
+
+    def __init__(self, fenetre):
+        self.fenetre = fenetre
+        self._mesures = {}
+        self._totaux = {}
+        self._verrou = threading.Lock()
+
+    def enregistrer(self, vue, duree, requetes, duree_sql, taille):
+        with self._verrou:
+            if vue not in self._mesures:
+                self._mesures[vue] = deque(maxlen=self.fenetre)
+                self._totaux[vue] = 0
+            self._mesures[vue].append((duree, requetes, duree_sql, taille))
+            self._totaux[vue] += 1
+
+    def resume(self):
+        """ {vue: {total, fenetre, duree_ms, requetes, sql_ms, octets}}, les vues les plus lentes (p95) d'abord. """
+        with self._verrou:
+            copies = {vue: list(mesures) for vue, mesures in self._mesures.items()}
+            totaux = dict(self._totaux)
+
+        resume = {}
+        for vue, mesures in copies.items():
+            durees, requetes, durees_sql, tailles = zip(*mesures)
+            resume[vue] = {
+                'total': totaux[vue],
+                'fenetre': len(mesures),
+                'duree_ms': {p: round(v * 1000, 2) for p, v in centiles(durees).items()},
+                'requetes': centiles(requetes),
+                'sql_ms': {p: round(v * 1000, 2) for p, v in centiles(durees_sql).items()},
+                'octets': centiles([taille for taille in tailles if taille is not None]),
+            }
+        return dict(sorted(resume.items(), key=lambda element: element[1]['duree_ms']['p95'], reverse=True))
+
+    def vider(self):
+        with self._verrou:
+            self._mesures.clear()
+            self._totaux.clear()
+
+
+_histogrammes = None
+
+
+def histogrammes():
+    """ Histogrammes du processus, dimensionnés par METRIQUES_FENETRE. """
+    global _histogrammes
+    if _histogrammes is None:
+        _histogrammes = Histogrammes(settings.METRIQUES_FENETRE)
+    return _histogrammes
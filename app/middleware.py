@@ -0,0 +1,102 @@
+"""
+Mesure de chaque requête : durée totale, nombre et durée des requêtes SQL,
+taille de la réponse.
+
+Les requêtes SQL sont comptées par un execute_wrapper posé sur chaque
+connexion à son ouverture. La mesure en cours est portée par une variable de
+contexte : elle suit la requête jusque dans les threads de sync_to_async
+(ORM appelé depuis une vue asynchrone). Les résultats sont renvoyés dans
+l'en-tête Server-Timing et ajoutés aux histogrammes de app.metriques.
+"""
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metriques import histogrammes
+
+mesure_courante = ContextVar('mesure_courante', default=None)
+
+
+class Mesure:
+    __slots__ = ('debut', 'requetes', 'duree_sql')
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.requetes = 0
+        self.duree_sql = 0.0
+
+
+def mesurer_sql(execute, sql, params, many, context):
+    mesure = mesure_courante.get()
+    if mesure is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        mesure.requetes += 1
+        mesure.duree_sql += time.perf_counter() - debut
+
+
+@receiver(connection_created)
+def installer_mesure_sql(sender, connection, **kwargs):
+    # Le même objet connexion est rouvert à chaque requête quand CONN_MAX_AGE vaut 0
+    if mesurer_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(mesurer_sql)
+
+
+class MesureRequetesMiddleware:
+    """ À placer en tête de MIDDLEWARE pour mesurer toute la pile. """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connexions déjà ouvertes avant le chargement du middleware (vérifications au démarrage)
+        for connection in connections.all(initialized_only=True):
+            installer_mesure_sql(sender=None, connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mesure = Mesure()
+        jeton = mesure_courante.set(mesure)
+        try:
+            response = self.get_response(request)
+        finally:
+            mesure_courante.reset(jeton)
+        return self.terminer(request, response, mesure)
+
+    async def __acall__(self, request):
+        mesure = Mesure()
+        jeton = mesure_courante.set(mesure)
+        try:
+            response = await self.get_response(request)
+        finally:
+            mesure_courante.reset(jeton)
+        return self.terminer(request, response, mesure)
+
+    def terminer(self, request, response, mesure):
+        duree = time.perf_counter() - mesure.debut
+        if response.streaming:
+            # Un flux n'est pas lu ici : taille connue seulement si annoncée
+            taille = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            taille = len(response.content)
+
+        correspondance = request.resolver_match
+        vue = correspondance.view_name if correspondance else 'non_resolue'
+        histogrammes().enregistrer(vue, duree, mesure.requetes, mesure.duree_sql, taille)
+
+        response['Server-Timing'] = (
+            f'total;dur={duree * 1000:.2f}, '
+            f'db;dur={mesure.duree_sql * 1000:.2f};desc="{mesure.requetes} SQL"'
+        )
+        return response
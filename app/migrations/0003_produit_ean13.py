@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def calculer_checksum(code):
+    """ Calcule le chiffre de contrôle EAN-13 pour 12 chiffres de données. """
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(code))
+    return str((10 - total % 10) % 10)
+
+
+def remplir_ean13(apps, schema_editor):
+    Produit = apps.get_model('app', 'Produit')
+    produits = []
+    for produit in Produit.objects.exclude(barcode__isnull=True).exclude(barcode='').only('id', 'barcode'):
+        produit.ean13 = produit.barcode + calculer_checksum(produit.barcode)
+        produits.append(produit)
+    Produit.objects.bulk_update(produits, ['ean13'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_remove_produit_date_modification_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='ean13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True, unique=True, verbose_name='Code EAN-13 complet'),
+        ),
+        migrations.RunPython(remplir_ean13, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 06:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_produit_ean13'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenduCodeBarre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('echec', 'Échec')], default='en_attente', max_length=20, verbose_name='Statut')),
+                ('jeton', models.CharField(blank=True, default='', max_length=32, verbose_name='Jeton de réservation')),
+                ('tentatives', models.PositiveSmallIntegerField(default=0, verbose_name='Tentatives')),
+                ('erreur', models.TextField(blank=True, default='', verbose_name='Dernière erreur')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('date_maj', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rendu_en_attente', to='app.produit', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': 'Rendu de code-barres',
+                'verbose_name_plural': 'Rendus de codes-barres',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['statut', 'id'], name='rendu_statut_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_rendu_code_barre'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='produit',
+            options={'ordering': ['nom', 'id'], 'verbose_name': 'Produit', 'verbose_name_plural': 'Produits'},
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['nom', 'id'], name='produit_nom_id_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_produit_nom_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneCatalogue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fichier', models.FileField(upload_to='catalogue/', verbose_name='Fichier (JSON gzip)')),
+                ('empreinte', models.CharField(max_length=64, verbose_name='Empreinte du contenu')),
+                ('nombre_produits', models.PositiveIntegerField(verbose_name='Nombre de produits')),
+                ('generation', models.BigIntegerField(blank=True, null=True, verbose_name='Génération')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('verifie_le', models.DateTimeField(verbose_name='Dernière vérification')),
+            ],
+            options={
+                'verbose_name': 'Instantané du catalogue',
+                'verbose_name_plural': 'Instantanés du catalogue',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
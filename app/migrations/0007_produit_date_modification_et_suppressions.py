@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 07:03
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def initialiser_date_modification(apps, schema_editor):
+    # Les produits existants n'ont jamais été suivis : on part de leur date de création
+    Produit = apps.get_model('app', 'Produit')
+    Produit.objects.update(date_modification=F('date_creation'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_instantane_catalogue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProduitSupprime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('produit_id', models.BigIntegerField(verbose_name='Identifiant du produit')),
+                ('barcode', models.CharField(blank=True, max_length=12, null=True, verbose_name='Code-barres (12 chiffres de données)')),
+                ('ean13', models.CharField(blank=True, max_length=13, null=True, verbose_name='Code EAN-13 complet')),
+                ('date_suppression', models.DateTimeField(auto_now_add=True, verbose_name='Date de suppression')),
+            ],
+            options={
+                'verbose_name': 'Produit supprimé',
+                'verbose_name_plural': 'Produits supprimés',
+                'ordering': ['date_suppression', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, verbose_name='Dernière modification'),
+        ),
+        migrations.RunPython(initialiser_date_modification, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['date_modification', 'id'], name='produit_modif_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produitsupprime',
+            index=models.Index(fields=['date_suppression', 'id'], name='supprime_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_produit_date_modification_et_suppressions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurCodeBarre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefixe', models.CharField(max_length=11, unique=True, verbose_name="Préfixe d'entreprise GS1")),
+                ('prochain', models.BigIntegerField(default=0, verbose_name="Prochaine référence d'article")),
+            ],
+            options={
+                'verbose_name': 'Compteur de codes-barres',
+                'verbose_name_plural': 'Compteurs de codes-barres',
+            },
+        ),
+    ]
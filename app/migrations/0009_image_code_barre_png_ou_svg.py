@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_compteur_code_barre'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='produit',
+            name='barcode_image',
+            field=models.FileField(blank=True, null=True, upload_to='barcodes/', verbose_name='Image du code-barres'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_image_code_barre_png_ou_svg'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instantanecatalogue',
+            name='precedent',
+            field=models.PositiveBigIntegerField(blank=True, null=True, unique=True, verbose_name='Version précédente'),
+        ),
+    ]
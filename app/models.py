@@ -1,10 +1,13 @@
-from django.db import models
-from django.utils.crypto import get_random_string
-import barcode
-from barcode.writer import ImageWriter
-from io import BytesIO
-from django.core.files import File
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.urls import reverse
 import os # Nécessaire pour les chemins si non importé
+from . import stockage_images
+from .codes_barres import allocateur
+from .ean13 import code_complet
+from .registre import COLLISIONS_CODE_BARRE
+from .rendu import RENDUS
 
 class Produit(models.Model):
     """
@@ -27,7 +30,17 @@ class Produit(models.Model):
         null=True,
         verbose_name="Code-barres (12 chiffres de données)"
     )
-    barcode_image = models.ImageField(
+    # Code complet de 13 chiffres (12 + checksum), indexé pour le scan direct
+    ean13 = models.CharField(
+        max_length=13,
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name="Code EAN-13 complet"
+    )
+    # FileField et non ImageField : l'image peut être un PNG ou un SVG (BARCODE_FORMAT)
+    barcode_image = models.FileField(
         upload_to='barcodes/', 
         blank=True, 
         null=True,
@@ -37,76 +50,361 @@ class Produit(models.Model):
         auto_now_add=True, 
         verbose_name="Date de création"
     )
+    # Renseignée dans le même INSERT / UPDATE que le reste de la ligne (aucune requête de plus)
+    date_modification = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Dernière modification"
+    )
+
+    # Nombre de codes aléatoires essayés en cas de collision sur l'index unique
+    MAX_TENTATIVES_BARCODE = 10
 
     def generate_unique_barcode(self):
         """
-        Génère une chaîne aléatoire de 12 chiffres (données EAN-13).
+        Renvoie 12 chiffres de données EAN-13 fournis par l'allocateur
+        configuré (BARCODE_ALLOCATEUR, voir app.codes_barres).
         """
-        length = 12 
-        return get_random_string(length=length, allowed_chars='0123456789')
+        return allocateur().code()
 
-    def generate_barcode_image(self):
+    @classmethod
+    def allouer_codes_barres(cls, nombre):
+        """ Réserve nombre codes de 12 chiffres libres pour une création en masse. """
+        return allocateur().codes(nombre)
+
+    def chemin_image(self):
+        """
+        Chemin de stockage de l'image, adressé par le contenu (app.stockage_images) :
+        déduit des seuls chiffres du code-barres, de la version du rendu et du
+        format BARCODE_FORMAT.
         """
-        Génère l'image du code-barres à l'aide de python-barcode (EAN-13).
+        return self.barcode_image.field.generate_filename(
+            self, stockage_images.adresse(self.barcode, settings.BARCODE_FORMAT)
+        )
+
+    def url_image(self):
+        """
+        URL de l'image pour les pages d'impression, au format de l'image
+        enregistrée (BARCODE_FORMAT à défaut). Elle pointe vers le rendu à la
+        demande (app:image_code_barre), identique au fichier stocké : l'image
+        s'affiche même si le rendu différé n'a pas encore eu lieu, et sans que
+        MEDIA_URL soit servi.
+        """
+        if not self.barcode:
+            return None
+        extension = stockage_images.extension(self.barcode_image.name) if self.barcode_image else settings.BARCODE_FORMAT
+        return reverse('app:image_code_barre', args=[self.barcode, extension])
+
+    def image_disponible(self):
+        """ Vrai si le fichier de l'image a déjà été écrit dans le stockage. """
+        return bool(self.barcode_image) and self.barcode_image.storage.exists(self.barcode_image.name)
+
+    def ecrire_image(self, contenu=None):
+        """
+        Écrit l'image à l'emplacement indiqué par barcode_image, sans requête SQL.
+        Le format (png ou svg) est celui de l'extension du nom.
+        Un fichier déjà présent à cet emplacement est identique (même adresse) :
+        il est conservé tel quel.
+        """
+        storage = self.barcode_image.storage
+        if storage.exists(self.barcode_image.name):
+            return
+        # Le rendu ne dépend que des 12 chiffres
+        if contenu is None:
+            contenu = RENDUS[stockage_images.extension(self.barcode_image.name)](self.barcode)
+        stockage_images.enregistrer(storage, self.barcode_image.name, contenu)
+
+    def generate_barcode_image(self, contenu=None):
+        """
+        Génère l'image du code-barres (EAN-13) au format BARCODE_FORMAT.
+        contenu permet de fournir des octets déjà rendus dans ce format (worker de rendu).
         """
         if not self.barcode:
             # Sécurité: Ne devrait pas arriver si save() est bien exécuté
             raise ValueError("Le produit doit avoir un code-barres numérique défini avant de générer l'image.")
         
-        # Le code-barres doit être de 12 chiffres pour EAN13
-        EAN = barcode.get_barcode_class('ean13')
-        
-        # Créer l'objet code-barres. EAN() va calculer le 13ème chiffre (checksum)
-        ean = EAN(self.barcode, writer=ImageWriter()) 
+        self.barcode_image.name = self.chemin_image()
+        self.ecrire_image(contenu)
+        return self.barcode_image
 
-        # Créer un objet BytesIO pour stocker l'image en mémoire
-        buffer = BytesIO()
-        
-        # Écrire l'image dans le buffer
-        ean.write(buffer)
-        
-        # Préparer le fichier Django pour le stockage
-        filename = f'{self.barcode}.png'
-        file_buffer = File(buffer, name=filename)
-        
-        # Mettre à jour le champ ImageField (save=False pour le sauver dans la 2e save)
-        self.barcode_image.save(filename, file_buffer, save=False)
+    def enregistrer_image(self, contenu=None):
+        """
+        Génère l'image sans repasser par save(). La colonne barcode_image n'est
+        mise à jour que si son chemin change (produits antérieurs à l'écriture
+        du chemin dès l'INSERT). Le travail de rendu en attente est supprimé.
+        """
+        ancien_nom = self.barcode_image.name
+        self.generate_barcode_image(contenu)
+        if self.barcode_image.name != ancien_nom:
+            Produit.objects.filter(pk=self.pk).update(barcode_image=self.barcode_image.name)
+        RenduCodeBarre.objects.filter(produit_id=self.pk).delete()
         return self.barcode_image
 
     def save(self, *args, **kwargs):
         """
         1. Génère le code-barres numérique s'il n'existe pas.
-        2. Sauvegarde l'objet pour obtenir un PK (nécessaire pour les fichiers).
-        3. Génère et sauvegarde l'image du code-barres.
+        2. Déduit le chemin de l'image du code-barres et enregistre l'objet en
+           une seule écriture (un seul INSERT pour un nouveau produit).
+        3. Écrit le fichier de l'image, ou place un travail de rendu dans la
+           file si BARCODE_RENDU_ASYNCHRONE est activé.
+
+        Les collisions de code-barres généré ne sont pas pré-vérifiées : la
+        contrainte d'unicité est interceptée et un nouveau code est tiré.
+        Le champ ean13 est recalculé à chaque sauvegarde pour rester
+        synchronisé avec barcode.
         """
         is_new = self.pk is None
-        
-        # ÉTAPE 1: Générer le numéro de code-barres s'il est manquant
-        if not self.barcode:
-            new_barcode = self.generate_unique_barcode()
-            while Produit.objects.filter(barcode=new_barcode).exists():
-                new_barcode = self.generate_unique_barcode()
-            self.barcode = new_barcode   
-            
-        # ÉTAPE 2: Sauvegarder l'objet initialement
-        super().save(*args, **kwargs)
-        
-        # ÉTAPE 3: Générer et sauvegarder l'image si c'est nouveau ou manquant
-        # On vérifie is_new ET s'il n'y a pas déjà d'image
-        if is_new or not self.barcode_image:
-             self.generate_barcode_image()
-             # Sauvegarder à nouveau, cette fois pour enregistrer l'ImageField
-             super().save(update_fields=['barcode_image']) 
+        image_manquante = is_new or not self.barcode_image
+        code_genere = not self.barcode
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'barcode' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'ean13'}
+
+        for tentative in range(1, self.MAX_TENTATIVES_BARCODE + 1):
+            # ÉTAPE 1: Générer le numéro de code-barres s'il est manquant
+            if code_genere:
+                self.barcode = self.generate_unique_barcode()
+
+            # Le code complet (avec checksum) est stocké pour la recherche indexée
+            self.ean13 = self.get_full_barcode()
+
+            # ÉTAPE 2: Le chemin de l'image est connu avant l'écriture
+            if image_manquante:
+                self.barcode_image.name = self.chemin_image()
+
+            try:
+                # Point de sauvegarde : une collision n'invalide pas la transaction englobante
+                with transaction.atomic(using=kwargs.get('using')):
+                    super().save(*args, **kwargs)
+                    if image_manquante and settings.BARCODE_RENDU_ASYNCHRONE:
+                        # Le rendu est confié au worker (manage.py rendre_codes_barres)
+                        if is_new:
+                            RenduCodeBarre.objects.create(produit=self)
+                        else:
+                            RenduCodeBarre.objects.get_or_create(produit=self)
+                break
+            except IntegrityError:
+                if not code_genere or tentative == self.MAX_TENTATIVES_BARCODE:
+                    raise
+                COLLISIONS_CODE_BARRE.inc()
+                if is_new:
+                    self.pk = None
+
+        # ÉTAPE 3: Écrire l'image (aucune requête supplémentaire)
+        if image_manquante and not settings.BARCODE_RENDU_ASYNCHRONE:
+            self.ecrire_image()
 
     def get_full_barcode(self):
         """ Renvoie le code-barres complet de 13 chiffres (12 + checksum). """
-        EAN = barcode.get_barcode_class('ean13')
-        return EAN(self.barcode).get_fullcode()
+        if not self.barcode:
+            return None
+        return code_complet(self.barcode)
 
     def __str__(self):
-        return f"{self.nom} (Code: {self.get_full_barcode()})"
+        return f"{self.nom} (Code: {self.ean13 or self.get_full_barcode()})"
 
     class Meta:
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
-        ordering = ['nom']
\ No newline at end of file
+        # id départage les homonymes : ordre total, nécessaire à la pagination par clé
+        ordering = ['nom', 'id']
+        indexes = [
+            models.Index(fields=['nom', 'id'], name='produit_nom_id_idx'),
+            # Flux des changements : parcours par clé (date_modification, id)
+            models.Index(fields=['date_modification', 'id'], name='produit_modif_id_idx'),
+        ]
+
+
+class RenduCodeBarre(models.Model):
+    """
+    File d'attente des rendus d'images de codes-barres.
+    Une ligne par produit dont l'image reste à générer ; elle est supprimée
+    une fois l'image enregistrée.
+    """
+    EN_ATTENTE = 'en_attente'
+    EN_COURS = 'en_cours'
+    ECHEC = 'echec'
+    STATUTS = [
+        (EN_ATTENTE, "En attente"),
+        (EN_COURS, "En cours"),
+        (ECHEC, "Échec"),
+    ]
+
+    produit = models.OneToOneField(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name='rendu_en_attente',
+        verbose_name="Produit"
+    )
+    statut = models.CharField(
+        max_length=20,
+        choices=STATUTS,
+        default=EN_ATTENTE,
+        verbose_name="Statut"
+    )
+    # Identifiant du lot réservé par un worker (réservation atomique par UPDATE)
+    jeton = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        verbose_name="Jeton de réservation"
+    )
+    tentatives = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Tentatives"
+    )
+    erreur = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Dernière erreur"
+    )
+    date_creation = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Date de création"
+    )
+    date_maj = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Dernière mise à jour"
+    )
+
+    def __str__(self):
+        return f"Rendu {self.produit_id} ({self.statut})"
+
+    class Meta:
+        verbose_name = "Rendu de code-barres"
+        verbose_name_plural = "Rendus de codes-barres"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['statut', 'id'], name='rendu_statut_id_idx'),
+        ]
+
+
+class ProduitSupprime(models.Model):
+    """
+    Pierre tombale d'un produit supprimé, pour que le flux des changements
+    signale aussi les suppressions aux consommateurs (caches, terminaux).
+    """
+    produit_id = models.BigIntegerField(
+        verbose_name="Identifiant du produit"
+    )
+    barcode = models.CharField(
+        max_length=12,
+        blank=True,
+        null=True,
+        verbose_name="Code-barres (12 chiffres de données)"
+    )
+    ean13 = models.CharField(
+        max_length=13,
+        blank=True,
+        null=True,
+        verbose_name="Code EAN-13 complet"
+    )
+    date_suppression = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Date de suppression"
+    )
+
+    def __str__(self):
+        return f"Produit {self.produit_id} supprimé ({self.ean13})"
+
+    class Meta:
+        verbose_name = "Produit supprimé"
+        verbose_name_plural = "Produits supprimés"
+        ordering = ['date_suppression', 'id']
+        indexes = [
+            models.Index(fields=['date_suppression', 'id'], name='supprime_date_id_idx'),
+        ]
+
+
+class InstantaneCatalogue(models.Model):
+    """
+    Version figée du catalogue (code EAN-13 -> nom, prix) pour les terminaux
+    hors ligne. Le numéro de version est la clé primaire, croissante ; le
+    fichier est un JSON compressé gzip, trié par code.
+    """
+    fichier = models.FileField(
+        upload_to='catalogue/',
+        verbose_name="Fichier (JSON gzip)"
+    )
+    # SHA-256 du contenu non compressé : évite une nouvelle version si rien n'a changé
+    empreinte = models.CharField(
+        max_length=64,
+        verbose_name="Empreinte du contenu"
+    )
+    nombre_produits = models.PositiveIntegerField(
+        verbose_name="Nombre de produits"
+    )
+    # Génération du catalogue (app.generation) observée lors de la dernière vérification
+    generation = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Génération"
+    )
+    date_creation = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Date de création"
+    )
+    verifie_le = models.DateTimeField(
+        verbose_name="Dernière vérification"
+    )
+    # Version remplacée (0 pour la première) : une version n'a qu'un successeur,
+    # deux workers ne peuvent pas publier chacun le même catalogue
+    precedent = models.PositiveBigIntegerField(
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="Version précédente"
+    )
+
+    def __str__(self):
+        return f"Catalogue v{self.pk} ({self.nombre_produits} produits)"
+
+    class Meta:
+        verbose_name = "Instantané du catalogue"
+        verbose_name_plural = "Instantanés du catalogue"
+        ordering = ['-id']
+
+
+class CompteurCodeBarre(models.Model):
+    """
+    Prochaine référence d'article à attribuer pour un préfixe d'entreprise GS1
+    (allocateur séquentiel des codes-barres, app.codes_barres).
+    """
+    prefixe = models.CharField(
+        max_length=11,
+        unique=True,
+        verbose_name="Préfixe d'entreprise GS1"
+    )
+    prochain = models.BigIntegerField(
+        default=0,
+        verbose_name="Prochaine référence d'article"
+    )
+
+    @classmethod
+    def reserver(cls, prefixe, nombre, capacite):
+        """
+        Réserve nombre références consécutives pour prefixe et renvoie
+        (debut, fin), fin exclue, bornée par capacite. L'UPDATE verrouille la
+        ligne jusqu'à la fin de la transaction : deux réservations
+        concurrentes reçoivent des plages disjointes.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(prefixe=prefixe).update(prochain=F('prochain') + nombre):
+                try:
+                    # Premier bloc du préfixe ; un créateur concurrent peut insérer la ligne avant nous
+                    with transaction.atomic():
+                        cls.objects.create(prefixe=prefixe, prochain=nombre)
+                except IntegrityError:
+                    cls.objects.filter(prefixe=prefixe).update(prochain=F('prochain') + nombre)
+            fin = cls.objects.values_list('prochain', flat=True).get(prefixe=prefixe)
+        debut = fin - nombre
+        if debut >= capacite:
+            raise ValueError(f"Plus aucune référence d'article libre pour le préfixe {prefixe}.")
+        return debut, min(fin, capacite)
+
+    def __str__(self):
+        return f"{self.prefixe} (prochain : {self.prochain})"
+
+    class Meta:
+        verbose_name = "Compteur de codes-barres"
+        verbose_name_plural = "Compteurs de codes-barres"
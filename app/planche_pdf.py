@@ -0,0 +1,109 @@
+"""
+Génération en flux d'une planche d'étiquettes PDF (A4, N étiquettes par page).
+
+Le PDF est écrit page par page : seules les positions des objets sont gardées
+en mémoire, si bien que des milliers d'étiquettes peuvent être envoyées dans
+une StreamingHttpResponse. Les barres sont tracées en rectangles vectoriels à
+partir du motif EAN-13 (app.ean13.barres), sans passer par une image.
+"""
+import zlib
+
+from .ean13 import barres
+
+MM = 72 / 25.4
+LARGEUR_A4 = 210 * MM
+HAUTEUR_A4 = 297 * MM
+MARGE = 5 * MM
+
+
+def _texte(valeur):
+    """ Chaîne littérale PDF (police standard, encodage WinAnsi). """
+    octets = str(valeur).encode('cp1252', errors='replace')
+    return b'(' + octets.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _etiquette(produit, x, y, largeur, hauteur):
+    """ Instructions de dessin d'une étiquette dont le coin bas-gauche est (x, y). """
+    marge = 2 * MM
+    module = (largeur - 2 * marge) / 95
+    haut_barres = hauteur * 0.45
+    bas_barres = y + hauteur * 0.28
+    instructions = [
+        b'BT /F1 7 Tf %.2f %.2f Td %s Tj ET' % (x + marge, y + hauteur - marge - 6, _texte(produit.nom[:40])),
+    ]
+
+    # Barres contiguës fusionnées en un seul rectangle
+    rectangles = [
+        b'%.2f %.2f %.2f %.2f re' % (x + marge + debut * module, bas_barres, largeur_barre * module, haut_barres)
+        for debut, largeur_barre in barres(produit.barcode)
+    ]
+    instructions.append(b' '.join(rectangles) + b' f')
+
+    instructions.append(b'BT /F1 6 Tf %.2f %.2f Td %s Tj ET' % (
+        x + marge, bas_barres - 7, _texte(produit.ean13 or produit.get_full_barcode())))
+    instructions.append(b'BT /F2 9 Tf %.2f %.2f Td %s Tj ET' % (
+        x + marge, y + marge, _texte(f"{produit.prix} fc")))
+    return b'\n'.join(instructions)
+
+
+def generer_planches(produits, colonnes=4, lignes=11):
+    """
+    Générateur d'octets d'un PDF A4 de colonnes x lignes étiquettes par page.
+    produits peut être un itérateur (QuerySet.iterator()) : il n'est parcouru qu'une fois.
+    """
+    largeur = (LARGEUR_A4 - 2 * MARGE) / colonnes
+    hauteur = (HAUTEUR_A4 - 2 * MARGE) / lignes
+    par_page = colonnes * lignes
+
+    positions = {}
+    ecrit = 0
+    pages = []
+
+    def objet(numero, corps):
+        nonlocal ecrit
+        positions[numero] = ecrit
+        donnees = b'%d 0 obj\n' % numero + corps + b'\nendobj\n'
+        ecrit += len(donnees)
+        return donnees
+
+    entete = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    ecrit += len(entete)
+    yield entete
+    # 1 : catalogue et 2 : arbre des pages, écrits à la fin ; 3 et 4 : polices
+    yield objet(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield objet(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+    prochain = 5
+
+    def page(dessins):
+        nonlocal prochain
+        flux = zlib.compress(b'\n'.join(dessins))
+        contenu = objet(prochain, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(flux) + flux + b'\nendstream')
+        feuille = objet(prochain + 1, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+        ) % (LARGEUR_A4, HAUTEUR_A4, prochain))
+        pages.append(prochain + 1)
+        prochain += 2
+        return contenu + feuille
+
+    dessins = []
+    for produit in produits:
+        rang = len(dessins)
+        x = MARGE + (rang % colonnes) * largeur
+        y = HAUTEUR_A4 - MARGE - (rang // colonnes + 1) * hauteur
+        dessins.append(_etiquette(produit, x, y, largeur, hauteur))
+        if len(dessins) == par_page:
+            yield page(dessins)
+            dessins = []
+    if dessins or not pages:
+        yield page(dessins)
+
+    kids = b' '.join(b'%d 0 R' % numero for numero in pages)
+    yield objet(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(pages)))
+    yield objet(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    debut_xref = ecrit
+    xref = [b'xref\n0 %d\n' % prochain, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % positions[numero] for numero in range(1, prochain))
+    yield b''.join(xref)
+    yield b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (prochain, debut_xref)
@@ -0,0 +1,160 @@
+"""
+Recherche approximative des produits par nom (tolérante aux fautes de frappe).
+
+Chaque processus garde un index en mémoire des noms prétraités. Pour rester
+de l'ordre de la milliseconde sur un gros catalogue, la recherche se fait en
+deux temps avec rapidfuzz.process.extract :
+
+1. chaque mot de la requête est comparé au vocabulaire (mots distincts des
+   noms, bien moins nombreux que les produits) ;
+2. les produits contenant les mots retenus sont classés, puis les meilleurs
+   candidats sont re-notés sur le nom complet.
+
+L'index est mis à jour sur place par les signaux post_save / post_delete du
+processus courant. Les modifications faites ailleurs (autres workers, import
+en masse par bulk_create) sont rattrapées à partir de date_modification et
+des pierres tombales ProduitSupprime, sans reconstruction complète : dès que
+la génération du catalogue (app.generation) a changé, et au plus tard toutes
+les RECHERCHE_INDEX_TTL secondes.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from .generation import generation_catalogue
+
+SCORE_MOT_MIN = 70
+MOTS_PAR_TERME = 20
+CANDIDATS_PAR_RESULTAT = 20
+
+
+class IndexNoms:
+    """ Index des noms de produits d'un processus. """
+
+    def __init__(self):
+        self._verrou = threading.RLock()
+        self._construit_le = None
+        self._synchronise_depuis = None
+        self._generation = None
+        self.produits = {}
+        self.noms = {}
+        self.postings = defaultdict(set)
+
+    def _construire(self):
+        from .models import Produit
+
+        debut = timezone.now() - timedelta(seconds=settings.CHANGEMENTS_MARGE)
+        produits, noms, postings = {}, {}, defaultdict(set)
+        for produit_id, nom, prix, code in Produit.objects.values_list('id', 'nom', 'prix', 'ean13').iterator(chunk_size=5000):
+            produits[produit_id] = (nom, prix, code)
+            noms[produit_id] = default_process(nom)
+            for mot in noms[produit_id].split():
+                postings[mot].add(produit_id)
+        self.produits, self.noms, self.postings = produits, noms, postings
+        self._construit_le = time.monotonic()
+        self._synchronise_depuis = debut
+
+    def _synchroniser(self):
+        """ Applique les changements (modifications puis suppressions) depuis la dernière synchronisation. """
+        from .models import Produit, ProduitSupprime
+
+        # Recouvrement de CHANGEMENTS_MARGE : une transaction validée en retard est rattrapée
+        debut = timezone.now() - timedelta(seconds=settings.CHANGEMENTS_MARGE)
+        depuis = self._synchronise_depuis
+        for produit in Produit.objects.filter(date_modification__gte=depuis).only('id', 'nom', 'prix', 'ean13'):
+            self.mettre_a_jour(produit)
+        for produit_id in ProduitSupprime.objects.filter(date_suppression__gte=depuis).values_list('produit_id', flat=True):
+            self.retirer(produit_id)
+        self._construit_le = time.monotonic()
+        self._synchronise_depuis = debut
+
+    def _a_jour(self):
+        # Lue avant le rattrapage : un changement pendant celui-ci sera vu à la recherche suivante
+        generation = generation_catalogue()
+        with self._verrou:
+            if self._construit_le is None or self._synchronise_depuis is None:
+                # Jamais construit depuis la base (ou rempli à la main) : aucun point de reprise
+                self._construire()
+            elif (generation != self._generation
+                  or time.monotonic() - self._construit_le > settings.RECHERCHE_INDEX_TTL):
+                self._synchroniser()
+            self._generation = generation
+
+    def invalider(self):
+        """ Force une reconstruction complète à la prochaine recherche. """
+        with self._verrou:
+            self._construit_le = None
+
+    def retirer(self, produit_id):
+        with self._verrou:
+            if self._construit_le is None or produit_id not in self.noms:
+                return
+            for mot in self.noms.pop(produit_id).split():
+                self.postings[mot].discard(produit_id)
+                if not self.postings[mot]:
+                    del self.postings[mot]
+            del self.produits[produit_id]
+
+    def mettre_a_jour(self, produit):
+        """ Remplace l'entrée d'un produit enregistré, sans reconstruire l'index. """
+        with self._verrou:
+            if self._construit_le is None:
+                return
+            self.retirer(produit.pk)
+            self.produits[produit.pk] = (produit.nom, produit.prix, produit.ean13)
+            self.noms[produit.pk] = default_process(produit.nom)
+            for mot in self.noms[produit.pk].split():
+                self.postings[mot].add(produit.pk)
+
+    def rechercher(self, requete, limite=10, score_min=60):
+        """
+        Renvoie au plus limite produits dont le nom ressemble à requete,
+        du plus proche au moins proche : [{id, nom, prix, ean13, score}].
+        """
+        requete = default_process(requete)
+        termes = requete.split()
+        if not termes:
+            return []
+        self._a_jour()
+
+        with self._verrou:
+            # 1. Mots du vocabulaire proches de chaque terme de la requête
+            vocabulaire = list(self.postings)
+            scores = defaultdict(float)
+            for terme in termes:
+                meilleurs = {}
+                for mot, score, _ in process.extract(
+                    terme, vocabulaire, scorer=fuzz.ratio, processor=None,
+                    limit=MOTS_PAR_TERME, score_cutoff=SCORE_MOT_MIN,
+                ):
+                    for produit_id in self.postings[mot]:
+                        if score > meilleurs.get(produit_id, 0):
+                            meilleurs[produit_id] = score
+                for produit_id, score in meilleurs.items():
+                    scores[produit_id] += score
+
+            # 2. Re-notation des meilleurs candidats sur le nom complet
+            candidats = sorted(scores, key=scores.__getitem__, reverse=True)[:limite * CANDIDATS_PAR_RESULTAT]
+            resultats = process.extract(
+                requete, {produit_id: self.noms[produit_id] for produit_id in candidats},
+                scorer=fuzz.WRatio, processor=None, limit=limite, score_cutoff=score_min,
+            )
+            return [
+                {
+                    'id': produit_id,
+                    'nom': self.produits[produit_id][0],
+                    'prix': self.produits[produit_id][1],
+                    'ean13': self.produits[produit_id][2],
+                    'score': round(score, 1),
+                }
+                for _, score, produit_id in resultats
+            ]
+
+
+index_noms = IndexNoms()
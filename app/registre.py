@@ -0,0 +1,297 @@
+"""
+Registre de métriques (compteurs, jauges, histogrammes) exposé au format texte
+de Prometheus sur /metrics, sans service externe.
+
+Chaque processus cumule ses valeurs en mémoire. Un thread les écrit chaque
+seconde dans <METRIQUES_DOSSIER>/<pid>.json, dossier partagé par tous les
+processus (workers gunicorn, rendre_codes_barres, import_produits) ; la
+lecture additionne les fichiers de tous les processus. À sa sortie, un
+processus verse ses valeurs dans archive.json, pour que les compteurs ne
+reculent pas quand gunicorn recycle les workers. Le fichier laissé par un
+processus arrêté sans archiver est encore compté, et versé dans l'archive si
+un nouveau processus reçoit le même pid.
+
+Toutes les valeurs écrites sont des sommes (compteurs, seaux cumulés, _sum,
+_count) : l'agrégation entre processus est une simple addition. Les jauges
+sont calculées à la lecture par une fonction (nombre de produits, etc.).
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+SEUILS_SECONDES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+INTERVALLE_ECRITURE = 1.0
+ARCHIVE = 'archive.json'
+
+
+def echappe(valeur):
+    return str(valeur).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def echantillon(nom, etiquettes):
+    """ Nom d'un échantillon : nom{etiquette="valeur",...}. """
+    if not etiquettes:
+        return nom
+    return nom + '{' + ','.join(f'{cle}="{echappe(valeur)}"' for cle, valeur in etiquettes) + '}'
+
+
+def nombre(valeur):
+    return str(int(valeur)) if float(valeur).is_integer() else repr(float(valeur))
+
+
+class Metrique:
+    type = None
+
+    def __init__(self, registre, nom, aide, etiquettes=()):
+        self.registre = registre
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+
+    def lignes(self, echantillons):
+        """ Lignes exposées à partir des échantillons agrégés {nom{etiquettes}: valeur}. """
+        return [f'{cle} {nombre(valeur)}' for cle, valeur in sorted(echantillons.items())]
+
+    def _etiquettes(self, valeurs):
+        if set(valeurs) != set(self.etiquettes):
+            raise ValueError(f"{self.nom} attend les étiquettes {self.etiquettes}.")
+        return [(cle, valeurs[cle]) for cle in self.etiquettes]
+
+
+class Compteur(Metrique):
+    type = 'counter'
+
+    def inc(self, quantite=1, **etiquettes):
+        self.registre.ajouter(self.nom, {echantillon(self.nom, self._etiquettes(etiquettes)): quantite})
+
+
+class Histogramme(Metrique):
+    type = 'histogram'
+
+    def __init__(self, registre, nom, aide, etiquettes=(), seuils=SEUILS_SECONDES):
+        super().__init__(registre, nom, aide, etiquettes)
+        self.seuils = tuple(sorted(seuils))
+
+    def observer(self, valeur, **etiquettes):
+        etiquettes = self._etiquettes(etiquettes)
+        # Seaux cumulés dès l'écriture : le texte exposé est une simple somme des processus
+        increments = {
+            echantillon(f'{self.nom}_bucket', etiquettes + [('le', nombre(seuil))]): 1
+            for seuil in self.seuils[bisect_left(self.seuils, valeur):]
+        }
+        increments[echantillon(f'{self.nom}_bucket', etiquettes + [('le', '+Inf')])] = 1
+        increments[echantillon(f'{self.nom}_sum', etiquettes)] = valeur
+        increments[echantillon(f'{self.nom}_count', etiquettes)] = 1
+        self.registre.ajouter(self.nom, increments)
+
+    def lignes(self, echantillons):
+        # Pour chaque jeu d'étiquettes : seaux par seuil croissant (0 si jamais atteint), puis _sum et _count
+        prefixe = f'{self.nom}_count'
+        lignes = []
+        for cle in sorted(cle for cle in echantillons if cle.startswith(prefixe)):
+            etiquettes = cle[len(prefixe) + 1:-1]
+            avant = etiquettes + ',' if etiquettes else ''
+            for seuil in [nombre(seuil) for seuil in self.seuils] + ['+Inf']:
+                seau = f'{self.nom}_bucket{{{avant}le="{seuil}"}}'
+                lignes.append(f'{seau} {nombre(echantillons.get(seau, 0))}')
+            suffixe = f'{{{etiquettes}}}' if etiquettes else ''
+            lignes.append(f'{self.nom}_sum{suffixe} {nombre(echantillons.get(f"{self.nom}_sum{suffixe}", 0))}')
+            lignes.append(f'{cle} {nombre(echantillons[cle])}')
+        return lignes
+
+    @contextmanager
+    def chronometrer(self, **etiquettes):
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observer(time.perf_counter() - debut, **etiquettes)
+
+
+class Jauge(Metrique):
+    """ Valeur calculée à chaque lecture de /metrics par fonction(). """
+    type = 'gauge'
+
+    def __init__(self, registre, nom, aide, fonction):
+        super().__init__(registre, nom, aide)
+        self.fonction = fonction
+
+    def lignes(self, echantillons):
+        return [f'{self.nom} {nombre(self.fonction())}']
+
+
+class Registre:
+
+    def __init__(self):
+        self.metriques = {}
+        self._valeurs = defaultdict(lambda: defaultdict(float))
+        self._verrou = threading.Lock()
+        self._verrou_fichier = threading.Lock()
+        self._pid = None
+        self._modifie = False
+
+    # --- déclaration ---
+    def _declarer(self, metrique):
+        self.metriques[metrique.nom] = metrique
+        return metrique
+
+    def compteur(self, nom, aide, etiquettes=()):
+        return self._declarer(Compteur(self, nom, aide, etiquettes))
+
+    def histogramme(self, nom, aide, etiquettes=(), seuils=SEUILS_SECONDES):
+        return self._declarer(Histogramme(self, nom, aide, etiquettes, seuils))
+
+    def jauge(self, nom, aide, fonction):
+        return self._declarer(Jauge(self, nom, aide, fonction))
+
+    # --- valeurs du processus ---
+    @property
+    def dossier(self):
+        return settings.METRIQUES_DOSSIER
+
+    def ajouter(self, nom, increments):
+        with self._verrou:
+            if self._pid != os.getpid():
+                # Premier usage dans ce processus (ou après un fork) : rien n'est hérité du parent
+                self._pid = os.getpid()
+                self._valeurs.clear()
+                if self.dossier:
+                    self._archiver_fichier_du_pid()
+                    threading.Thread(target=self._ecrire_en_continu, daemon=True).start()
+            for cle, valeur in increments.items():
+                self._valeurs[nom][cle] += valeur
+            self._modifie = True
+
+    def _copie(self):
+        with self._verrou:
+            self._modifie = False
+            return {nom: dict(valeurs) for nom, valeurs in self._valeurs.items()}
+
+    def _ecrire_en_continu(self):
+        while True:
+            time.sleep(INTERVALLE_ECRITURE)
+            if self._modifie:
+                self.ecrire()
+
+    def ecrire(self):
+        """ Écrit les valeurs du processus dans <dossier>/<pid>.json (remplacement atomique). """
+        with self._verrou_fichier:
+            if not self.dossier or self._pid != os.getpid():
+                return
+            os.makedirs(self.dossier, exist_ok=True)
+            chemin = os.path.join(self.dossier, f'{self._pid}.json')
+            with open(chemin + '.tmp', 'w') as fichier:
+                json.dump(self._copie(), fichier)
+            os.replace(chemin + '.tmp', chemin)
+
+    def _verser_dans_archive(self, valeurs):
+        """ Ajoute valeurs à l'archive et supprime le fichier du pid courant, sous verrou exclusif. """
+        os.makedirs(self.dossier, exist_ok=True)
+        with open(os.path.join(self.dossier, ARCHIVE + '.verrou'), 'w') as verrou:
+            # Plusieurs processus peuvent sortir en même temps
+            fcntl.flock(verrou, fcntl.LOCK_EX)
+            chemin = os.path.join(self.dossier, ARCHIVE)
+            archive = fusionner(self._lire(chemin), valeurs)
+            with open(chemin + '.tmp', 'w') as fichier:
+                json.dump(archive, fichier)
+            os.replace(chemin + '.tmp', chemin)
+            try:
+                os.remove(os.path.join(self.dossier, f'{os.getpid()}.json'))
+            except FileNotFoundError:
+                pass
+
+    def _archiver_fichier_du_pid(self):
+        """ Un fichier à ce pid vient d'un processus arrêté sans archiver : il serait écrasé. """
+        with self._verrou_fichier:
+            chemin = os.path.join(self.dossier, f'{os.getpid()}.json')
+            if os.path.exists(chemin):
+                self._verser_dans_archive(self._lire(chemin))
+
+    def archiver(self):
+        """ À la sortie d'un processus : verse ses valeurs dans l'archive et supprime son fichier. """
+        with self._verrou_fichier:
+            if not self.dossier or self._pid != os.getpid():
+                return
+            self._verser_dans_archive(self._copie())
+            # Les valeurs archivées ne seront plus réécrites par ce processus
+            self._pid = None
+
+    @staticmethod
+    def _lire(chemin):
+        try:
+            with open(chemin) as fichier:
+                return json.load(fichier)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    # --- lecture ---
+    def valeurs(self):
+        """ Valeurs de tous les processus (fichiers du dossier), ou du seul processus courant. """
+        if not self.dossier:
+            return self._copie()
+        self.ecrire()
+        os.makedirs(self.dossier, exist_ok=True)
+        total = {}
+        with open(os.path.join(self.dossier, ARCHIVE + '.verrou'), 'w') as verrou:
+            # Verrou partagé : un worker ne peut pas être compté à la fois dans son fichier et dans l'archive
+            fcntl.flock(verrou, fcntl.LOCK_SH)
+            for nom_fichier in os.listdir(self.dossier):
+                if nom_fichier.endswith('.json'):
+                    fusionner(total, self._lire(os.path.join(self.dossier, nom_fichier)))
+        return total
+
+    def exposer(self):
+        """ Texte au format d'exposition Prometheus (version 0.0.4). """
+        valeurs = self.valeurs()
+        lignes = []
+        for nom, metrique in self.metriques.items():
+            lignes.append(f'# HELP {nom} {metrique.aide}')
+            lignes.append(f'# TYPE {nom} {metrique.type}')
+            lignes.extend(metrique.lignes(valeurs.get(nom, {})))
+        return '\n'.join(lignes) + '\n'
+
+
+def fusionner(total, valeurs):
+    for nom, echantillons in valeurs.items():
+        cible = total.setdefault(nom, {})
+        for cle, valeur in echantillons.items():
+            cible[cle] = cible.get(cle, 0) + valeur
+    return total
+
+
+def nombre_produits():
+    from .models import Produit
+
+    return Produit.objects.count()
+
+
+def rendus_en_attente():
+    from .models import RenduCodeBarre
+
+    return RenduCodeBarre.objects.count()
+
+
+registre = Registre()
+
+SCANS = registre.compteur(
+    'popcorn_scans_total', "Codes-barres scannés, par canal (page, api, lot) et résultat.",
+    ('canal', 'resultat'),
+)
+CACHE_PRIX = registre.compteur(
+    'popcorn_cache_prix_total', "Lectures du cache des prix (succes ou echec).", ('resultat',),
+)
+COLLISIONS_CODE_BARRE = registre.compteur(
+    'popcorn_collisions_code_barre_total', "Nouveaux tirages de code-barres après une collision dans save().",
+)
+RENDU_CODE_BARRE = registre.histogramme(
+    'popcorn_rendu_code_barre_secondes', "Durée du rendu d'une image de code-barres.", ('format',),
+)
+registre.jauge('popcorn_produits', "Nombre de produits au catalogue.", nombre_produits)
+registre.jauge('popcorn_rendus_en_attente', "Travaux de rendu en attente ou en échec.", rendus_en_attente)
@@ -0,0 +1,140 @@
+"""
+Rendu des images de codes-barres.
+
+Les fonctions de ce module ne dépendent que des chiffres du code-barres :
+elles peuvent être appelées dans une requête, dans un thread ou dans un
+processus séparé (worker de rendu) sans accès à la base de données.
+"""
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import barcode
+from barcode.writer import ImageWriter
+
+from .ean13 import barres, code_complet
+from .registre import RENDU_CODE_BARRE
+
+# À incrémenter si les options de rendu changent : invalide les ETag déjà distribués
+# et donne de nouvelles adresses aux fichiers stockés (app.stockage_images)
+VERSION_RENDU = '2'
+
+# Géométrie du SVG, en modules EAN-13 de 0,33 mm : zones de silence de 11 et 7
+# modules, barres de garde (début, centre, fin) prolongées sous les autres
+SVG_MODULE_MM = 0.33
+SVG_MARGE_GAUCHE = 11
+SVG_LARGEUR = SVG_MARGE_GAUCHE + 95 + 7
+SVG_HAUT = 2
+SVG_HAUTEUR_BARRES = 62
+SVG_HAUTEUR_GARDES = 67
+SVG_HAUTEUR = 80
+GARDES = {0, 2, 46, 48, 92, 94}
+
+TYPES_MIME = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def rendre_png(code):
+    """
+    Renvoie les octets PNG du code EAN-13 pour les 12 chiffres de données code.
+    python-barcode calcule lui-même le 13ème chiffre (checksum).
+    """
+    EAN = barcode.get_barcode_class('ean13')
+    buffer = BytesIO()
+    with RENDU_CODE_BARRE.chronometrer(format='png'):
+        EAN(code, writer=ImageWriter()).write(buffer)
+    return buffer.getvalue()
+
+
+def rendre_svg(code):
+    """
+    Renvoie les octets d'un SVG compact du code EAN-13 pour les 12 chiffres
+    de données code : un seul chemin pour toutes les barres (contiguës
+    fusionnées), coordonnées entières en modules, sans Pillow ni XML
+    indenté. Vectoriel, il reste net à toutes les résolutions d'impression.
+    """
+    with RENDU_CODE_BARRE.chronometrer(format='svg'):
+        complet = code_complet(code)
+        chemin = ''.join(
+            f'M{SVG_MARGE_GAUCHE + debut} {SVG_HAUT}h{largeur}'
+            f'v{SVG_HAUTEUR_GARDES if debut in GARDES else SVG_HAUTEUR_BARRES}h-{largeur}z'
+            for debut, largeur in barres(code)
+        )
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_LARGEUR * SVG_MODULE_MM:.2f}mm" '
+            f'height="{SVG_HAUTEUR * SVG_MODULE_MM:.2f}mm" viewBox="0 0 {SVG_LARGEUR} {SVG_HAUTEUR}">'
+            f'<rect width="100%" height="100%" fill="#fff"/><path d="{chemin}"/>'
+            f'<g font-family="monospace" font-size="10" text-anchor="middle">'
+            f'<text x="{SVG_MARGE_GAUCHE - 5}" y="{SVG_HAUTEUR - 2}">{complet[0]}</text>'
+            f'<text x="{SVG_MARGE_GAUCHE + 24}" y="{SVG_HAUTEUR - 2}" textLength="38">{complet[1:7]}</text>'
+            f'<text x="{SVG_MARGE_GAUCHE + 71}" y="{SVG_HAUTEUR - 2}" textLength="38">{complet[7:]}</text>'
+            f'</g></svg>'
+        ).encode()
+
+
+RENDUS = {
+    'png': rendre_png,
+    'svg': rendre_svg,
+}
+
+
+def etag(code, extension):
+    """
+    ETag fort d'un rendu : l'image ne dépend que du code et du format,
+    il est donc connu sans rien rendre ni interroger la base.
+    """
+    return f'"{code_complet(code)}-{extension}-v{VERSION_RENDU}"'
+
+
+class CacheRendus:
+    """
+    Cache LRU en mémoire (par processus) des rendus récents, borné en octets.
+    """
+
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self.taille = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def obtenir(self, code, extension):
+        """ Renvoie le rendu depuis le cache, en le générant au besoin. """
+        cle = (code, extension)
+        with self._verrou:
+            contenu = self._entrees.get(cle)
+            if contenu is not None:
+                self._entrees.move_to_end(cle)
+                return contenu
+
+        # Rendu hors verrou : deux requêtes simultanées peuvent rendre le même code
+        contenu = RENDUS[extension](code)
+        if len(contenu) > self.taille_max:
+            return contenu
+
+        with self._verrou:
+            if cle not in self._entrees:
+                self._entrees[cle] = contenu
+                self.taille += len(contenu)
+            while self.taille > self.taille_max:
+                _, ancien = self._entrees.popitem(last=False)
+                self.taille -= len(ancien)
+        return contenu
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self.taille = 0
+
+
+_cache = None
+
+
+def cache_rendus():
+    """ Cache partagé du processus, dimensionné par BARCODE_CACHE_RENDUS_OCTETS. """
+    global _cache
+    if _cache is None:
+        from django.conf import settings
+        _cache = CacheRendus(settings.BARCODE_CACHE_RENDUS_OCTETS)
+    return _cache
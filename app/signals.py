@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .cache_prix import cache_prix
+from .generation import incrementer_generation
+from .models import Produit, ProduitSupprime
+from .recherche import index_noms
+
+
+# ===================================
+# index de recherche par nom
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, **kwargs):
+    index_noms.mettre_a_jour(instance)
+
+
+@receiver(post_delete, sender=Produit)
+def desindexer_produit(sender, instance, **kwargs):
+    index_noms.retirer(instance.pk)
+
+
+# ===================================
+# génération du catalogue (ETag de l'API de scan)
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+def changer_generation(sender, **kwargs):
+    # Après le COMMIT : un lecteur qui voit la nouvelle génération lit aussi la nouvelle ligne
+    transaction.on_commit(incrementer_generation)
+
+
+# ===================================
+# cache des prix du scan
+@receiver(post_init, sender=Produit)
+def memoriser_barcode(sender, instance, **kwargs):
+    # Code chargé depuis la base : à invalider aussi s'il est modifié
+    instance._barcode_initial = instance.__dict__.get('barcode')
+
+
+def invalider_prix(*codes):
+    codes = [code for code in codes if code]
+    if codes:
+        cache_prix().invalider(*codes)
+        # Une lecture concurrente avant le COMMIT a pu remettre l'ancienne valeur
+        transaction.on_commit(lambda: cache_prix().invalider(*codes))
+
+
+@receiver(post_save, sender=Produit)
+def invalider_prix_enregistre(sender, instance, **kwargs):
+    invalider_prix(instance.barcode, getattr(instance, '_barcode_initial', None))
+    instance._barcode_initial = instance.barcode
+
+
+@receiver(post_delete, sender=Produit)
+def invalider_prix_supprime(sender, instance, **kwargs):
+    invalider_prix(instance.barcode)
+
+
+# ===================================
+# pierres tombales du flux des changements
+@receiver(post_delete, sender=Produit)
+def enregistrer_suppression(sender, instance, **kwargs):
+    ProduitSupprime.objects.create(produit_id=instance.pk, barcode=instance.barcode, ean13=instance.ean13)
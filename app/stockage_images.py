@@ -0,0 +1,79 @@
+"""
+Stockage des images de codes-barres adressé par le contenu.
+
+L'image ne dépend que du code EAN-13 et de VERSION_RENDU (app.rendu) : son
+adresse est l'empreinte SHA-256 de ces deux valeurs, répartie en sous-dossiers
+(ab/abcdef....png, ou .svg selon BARCODE_FORMAT). Elle est connue avant tout
+rendu, ce qui garde la création d'un produit en un seul INSERT et permet le
+rendu différé. Un même rendu a toujours le même fichier, jamais dupliqué avec
+un suffixe par le stockage ; changer VERSION_RENDU donne de nouvelles adresses
+sans écraser les anciennes.
+
+Les références sont les valeurs de la colonne Produit.barcode_image : un
+fichier qu'aucune ligne ne désigne (produit supprimé, ancien rendu) est
+orphelin et supprimé par manage.py nettoyer_codes_barres.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.base import ContentFile
+
+from .ean13 import code_complet
+from .rendu import VERSION_RENDU
+
+# Nombre de noms vérifiés par requête avant suppression
+LOT_VERIFICATION = 500
+
+
+def adresse(code, extension='png'):
+    """ Chemin relatif (sous upload_to) du rendu png ou svg du code à 12 ou 13 chiffres. """
+    empreinte = hashlib.sha256(f'{code_complet(code[:12])}:v{VERSION_RENDU}'.encode()).hexdigest()
+    return f'{empreinte[:2]}/{empreinte}.{extension}'
+
+
+def extension(nom):
+    """ Format d'un fichier stocké, d'après son nom ('png' ou 'svg'). """
+    return posixpath.splitext(nom)[1].lstrip('.').lower()
+
+
+def enregistrer(storage, nom, contenu):
+    """
+    Écrit contenu sous nom s'il n'y est pas déjà. Si un écrivain concurrent
+    l'a créé entre-temps, le stockage choisit un nom suffixé : cette copie
+    est aussitôt supprimée, le fichier à l'adresse est identique.
+    """
+    if storage.exists(nom):
+        return nom
+    enregistre = storage.save(nom, ContentFile(contenu))
+    if enregistre != nom:
+        storage.delete(enregistre)
+    return nom
+
+
+def fichiers(storage, dossier):
+    """ Noms de tous les fichiers sous dossier (parcours récursif du stockage). """
+    try:
+        sous_dossiers, noms = storage.listdir(dossier)
+    except FileNotFoundError:
+        return
+    for nom in noms:
+        yield posixpath.join(dossier, nom)
+    for sous_dossier in sous_dossiers:
+        yield from fichiers(storage, posixpath.join(dossier, sous_dossier))
+
+
+def references():
+    """ Noms de fichiers désignés par au moins un produit. """
+    from .models import Produit
+
+    return set(
+        Produit.objects.exclude(barcode_image='').exclude(barcode_image__isnull=True)
+        .values_list('barcode_image', flat=True).iterator(chunk_size=5000)
+    )
+
+
+def encore_references(noms):
+    """ Parmi noms, ceux qu'un produit désigne maintenant (créé depuis le relevé des références). """
+    from .models import Produit
+
+    return set(Produit.objects.filter(barcode_image__in=noms).values_list('barcode_image', flat=True))
@@ -1,3 +1,868 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import posixpath
+import random
+import re
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+
+from . import api, catalogue, ean13, rendu, views
+from .cache_prix import CachePrixLocal, cache_prix
+from .codes_barres import AllocateurSequentiel
+from .generation import generation_catalogue, incrementer_generation
+from .metriques import histogrammes
+from .models import CompteurCodeBarre, InstantaneCatalogue, Produit, ProduitSupprime, RenduCodeBarre
+from .recherche import IndexNoms, index_noms
+from .registre import Registre
+from .stockage_images import adresse
+
+MEDIA_ROOT_TEST = tempfile.mkdtemp()
+
+
+def requetes_sql(contexte):
+    """ Requêtes capturées, sans les points de sauvegarde ouverts par TestCase/atomic. """
+    return [
+        q['sql'] for q in contexte.captured_queries
+        if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+    ]
+
 
 # Create your tests here.
+@override_settings(MEDIA_ROOT=MEDIA_ROOT_TEST)
+class ProduitSaveTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT_TEST, ignore_errors=True)
+
+    @override_settings(BARCODE_RENDU_ASYNCHRONE=False)
+    def test_creation_un_seul_insert(self):
+        with CaptureQueriesContext(connection) as contexte:
+            produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+
+        requetes = requetes_sql(contexte)
+        self.assertEqual(len(requetes), 1, requetes)
+        self.assertTrue(requetes[0].startswith('INSERT INTO "app_produit"'))
+        self.assertEqual(produit.barcode_image.name, 'barcodes/' + adresse(produit.barcode))
+        self.assertTrue(produit.image_disponible())
+
+    @override_settings(BARCODE_RENDU_ASYNCHRONE=True)
+    def test_creation_asynchrone_produit_et_travail(self):
+        with CaptureQueriesContext(connection) as contexte:
+            produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+
+        requetes = requetes_sql(contexte)
+        self.assertEqual(len(requetes), 2, requetes)
+        self.assertTrue(requetes[0].startswith('INSERT INTO "app_produit"'))
+        self.assertTrue(requetes[1].startswith('INSERT INTO "app_renducodebarre"'))
+        self.assertTrue(RenduCodeBarre.objects.filter(produit=produit).exists())
+
+    @override_settings(BARCODE_RENDU_ASYNCHRONE=True)
+    def test_collision_reessayee_sans_exists(self):
+        existant = Produit.objects.create(nom='Savon', prix='1.00')
+        codes = iter([existant.barcode, '123456789012'])
+
+        with mock.patch.object(Produit, 'generate_unique_barcode', lambda self: next(codes)):
+            with CaptureQueriesContext(connection) as contexte:
+                produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+
+        self.assertEqual(produit.barcode, '123456789012')
+        self.assertEqual(produit.ean13, '1234567890128')
+        self.assertFalse(any(sql.startswith('SELECT') for sql in requetes_sql(contexte)))
+
+    @override_settings(BARCODE_RENDU_ASYNCHRONE=False)
+    def test_image_sans_doublon_et_orphelins_supprimes(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        supprime = Produit.objects.create(nom='Savon', prix='1.00')
+        orphelin = supprime.barcode_image.name
+        supprime.delete()
+
+        # Nouvel enregistrement sans image : même adresse, aucun fichier suffixé
+        produit.barcode_image = None
+        produit.save()
+        storage = produit.barcode_image.storage
+        dossier = posixpath.dirname(produit.barcode_image.name)
+        self.assertEqual(storage.listdir(dossier)[1], [posixpath.basename(produit.barcode_image.name)])
+
+        sortie = StringIO()
+        call_command('nettoyer_codes_barres', '--age-min', '0', stdout=sortie)
+        self.assertIn('orpheline(s) supprimées', sortie.getvalue())
+        self.assertFalse(storage.exists(orphelin))
+        self.assertTrue(produit.image_disponible())
+
+    @override_settings(BARCODE_RENDU_ASYNCHRONE=False)
+    def test_conversion_png_vers_svg(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        self.assertTrue(produit.barcode_image.name.endswith('.png'))
+
+        call_command('convertir_codes_barres', '--format', 'svg', '--supprimer-anciens', stdout=StringIO())
+        produit.refresh_from_db()
+
+        self.assertEqual(produit.barcode_image.name, 'barcodes/' + adresse(produit.barcode, 'svg'))
+        with produit.barcode_image.open('rb') as fichier:
+            self.assertTrue(fichier.read().startswith(b'<svg'))
+        with override_settings(BARCODE_FORMAT='svg'):
+            # Un nouvel enregistrement sans image retrouve directement le SVG converti
+            self.assertEqual(produit.chemin_image(), produit.barcode_image.name)
+
+    @override_settings(BARCODE_RENDU_ASYNCHRONE=False, BARCODE_FORMAT='png')
+    def test_pages_d_impression_au_format_de_l_image(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        self.client.force_login(User.objects.create_user('gerant', password='gerant'))
+        pages = [f'/produit/{produit.id}/imprimer/', f'/produits/imprimer/?ids={produit.id}']
+
+        for page in pages:
+            self.assertContains(self.client.get(page), f'/code-barre/{produit.barcode}.png')
+
+        call_command('convertir_codes_barres', '--format', 'svg', stdout=StringIO())
+        for page in pages:
+            self.assertContains(self.client.get(page), f'/code-barre/{produit.barcode}.svg')
+
+        # Sans image enregistrée : BARCODE_FORMAT
+        Produit.objects.filter(pk=produit.pk).update(barcode_image='')
+        with override_settings(BARCODE_FORMAT='svg'):
+            self.assertContains(self.client.get(pages[0]), f'/code-barre/{produit.barcode}.svg')
+
+
+class Ean13Tests(SimpleTestCase):
+
+    def test_checksum_et_motif_comme_python_barcode(self):
+        from barcode import EAN13
+
+        aleatoire = random.Random(13)
+        codes = ['000000000000', '999999999999', '590123412345'] + [
+            f'{aleatoire.randrange(10 ** 12):012d}' for _ in range(500)
+        ]
+        for code in codes:
+            reference = EAN13(code)
+            self.assertEqual(ean13.code_complet(code), reference.get_fullcode())
+            self.assertEqual(ean13.motif(code), reference.build()[0])
+
+    def test_barres_fusionnees(self):
+        motif = ean13.motif('590123412345')
+        modules = ['0'] * len(motif)
+        for debut, largeur in ean13.barres('590123412345'):
+            # Barres séparées par au moins un espace
+            self.assertNotEqual(modules[debut - 1:debut], ['1'])
+            modules[debut:debut + largeur] = '1' * largeur
+        self.assertEqual(''.join(modules), motif)
+
+    def test_normalisation(self):
+        self.assertEqual(ean13.normaliser('590123412345'), '590123412345')
+        self.assertEqual(ean13.normaliser(' 5901234123457 '), '590123412345')
+        self.assertEqual(ean13.normaliser('5 901234 123457'), '590123412345')
+        self.assertTrue(ean13.est_valide('5901234123457'))
+
+    def test_saisies_rejetees(self):
+        for saisie in ('5901234123458', '59012341234', '59012341234571', 'abcdefghijkl',
+                       '٥٩٠١٢٣٤١٢٣٤٥', '²90123412345', ''):
+            with self.subTest(saisie=saisie):
+                with self.assertRaises(ValueError):
+                    ean13.normaliser(saisie)
+                self.assertFalse(ean13.est_valide(saisie))
+
+
+class ImportProduitsTests(TestCase):
+
+    def importer(self, contenu, *options):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as fichier:
+            fichier.write(contenu)
+        self.addCleanup(os.remove, fichier.name)
+        call_command('import_produits', fichier.name, *options, stdout=StringIO(), stderr=StringIO())
+
+    def test_code_numerique_et_caches_des_workers(self):
+        # Index des noms et cache des prix déjà remplis, comme dans un worker web
+        index_noms.invalider()
+        index_noms.rechercher('popcorn')
+        self.assertIsNone(cache_prix().obtenir('123456789012'))
+
+        self.importer(
+            '{"nom": "Caramel sale", "prix": "3.00", "barcode": 123456789012}\n'
+            '{"nom": "Invalide", "prix": "1.00", "barcode": [1]}\n',
+            '--rendu', 'aucun',
+        )
+
+        produit = Produit.objects.get()
+        self.assertEqual(produit.barcode, '123456789012')
+        self.assertEqual(produit.barcode_image.name, '')
+        self.assertEqual(cache_prix().obtenir('123456789012').id, produit.id)
+        self.assertEqual([r['id'] for r in index_noms.rechercher('caramel')], [produit.id])
+
+
+class IndexNomsGenerationTests(TestCase):
+
+    def test_generation_changee_apres_construction(self):
+        popcorn = Produit.objects.create(nom='Popcorn caramel', prix='2.50')
+        index = IndexNoms()
+        self.assertEqual([r['id'] for r in index.rechercher('popcorn')], [popcorn.id])
+
+        incrementer_generation()
+        self.assertEqual([r['id'] for r in index.rechercher('popcorn')], [popcorn.id])
+
+    def test_index_rempli_a_la_main_reconstruit(self):
+        popcorn = Produit.objects.create(nom='Popcorn caramel', prix='2.50')
+        # Comme benchmarks/bench_recherche.py : rempli sans passer par la base
+        index = IndexNoms()
+        index.produits[0] = ('Savon', 1, None)
+        index.noms[0] = 'savon'
+        index.postings['savon'].add(0)
+        index._construit_le = time.monotonic()
+        index._generation = generation_catalogue()
+
+        incrementer_generation()
+        self.assertEqual([r['id'] for r in index.rechercher('popcorn')], [popcorn.id])
+        self.assertEqual(index.rechercher('savon'), [])
+
+
+@override_settings(BARCODE_RENDU_ASYNCHRONE=True)
+class RechercheTests(TestCase):
+
+    def setUp(self):
+        index_noms.invalider()
+        self.client.force_login(User.objects.create_user('caisse', password='caisse'))
+
+    def rechercher(self, q, **parametres):
+        reponse = self.client.get('/recherche/', {'q': q, **parametres})
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()['resultats']
+
+    def test_classement_et_fautes_de_frappe(self):
+        popcorn = Produit.objects.create(nom='Popcorn caramel', prix='2.50')
+        Produit.objects.create(nom='Popcorn salé', prix='2.20')
+        Produit.objects.create(nom='Caramel beurre salé', prix='3.10')
+        savon = Produit.objects.create(nom='Savon lavande', prix='1.00')
+
+        for requete in ['popcorn caramel', 'popcron caramle', 'CARAMEL POPCORN']:
+            with self.subTest(requete=requete):
+                resultats = self.rechercher(requete)
+                self.assertEqual(resultats[0]['id'], popcorn.id)
+                self.assertEqual(resultats[0]['ean13'], popcorn.ean13)
+                scores = [r['score'] for r in resultats]
+                self.assertEqual(scores, sorted(scores, reverse=True))
+                self.assertNotIn(savon.id, [r['id'] for r in resultats])
+
+        self.assertEqual([r['id'] for r in self.rechercher('savn')], [savon.id])
+        self.assertEqual(self.rechercher('xylophone'), [])
+        self.assertEqual(self.rechercher('  '), [])
+
+    def test_limite_bornee(self):
+        for i in range(60):
+            Produit.objects.create(nom=f'Biscuit {i}', prix='1.00')
+
+        self.assertEqual(len(self.rechercher('biscuit')), 10)
+        self.assertEqual(len(self.rechercher('biscuit', limite=500)), 50)
+        self.assertEqual(len(self.rechercher('biscuit', limite=0)), 1)
+        self.assertEqual(len(self.rechercher('biscuit', limite=-3)), 1)
+        self.assertEqual(self.client.get('/recherche/', {'q': 'biscuit', 'limite': 'x'}).status_code, 400)
+
+
+class ImageCodeBarreTests(TestCase):
+
+    def setUp(self):
+        rendu.cache_rendus().vider()
+
+    def test_rendu_sans_sql_et_immuable(self):
+        for extension, debut in [('svg', b'<svg'), ('png', b'\x89PNG')]:
+            with self.assertNumQueries(0):
+                reponse = self.client.get(f'/code-barre/5901234123457.{extension}')
+            self.assertEqual(reponse.status_code, 200)
+            self.assertEqual(reponse['Content-Type'], rendu.TYPES_MIME[extension])
+            self.assertEqual(reponse['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertTrue(reponse.content.startswith(debut))
+
+        # 12 ou 13 chiffres : même image, même ETag
+        douze = self.client.get('/code-barre/590123412345.svg')
+        treize = self.client.get('/code-barre/5901234123457.svg')
+        self.assertEqual(douze.content, treize.content)
+        self.assertEqual(douze['ETag'], treize['ETag'])
+
+    def test_304_si_etag_connu(self):
+        etag = self.client.get('/code-barre/5901234123457.png')['ETag']
+        reponse = self.client.get('/code-barre/5901234123457.png', headers={'If-None-Match': etag})
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(reponse['ETag'], etag)
+        self.assertEqual(reponse['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(reponse.content, b'')
+
+        # Autre format : autre ETag, rendu complet
+        self.assertEqual(
+            self.client.get('/code-barre/5901234123457.svg', headers={'If-None-Match': etag}).status_code, 200
+        )
+
+    def test_code_invalide(self):
+        self.assertEqual(self.client.get('/code-barre/5901234123458.svg').status_code, 404)
+
+    def test_cache_borne_en_octets(self):
+        cache = rendu.CacheRendus(taille_max=3000)
+        codes = [f'{i:012d}' for i in range(10)]
+        for code in codes:
+            cache.obtenir(code, 'svg')
+            self.assertLessEqual(cache.taille, cache.taille_max)
+        self.assertEqual(cache.taille, sum(len(contenu) for contenu in cache._entrees.values()))
+        # Les plus anciens sont évincés en premier
+        self.assertIn((codes[-1], 'svg'), cache._entrees)
+        self.assertNotIn((codes[0], 'svg'), cache._entrees)
+
+        # Un rendu plus grand que le cache est servi sans être gardé
+        petit = rendu.CacheRendus(taille_max=10)
+        self.assertTrue(petit.obtenir(codes[0], 'svg').startswith(b'<svg'))
+        self.assertEqual((petit.taille, len(petit._entrees)), (0, 0))
+
+
+class PlancheTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('gerant', password='gerant'))
+
+    def test_produit_sans_code_barre_ecarte(self):
+        popcorn = Produit.objects.create(nom='Popcorn', prix='2.50')
+        sans_code = Produit.objects.create(nom='Savon', prix='1.00')
+        Produit.objects.filter(pk=sans_code.pk).update(barcode=None, ean13=None)
+        ids = f'{popcorn.id},{sans_code.id}'
+
+        reponse = self.client.get('/produits/imprimer/', {'ids': ids})
+        self.assertContains(reponse, 'class="etiquette"', count=1)
+        self.assertNotContains(reponse, 'Savon')
+        reponse = self.client.get('/produits/imprimer/', {'ids': ids, 'format': 'pdf'})
+        self.assertTrue(b''.join(reponse.streaming_content).startswith(b'%PDF'))
+
+    def pdf(self, **parametres):
+        reponse = self.client.get('/produits/imprimer/', {'format': 'pdf', **parametres})
+        self.assertEqual(reponse['Content-Type'], 'application/pdf')
+        return b''.join(reponse.streaming_content)
+
+    def test_pdf_multi_pages_valide(self):
+        produits = [Produit.objects.create(nom=f'Produit {i}', prix='1.00') for i in range(5)]
+        pdf = self.pdf(ids=','.join(str(p.id) for p in produits), colonnes=2, lignes=1)
+
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertTrue(pdf.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 3 >>', pdf)
+        # Chaque entrée de la table xref désigne bien le début de son objet
+        debut_xref = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        entrees = pdf[debut_xref:].split(b'\n')[3:]
+        numero = 1
+        for entree in entrees:
+            if not entree.endswith(b' n '):
+                break
+            self.assertTrue(pdf[int(entree[:10]):].startswith(b'%d 0 obj' % numero), numero)
+            numero += 1
+        self.assertEqual(numero, 5 + 2 * 3)
+
+    def test_selection_par_dates(self):
+        Produit.objects.create(nom='Popcorn', prix='2.50')
+        aujourd_hui = timezone.localdate().isoformat()
+        reponse = self.client.get('/produits/imprimer/', {'du': aujourd_hui, 'au': aujourd_hui})
+        self.assertContains(reponse, 'class="etiquette"', count=1)
+        reponse = self.client.get('/produits/imprimer/', {'au': '2000-01-01'})
+        self.assertNotContains(reponse, 'class="etiquette"')
+
+    def test_parametres_invalides(self):
+        for parametres in [{}, {'ids': 'x'}, {'ids': '1,2x'}, {'id': str(2 ** 63)}, {'ids': f'-{2 ** 64}'},
+                           {'du': '2024-13-01'}, {'ids': '1', 'colonnes': '0'}, {'ids': '1', 'lignes': '31'}]:
+            with self.subTest(parametres=parametres):
+                self.assertEqual(self.client.get('/produits/imprimer/', parametres).status_code, 400)
+
+
+@override_settings(BARCODE_RENDU_ASYNCHRONE=True)
+class ListeProduitsTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('gerant', password='gerant'))
+
+    def test_curseur_invalide(self):
+        Produit.objects.create(nom='Popcorn', prix='2.50')
+        forges = ['["x", Infinity]', '["x", 1.5]', f'["x", {2 ** 64}]', '["x", -1]', '[1, 2]', '["x"]', '"zz"']
+        for curseur in [urlsafe_base64_encode(forge.encode()) for forge in forges] + ['zz', '%%']:
+            with self.subTest(curseur=curseur):
+                self.assertEqual(self.client.get('/produits/', {'apres': curseur}).status_code, 400)
+
+    def creer_produits(self):
+        # Noms répétés : l'ordre (nom, id) départage les ex aequo
+        return [Produit.objects.create(nom=f'Produit {i % 3}', prix=f'{i}.00') for i in range(11)]
+
+    @mock.patch.object(views, 'TAILLE_PAGE_PRODUITS', 4)
+    def test_pagination_par_cle(self):
+        attendus = [p.id for p in sorted(self.creer_produits(), key=lambda p: (p.nom, p.id))]
+
+        vus, pages, parametres = [], 0, {}
+        while True:
+            reponse = self.client.get('/produits/', parametres)
+            self.assertEqual(reponse.status_code, 200)
+            vus += [p.id for p in reponse.context['produits']]
+            pages += 1
+            if not reponse.context['suivant']:
+                break
+            parametres = {'apres': reponse.context['suivant']}
+        self.assertEqual(vus, attendus)
+        self.assertEqual(pages, 3)
+
+    def test_exports_complets(self):
+        attendus = [p.id for p in sorted(self.creer_produits(), key=lambda p: (p.nom, p.id))]
+
+        reponse = self.client.get('/produits/', {'format': 'csv'})
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        lignes = list(csv.reader(StringIO(b''.join(reponse.streaming_content).decode())))
+        self.assertEqual(lignes[0], views.COLONNES_EXPORT)
+        self.assertEqual([int(ligne[0]) for ligne in lignes[1:]], attendus)
+
+        reponse = self.client.get('/produits/', {'format': 'json'})
+        produits = json.loads(b''.join(reponse.streaming_content))
+        self.assertEqual([p['id'] for p in produits], attendus)
+        self.assertEqual(set(produits[0]), set(views.COLONNES_EXPORT))
+        self.assertEqual(len(produits[0]['ean13']), 13)
+
+
+class AllocateurSequentielTests(TransactionTestCase):
+    """ Hors TestCase : la réservation d'un bloc n'a lieu qu'en dehors de toute transaction englobante. """
+
+    def test_blocs_disjoints_et_sans_requete_dans_un_bloc(self):
+        poste_a = AllocateurSequentiel('200', taille_bloc=10)
+        poste_b = AllocateurSequentiel('200', taille_bloc=10)
+
+        self.assertEqual(poste_a.code(), '200000000000')
+        with CaptureQueriesContext(connection) as contexte:
+            codes_a = [poste_a.code() for _ in range(10)]
+        self.assertEqual(len(contexte.captured_queries), 0)
+        self.assertEqual(codes_a, [f'2000000000{n:02d}' for n in range(1, 11)])
+
+        # Le bloc du second poste commence après celui du premier
+        self.assertEqual(poste_b.code(), '200000000011')
+        self.assertEqual(poste_b.codes(3), ['200000000012', '200000000013', '200000000014'])
+        self.assertEqual(CompteurCodeBarre.objects.get(prefixe='200').prochain, 22)
+
+    def test_transaction_englobante_ne_garde_pas_de_bloc(self):
+        poste = AllocateurSequentiel('200', taille_bloc=10)
+        with transaction.atomic():
+            self.assertEqual(poste.codes(2), ['200000000000', '200000000001'])
+        self.assertEqual(CompteurCodeBarre.objects.get(prefixe='200').prochain, 2)
+
+    @override_settings(BARCODE_ALLOCATEUR='sequentiel', BARCODE_PREFIXE_GS1='299', BARCODE_RENDU_ASYNCHRONE=True)
+    def test_creation_avec_prefixe_gs1(self):
+        premier = Produit.objects.create(nom='Popcorn', prix='2.50')
+        second = Produit.objects.create(nom='Savon', prix='1.00')
+
+        self.assertTrue(premier.barcode.startswith('299'))
+        self.assertEqual(int(second.barcode), int(premier.barcode) + 1)
+        self.assertEqual(len(second.ean13), 13)
+
+
+@override_settings(BARCODE_RENDU_ASYNCHRONE=True)
+class ScanCodeTests(TestCase):
+
+    def setUp(self):
+        cache_prix().vider()
+        self.client.force_login(User.objects.create_user('caisse', password='caisse'))
+
+    def test_treize_chiffres_et_douze_chiffres(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50', barcode='123456789012')
+        self.assertEqual(produit.ean13, '1234567890128')
+
+        for code in (produit.ean13, produit.barcode):
+            reponse = self.client.get('/scan/', {'code_barre': code})
+            self.assertEqual(reponse.context['produit'].id, produit.id)
+            self.assertEqual(str(reponse.context['prix']), '2.50')
+
+    def test_checksum_faux_refuse_sans_requete(self):
+        Produit.objects.create(nom='Popcorn', prix='2.50', barcode='123456789012')
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.client.get('/scan/', {'code_barre': '1234567890121'})
+
+        self.assertIsNone(reponse.context['produit'])
+        self.assertIn('invalide', reponse.context['message'])
+        self.assertFalse(any('app_produit' in sql for sql in requetes_sql(contexte)))
+
+
+@override_settings(SCAN_API_JETONS=['jeton'], BARCODE_RENDU_ASYNCHRONE=True)
+class ScanEtagTests(TestCase):
+
+    def scanner(self, code, **entetes):
+        return self.client.get(f'/api/scan/{code}/', headers={'Authorization': 'Token jeton', **entetes})
+
+    def setUp(self):
+        cache_prix().vider()
+
+    def test_304_sans_requete_puis_200_apres_enregistrement(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        etag = self.scanner(produit.ean13)['ETag']
+
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.scanner(produit.ean13, **{'If-None-Match': etag})
+        self.assertEqual(reponse.status_code, 304)
+        self.assertEqual(len(contexte.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.prix = '3.00'
+            produit.save()
+        reponse = self.scanner(produit.ean13, **{'If-None-Match': etag})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()['prix'], '3.00')
+        self.assertNotEqual(reponse['ETag'], etag)
+
+    def test_suppression_change_aussi_l_etag(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        etag = self.scanner(produit.ean13)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.delete()
+        self.assertEqual(self.scanner(produit.ean13, **{'If-None-Match': etag}).status_code, 404)
+
+
+@override_settings(SCAN_API_JETONS=['jeton'], BARCODE_RENDU_ASYNCHRONE=True)
+class ScanLotTests(TestCase):
+
+    def scanner_lot(self, corps):
+        return self.client.post(
+            '/api/scan-lot/', json.dumps(corps), content_type='application/json',
+            headers={'Authorization': 'Token jeton'},
+        )
+
+    def setUp(self):
+        cache_prix().vider()
+
+    def test_trouves_inconnus_et_invalides_en_une_requete(self):
+        popcorn = Produit.objects.create(nom='Popcorn', prix='2.50')
+        savon = Produit.objects.create(nom='Savon', prix='1.00')
+
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.scanner_lot({'codes': [popcorn.ean13, savon.barcode, '000000000000', '12']})
+
+        resultats = reponse.json()['resultats']
+        self.assertEqual(resultats[popcorn.ean13]['id'], popcorn.id)
+        self.assertEqual(resultats[savon.barcode]['prix'], '1.00')
+        self.assertIsNone(resultats['000000000000'])
+        self.assertIn('erreur', resultats['12'])
+        self.assertEqual(len(requetes_sql(contexte)), 1)
+
+        # Le code inconnu est aussi en cache : le second lot ne lit plus la base
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.scanner_lot({'codes': ['000000000000', popcorn.barcode]})
+        self.assertIsNone(reponse.json()['resultats']['000000000000'])
+        self.assertEqual(len(contexte.captured_queries), 0)
+
+    def test_corps_invalide(self):
+        self.assertEqual(self.scanner_lot({'codes': '123456789012'}).status_code, 400)
+        self.assertEqual(self.scanner_lot({'autre': []}).status_code, 400)
+        self.assertEqual(self.scanner_lot({'codes': ['0'] * (api.SCAN_LOT_MAX + 1)}).status_code, 400)
+
+
+@override_settings(BARCODE_RENDU_ASYNCHRONE=True)
+class CachePrixTests(TestCase):
+
+    def setUp(self):
+        cache_prix().vider()
+
+    def test_prix_modifie_invalide(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        self.assertEqual(str(cache_prix().obtenir(produit.barcode).prix), '2.50')
+
+        # Instance rechargée : l'invalidation ne dépend pas de l'objet qui a rempli le cache
+        autre = Produit.objects.get(pk=produit.pk)
+        autre.prix = '9.00'
+        autre.save()
+        with CaptureQueriesContext(connection) as contexte:
+            self.assertEqual(str(cache_prix().obtenir(produit.barcode).prix), '9.00')
+        self.assertEqual(len(contexte.captured_queries), 1)
+
+    def test_changement_de_code_invalide_l_ancien(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50', barcode='111111111111')
+        self.assertIsNone(cache_prix().obtenir('222222222222'))
+        self.assertEqual(cache_prix().obtenir('111111111111').id, produit.id)
+
+        produit = Produit.objects.get(pk=produit.pk)
+        produit.barcode = '222222222222'
+        produit.save()
+
+        self.assertIsNone(cache_prix().obtenir('111111111111'))
+        self.assertEqual(cache_prix().obtenir('222222222222').id, produit.id)
+
+    @override_settings(SCAN_API_JETONS=['jeton'])
+    def test_deux_workers_ni_304_ni_200_perime(self):
+        worker_a, worker_b = CachePrixLocal(100, 300), CachePrixLocal(100, 300)
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+
+        def scanner(worker, **entetes):
+            with mock.patch('app.api.cache_prix', return_value=worker):
+                return self.client.get(f'/api/scan/{produit.ean13}/', headers={'Authorization': 'Token jeton', **entetes})
+
+        etag = scanner(worker_b)['ETag']
+        # Enregistrement traité par le worker A : les signaux n'invalident que son cache
+        with mock.patch('app.signals.cache_prix', return_value=worker_a), \
+                self.captureOnCommitCallbacks(execute=True):
+            produit.prix = '3.00'
+            produit.save()
+
+        for entetes in ({'If-None-Match': etag}, {}):
+            reponse = scanner(worker_b, **entetes)
+            self.assertEqual(reponse.status_code, 200)
+            self.assertEqual(reponse.json()['prix'], '3.00')
+        self.assertEqual(scanner(worker_b, **{'If-None-Match': reponse['ETag']}).status_code, 304)
+
+    def test_valeur_lue_sous_une_generation_depassee_non_gardee(self):
+        cache = CachePrixLocal(100, 300)
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        cache.obtenir(produit.barcode, generation=2)
+
+        # Lecture commencée avant le changement de génération, terminée après
+        cache._ecrire({produit.barcode: None}, generation=1)
+        self.assertEqual(cache.obtenir(produit.barcode, generation=2).id, produit.id)
+
+    def test_suppression_invalide(self):
+        produit = Produit.objects.create(nom='Popcorn', prix='2.50')
+        cache_prix().obtenir(produit.barcode)
+
+        produit.delete()
+        self.assertIsNone(cache_prix().obtenir(produit.barcode))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT_TEST, CATALOGUE_INTERVALLE_MIN=0, BARCODE_RENDU_ASYNCHRONE=True)
+class CatalogueDeltaTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT_TEST, ignore_errors=True)
+
+    def setUp(self):
+        api.delta_entre.cache_clear()
+        self.client.force_login(User.objects.create_user('terminal', password='terminal'))
+
+    def instantane(self):
+        reponse = self.client.get('/api/catalogue/')
+        contenu = json.loads(gzip.decompress(b''.join(reponse.streaming_content)))
+        return int(reponse['X-Catalogue-Version']), contenu
+
+    def test_delta_depuis_une_version(self):
+        popcorn = Produit.objects.create(nom='Popcorn', prix='2.50')
+        savon = Produit.objects.create(nom='Savon', prix='1.00')
+        version, contenu = self.instantane()
+        self.assertEqual(len(contenu['produits']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            savon.prix = '1.20'
+            savon.save()
+            popcorn.delete()
+            sel = Produit.objects.create(nom='Sel', prix='0.80')
+
+        delta = self.client.get('/api/catalogue/delta/', {'depuis': version}).json()
+        self.assertEqual(delta['depuis'], version)
+        self.assertGreater(delta['version'], version)
+        self.assertEqual(delta['supprimes'], [popcorn.ean13])
+        modifies = {ligne[delta['colonnes'].index('code')]: ligne for ligne in delta['modifies']}
+        self.assertEqual(set(modifies), {savon.ean13, sel.ean13})
+
+        # Déjà à jour : delta vide
+        delta = self.client.get('/api/catalogue/delta/', {'depuis': delta['version']}).json()
+        self.assertEqual((delta['modifies'], delta['supprimes']), ([], []))
+
+    def test_version_inconnue_ou_invalide(self):
+        Produit.objects.create(nom='Popcorn', prix='2.50')
+        version, _ = self.instantane()
+
+        self.assertEqual(self.client.get('/api/catalogue/delta/', {'depuis': version + 1}).status_code, 410)
+        self.assertEqual(self.client.get('/api/catalogue/delta/', {'depuis': 'x'}).status_code, 400)
+
+    @override_settings(CATALOGUE_INTERVALLE_MIN=0)
+    def test_une_seule_version_entre_workers(self):
+        Produit.objects.create(nom='Popcorn', prix='2.50')
+        premiere = catalogue.instantane_courant()
+        with self.captureOnCommitCallbacks(execute=True):
+            Produit.objects.create(nom='Savon', prix='1.00')
+
+        # Un autre worker publie le successeur pendant que celui-ci relit le catalogue
+        lignes_catalogue = catalogue.lignes_catalogue
+
+        def concurrent():
+            lignes = lignes_catalogue()
+            with mock.patch.object(catalogue, 'lignes_catalogue', lignes_catalogue):
+                self.autre = catalogue.instantane_courant()
+            return lignes
+
+        with mock.patch.object(catalogue, 'lignes_catalogue', side_effect=concurrent):
+            courant = catalogue.instantane_courant()
+
+        self.assertEqual(self.autre.precedent, premiere.pk)
+        self.assertEqual(courant, self.autre)
+        self.assertEqual(InstantaneCatalogue.objects.filter(precedent=premiere.pk).count(), 1)
+
+
+@override_settings(CHANGEMENTS_MARGE=0, BARCODE_RENDU_ASYNCHRONE=True)
+class ChangementsTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('terminal', password='terminal'))
+
+    def lire(self, curseur=None, limite=None):
+        parametres = {'curseur': curseur or ''}
+        if limite is not None:
+            parametres['limite'] = limite
+        return self.client.get('/api/changements/', parametres)
+
+    def tout_lire(self, curseur=None, limite=2):
+        """ Rappelle le flux avec le curseur renvoyé jusqu'à termine. """
+        changements = []
+        while True:
+            page = self.lire(curseur, limite).json()
+            changements += page['changements']
+            curseur = page['curseur']
+            if page['termine']:
+                return changements, curseur
+
+    def test_pierres_tombales_et_reprise_au_curseur(self):
+        produits = [Produit.objects.create(nom=f'Produit {n}', prix='1.00') for n in range(5)]
+        ids = [produit.id for produit in produits]
+        produits[1].delete()
+        produits[2].prix = '7.00'
+        produits[2].save()
+
+        changements, curseur = self.tout_lire()
+        self.assertEqual(
+            [(c['type'], c['id']) for c in changements],
+            [('modifie', ids[n]) for n in (0, 3, 4)] + [('supprime', ids[1]), ('modifie', ids[2])],
+        )
+        self.assertEqual(changements[3]['code'], produits[1].ean13)
+        self.assertEqual(ProduitSupprime.objects.get().produit_id, ids[1])
+
+        # Reprise : rien de neuf, puis seulement ce qui a changé depuis le curseur
+        self.assertEqual(self.lire(curseur).json()['changements'], [])
+        produits[3].nom = 'Zèbre'
+        produits[3].save()
+        produits[4].delete()
+        changements, _ = self.tout_lire(curseur)
+        self.assertEqual(
+            [(c['type'], c['id']) for c in changements],
+            [('modifie', ids[3]), ('supprime', ids[4])],
+        )
+        self.assertEqual(changements[0]['nom'], 'Zèbre')
+
+    def test_limite_et_curseur_invalides(self):
+        Produit.objects.create(nom='Popcorn', prix='1.00')
+        Produit.objects.create(nom='Savon', prix='1.00')
+
+        page = self.lire(limite=0).json()
+        self.assertEqual(len(page['changements']), 1)
+        self.assertFalse(page['termine'])
+        self.assertEqual(len(self.lire(limite=-5).json()['changements']), 1)
+        self.assertEqual(self.lire(limite='x').status_code, 400)
+        self.assertEqual(self.lire('pas-un-curseur').status_code, 400)
+
+    def test_curseurs_forges(self):
+        forges = [
+            '["2026-01-01T00:00:00+00:00", 0, Infinity]',
+            '["2026-01-01T00:00:00+00:00", Infinity, 1]',
+            f'["2026-01-01T00:00:00+00:00", 0, {2 ** 64}]',
+            '["2026-01-01T00:00:00+00:00", 2, 1]',
+            '["2026-01-01T00:00:00", 0, 1]',
+            '["pas une date", 0, 1]',
+            '[1, 0, 1]',
+        ]
+        for forge in forges:
+            with self.subTest(curseur=forge):
+                self.assertEqual(self.lire(urlsafe_base64_encode(forge.encode())).status_code, 400)
+        curseur = urlsafe_base64_encode(b'["2026-01-01T00:00:00+00:00", 0, 1]')
+        self.assertEqual(self.lire(curseur).status_code, 200)
+
+
+class MesureRequetesTests(TestCase):
+
+    def setUp(self):
+        histogrammes().vider()
+        self.gerant = User.objects.create_user('gerant', password='gerant')
+        Produit.objects.create(nom='Popcorn', prix='2.50')
+
+    def requetes_annoncees(self, reponse):
+        """ Nombre de requêtes SQL de l'en-tête Server-Timing. """
+        trouve = re.search(r'db;dur=[0-9.]+;desc="(\d+) SQL"', reponse['Server-Timing'])
+        self.assertTrue(trouve, reponse['Server-Timing'])
+        return int(trouve.group(1))
+
+    def test_server_timing_compte_les_requetes(self):
+        self.assertEqual(self.requetes_annoncees(self.client.get('/code-barre/5901234123457.svg')), 0)
+
+        self.client.force_login(self.gerant)
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.client.get('/produits/')
+        self.assertEqual(self.requetes_annoncees(reponse), len(contexte.captured_queries))
+        self.assertGreater(len(contexte.captured_queries), 0)
+        self.assertRegex(reponse['Server-Timing'], r'^total;dur=[0-9.]+, ')
+
+    async def test_vue_asynchrone_et_orm_dans_un_thread(self):
+        await self.async_client.aforce_login(self.gerant)
+        reponse = await self.async_client.get('/produits/')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertGreater(self.requetes_annoncees(reponse), 0)
+
+    def test_metriques_par_vue_reservees_au_staff(self):
+        self.client.force_login(self.gerant)
+        for _ in range(3):
+            nombre = self.requetes_annoncees(self.client.get('/produits/'))
+
+        self.assertEqual(self.client.get('/api/metriques/').status_code, 302)
+        self.gerant.is_staff = True
+        self.gerant.save()
+        resume = self.client.get('/api/metriques/').json()
+        liste = resume['app:liste_produits']
+        self.assertEqual((liste['total'], liste['fenetre']), (3, 3))
+        self.assertEqual(liste['requetes']['p50'], nombre)
+        self.assertGreater(liste['octets']['p50'], 0)
+
+        self.client.get('/api/metriques/', {'vider': 1})
+        self.assertNotIn('app:liste_produits', self.client.get('/api/metriques/').json())
+
+
+class RegistreTests(TestCase):
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+        self.registre = Registre()
+        self.scans = self.registre.compteur('test_scans_total', "Scans.", ('canal',))
+        self.rendu = self.registre.histogramme('test_rendu_secondes', "Rendu.", seuils=(0.1, 1.0))
+
+    def ecrire(self, nom, valeurs):
+        with open(os.path.join(self.dossier, nom), 'w') as fichier:
+            json.dump(valeurs, fichier)
+
+    def test_fichiers_des_processus_et_archive_additionnes(self):
+        with override_settings(METRIQUES_DOSSIER=self.dossier):
+            self.ecrire('111.json', {'test_scans_total': {'test_scans_total{canal="api"}': 2}})
+            self.ecrire('222.json', {'test_scans_total': {
+                'test_scans_total{canal="api"}': 3, 'test_scans_total{canal="lot"}': 1,
+            }})
+            self.ecrire('archive.json', {'test_scans_total': {'test_scans_total{canal="api"}': 10}})
+            self.scans.inc(canal='api')
+            self.rendu.observer(0.5)
+            texte = self.registre.exposer()
+            self.registre.archiver()
+            apres_archivage = self.registre.exposer()
+
+        self.assertIn('test_scans_total{canal="api"} 16', texte)
+        self.assertIn('test_scans_total{canal="lot"} 1', texte)
+        self.assertIn('test_rendu_secondes_bucket{le="0.1"} 0', texte)
+        self.assertIn('test_rendu_secondes_bucket{le="1"} 1', texte)
+        self.assertEqual(apres_archivage, texte)
+        self.assertNotIn(f'{os.getpid()}.json', os.listdir(self.dossier))
+
+    def test_fichier_laisse_au_meme_pid_verse_dans_l_archive(self):
+        with override_settings(METRIQUES_DOSSIER=self.dossier):
+            # Processus arrêté sans archiver, dont le pid est repris par ce processus
+            self.ecrire(f'{os.getpid()}.json', {'test_scans_total': {'test_scans_total{canal="api"}': 5}})
+            self.scans.inc(canal='api')
+            texte = self.registre.exposer()
+            self.registre.archiver()
+
+        self.assertIn('test_scans_total{canal="api"} 6', texte)
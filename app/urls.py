@@ -1,10 +1,14 @@
-from django.urls import path 
+from django.conf import settings
+from django.urls import path , re_path
 from .views import login , dashboard , deco , produitAdd , imprimer_code_barre
-from . import views
+from . import api, views
 
 
 app_name = 'app'
 
+# Sous ASGI, les vues asynchrones du scan ne mobilisent aucun thread pendant les attentes
+ASYNCHRONE = settings.SERVEUR_ASYNCHRONE
+
 
 urlpatterns = [
     path('', views.home , name='home'),
@@ -16,12 +20,35 @@ urlpatterns = [
     path('nouveau/', views.enregistrer_produit, name='enregistrer_produit'),
     
     # Chemin pour simuler le scan et afficher le prix (recherche par code-barres)
-    path('scan/', views.scanner_code_barre, name='scanner_code_barre'),
+    path('scan/', views.scanner_code_barre_asynchrone if ASYNCHRONE else views.scanner_code_barre, name='scanner_code_barre'),
+    
+    # API JSON de scan (session ou jeton), avec ETag / If-None-Match
+    path('api/scan/<str:code>/', api.api_scan_asynchrone if ASYNCHRONE else api.api_scan, name='api_scan'),
+    path('api/scan-lot/', api.api_scan_lot_asynchrone if ASYNCHRONE else api.api_scan_lot, name='api_scan_lot'),
+    path('api/cache-prix/', views.statistiques_cache_prix, name='statistiques_cache_prix'),
+    path('api/metriques/', views.metriques_vues, name='metriques_vues'),
+    path('metrics', views.metriques_prometheus, name='metriques_prometheus'),
+
+    # Catalogue pour les terminaux hors ligne : instantané complet et delta entre versions
+    path('api/catalogue/', api.api_catalogue, name='api_catalogue'),
+    path('api/catalogue/delta/', api.api_catalogue_delta, name='api_catalogue_delta'),
+
+    # Flux des changements (modifications et suppressions) depuis un curseur
+    path('api/changements/', api.api_changements, name='api_changements'),
+
+    # Recherche approximative par nom (JSON)
+    path('recherche/', views.recherche_produits_asynchrone if ASYNCHRONE else views.recherche_produits, name='recherche_produits'),
     
     # Chemin pour afficher le code-barres en vue d'impression
     path('produit/<int:produit_id>/imprimer/', imprimer_code_barre, name='imprimer_code_barre'),
+
+    # Planches d'étiquettes A4 pour plusieurs produits (HTML ou PDF en flux)
+    path('produits/imprimer/', views.imprimer_planche, name='imprimer_planche'),
+
+    # Image du code-barres rendue à la demande (12 ou 13 chiffres, svg ou png)
+    re_path(r'^code-barre/(?P<code>\d{12,13})\.(?P<extension>svg|png)$', views.image_code_barre, name='image_code_barre'),
     
-    # Chemin d'accueil (optionnel)
-    path('', views.liste_produits, name='liste_produits'),
+    # Liste paginée des produits (et export CSV / JSON en flux)
+    path('produits/', views.liste_produits, name='liste_produits'),
 ]
 
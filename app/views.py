@@ -1,10 +1,30 @@
+import csv
+import hmac
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render , get_object_or_404  , redirect
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.http import require_GET
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate , login as auth , logout 
 from .forms import LoginForm
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from .models import Produit
 from .forms import ProduitForm
+from . import ean13, rendu
+from .planche_pdf import generer_planches
+from .recherche import index_noms
+from .cache_prix import cache_prix
+from .metriques import histogrammes
+from .registre import SCANS, registre
 from django.urls import reverse
 
 
@@ -82,53 +102,135 @@ def enregistrer_produit(request):
     return render(request, 'back/enregistrement_produit.html', context)
 
 # --- B. SCAN / RECHERCHE DE PRIX ---
+def contexte_scan(code_entree, produit=None, suggestions=(), invalide=False):
+    """ Contexte de resultat_scan.html, commun aux versions synchrone et asynchrone du scan. """
+    if not code_entree:
+        message = "Veuillez scanner un code-barres."
+    elif invalide:
+        message = f"Code-barres invalide : {code_entree}"
+        SCANS.inc(canal='page', resultat='invalide')
+    elif produit:
+        message = f"Prix trouvé pour {produit.nom}."
+        SCANS.inc(canal='page', resultat='trouve')
+    elif suggestions:
+        message = f"{len(suggestions)} produit(s) proche(s) de « {code_entree} »."
+    elif ean13.est_numerique(code_entree.replace(' ', '')):
+        message = f"Aucun produit trouvé avec le code : {code_entree}"
+        SCANS.inc(canal='page', resultat='inconnu')
+    else:
+        message = f"Aucun produit trouvé avec le nom : {code_entree}"
+    return {
+        'produit': produit,
+        'prix': produit.prix if produit else None,
+        'code_entree': code_entree,
+        'suggestions': suggestions,
+        'message': message,
+    }
+
+
 @login_required()
 def scanner_code_barre(request):
     """
     Recherche un produit par son code-barres (code de 12 ou 13 chiffres) et affiche son prix.
+    Une saisie non numérique (étiquette abîmée) lance une recherche approximative par nom.
     """
-    produit = None
-    prix = None
     # L'entrée est généralement un champ de formulaire ou un paramètre GET
-    code_entree = request.GET.get('code_barre', '').strip() 
+    code_entree = request.GET.get('code_barre', '').strip()
+
+    if code_entree and not ean13.est_numerique(code_entree.replace(' ', '')):
+        contexte = contexte_scan(code_entree, suggestions=index_noms.rechercher(code_entree))
 
-    if code_entree:
+    elif code_entree:
         try:
-            # Pour la recherche, nous devons rechercher à la fois les 12 chiffres stockés 
-            # ET le code complet de 13 chiffres généré à la volée.
-            # On utilise F() pour comparer le code entré avec la valeur générée.
-            
-            # Recherche simple sur les 12 chiffres stockés
-            if len(code_entree) == 12:
-                produit = Produit.objects.get(barcode=code_entree)
-            
-            # Si l'utilisateur scanne les 13 chiffres (le code complet)
-            elif len(code_entree) == 13:
-                # Filtrer tous les produits et vérifier si le code complet correspond
-                # C'est moins performant, mais garantit la recherche sur 13 chiffres.
-                produits_candidats = Produit.objects.all()
-                for p in produits_candidats:
-                    if p.get_full_barcode() == code_entree:
-                        produit = p
-                        break
-            
-            if produit:
-                prix = produit.prix
-                message = f"Prix trouvé pour {produit.nom}."
-            else:
-                message = f"Aucun produit trouvé avec le code : {code_entree}"
-                
-        except Produit.DoesNotExist:
-            message = f"Aucun produit trouvé avec le code : {code_entree}"
-        
-    context = {
-        'produit': produit, 
-        'prix': prix, 
-        'code_entree': code_entree,
-        'message': message if 'message' in locals() else "Veuillez scanner un code-barres."
-    }
-    return render(request, 'back/resultat_scan.html', context) 
-    
+            # Validation et normalisation sans requête : 12 chiffres, ou 13 chiffres
+            # avec un checksum correct, ramenés aux 12 chiffres de données stockés.
+            code = ean13.normaliser(code_entree)
+        except ValueError:
+            contexte = contexte_scan(code_entree, invalide=True)
+        else:
+            # Cache des prix, puis recherche indexée sur les 12 chiffres stockés
+            # (même chemin pour 12 et 13 chiffres)
+            contexte = contexte_scan(code_entree, cache_prix().obtenir(code))
+
+    else:
+        contexte = contexte_scan(code_entree)
+    return render(request, 'back/resultat_scan.html', contexte)
+
+
+@login_required()
+async def scanner_code_barre_asynchrone(request):
+    """
+    Version asynchrone de scanner_code_barre, routée à sa place sous ASGI :
+    la session est lue par request.auser() (login_required) et le prix par l'ORM asynchrone.
+    """
+    code_entree = request.GET.get('code_barre', '').strip()
+
+    if code_entree and not ean13.est_numerique(code_entree.replace(' ', '')):
+        # Index en mémoire, mais un rattrapage sur le flux des changements lit la base
+        contexte = contexte_scan(code_entree, suggestions=await sync_to_async(index_noms.rechercher)(code_entree))
+
+    elif code_entree:
+        try:
+            code = ean13.normaliser(code_entree)
+        except ValueError:
+            contexte = contexte_scan(code_entree, invalide=True)
+        else:
+            contexte = contexte_scan(code_entree, await cache_prix().aobtenir(code))
+
+    else:
+        contexte = contexte_scan(code_entree)
+    return render(request, 'back/resultat_scan.html', contexte)
+
+@staff_member_required
+def statistiques_cache_prix(request):
+    """ Compteurs succès / échecs du cache des prix de ce worker, pour le dimensionner. """
+    return JsonResponse(cache_prix().statistiques())
+
+@staff_member_required
+def metriques_vues(request):
+    """
+    Centiles p50 / p95 / p99 par vue (durée, requêtes SQL, temps SQL, octets) sur
+    les dernières requêtes de ce worker ; ?vider=1 remet les histogrammes à zéro.
+    """
+    if request.GET.get('vider'):
+        histogrammes().vider()
+    return JsonResponse(histogrammes().resume())
+
+def metriques_prometheus(request):
+    """
+    Compteurs, jauges et histogrammes de tous les workers au format texte de Prometheus.
+    Accès : en-tête « Authorization: Bearer <METRIQUES_JETON> » ou compte staff.
+    """
+    jeton = settings.METRIQUES_JETON
+    entete = request.headers.get('Authorization', '')
+    if not ((jeton and hmac.compare_digest(entete, f'Bearer {jeton}')) or request.user.is_staff):
+        return HttpResponse("Authentification requise.", status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(registre.exposer(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- B bis. RECHERCHE PAR NOM ---
+@login_required()
+def recherche_produits(request):
+    """
+    Recherche approximative par nom (?q=...&limite=10), pour les étiquettes illisibles.
+    """
+    requete = request.GET.get('q', '').strip()
+    try:
+        limite = max(1, min(int(request.GET.get('limite', 10)), 50))
+    except ValueError:
+        return HttpResponseBadRequest("limite doit être un entier.")
+    return JsonResponse({'q': requete, 'resultats': index_noms.rechercher(requete, limite)})
+
+@login_required()
+async def recherche_produits_asynchrone(request):
+    """ Version asynchrone de recherche_produits, routée à sa place sous ASGI. """
+    requete = request.GET.get('q', '').strip()
+    try:
+        limite = max(1, min(int(request.GET.get('limite', 10)), 50))
+    except ValueError:
+        return HttpResponseBadRequest("limite doit être un entier.")
+    resultats = await sync_to_async(index_noms.rechercher)(requete, limite)
+    return JsonResponse({'q': requete, 'resultats': resultats})
+
 # --- C. IMPRESSION ---
 def imprimer_code_barre(request, produit_id):
     """
@@ -136,13 +238,178 @@ def imprimer_code_barre(request, produit_id):
     """
     produit = get_object_or_404(Produit, pk=produit_id) 
     
-    # 
+    # L'image est servie par image_code_barre, rendue à la demande si besoin
     return render(request, 'back/imprimer_barcode.html', {'produit': produit})
 
+# --- C bis. IMAGE DU CODE-BARRES À LA DEMANDE ---
+@require_GET
+def image_code_barre(request, code, extension):
+    """
+    Rend le code EAN-13 en SVG ou PNG à partir des seuls chiffres, sans requête SQL.
+    La réponse ne change jamais pour un même code : ETag fort et cache immuable.
+    """
+    try:
+        code = ean13.normaliser(code)
+    except ValueError:
+        raise Http404("Code-barres invalide")
+
+    etag = rendu.etag(code, extension)
+    entetes = {
+        'ETag': etag,
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        reponse = HttpResponseNotModified()
+    else:
+        contenu = rendu.cache_rendus().obtenir(code, extension)
+        reponse = HttpResponse(contenu, content_type=rendu.TYPES_MIME[extension])
+    for entete, valeur in entetes.items():
+        reponse[entete] = valeur
+    return reponse
+
+# --- C ter. IMPRESSION PAR PLANCHES ---
+def produits_pour_planche(parametres):
+    """
+    Sélection des produits à étiqueter : ?id=1&id=2 ou ?ids=1,2,3, et/ou une
+    plage de dates de création ?du=AAAA-MM-JJ&au=AAAA-MM-JJ. Lève ValueError
+    si aucun filtre n'est donné ou si un paramètre est invalide. Les produits
+    sans code-barres n'ont pas d'étiquette et sont écartés.
+    """
+    ids = parametres.getlist('id') + [i for i in parametres.get('ids', '').split(',') if i.strip()]
+    du, au = parametres.get('du'), parametres.get('au')
+    if not (ids or du or au):
+        raise ValueError("Indiquez des identifiants (id, ids) ou une plage de dates (du, au).")
+
+    produits = (
+        Produit.objects.exclude(barcode__isnull=True).exclude(barcode='')
+        .only('id', 'nom', 'prix', 'barcode', 'ean13', 'barcode_image')
+    )
+    if ids:
+        entiers = [int(i) for i in ids]
+        # Au-delà d'un entier 64 bits signé, la base lèverait OverflowError
+        trop_grands = [i for i in entiers if abs(i) >= 2 ** 63]
+        if trop_grands:
+            raise ValueError(f"Identifiant invalide : {trop_grands[0]}")
+        produits = produits.filter(pk__in=entiers)
+    for parametre, valeur, lookup in [('du', du, 'date_creation__date__gte'), ('au', au, 'date_creation__date__lte')]:
+        if valeur:
+            date = parse_date(valeur)
+            if date is None:
+                raise ValueError(f"Date invalide pour {parametre} : {valeur}")
+            produits = produits.filter(**{lookup: date})
+    return produits.order_by('nom', 'id')
+
+
+@login_required()
+def imprimer_planche(request):
+    """
+    Imprime les étiquettes de plusieurs produits sur des planches A4.
+    Les produits sont lus en une seule requête ; ?format=pdf envoie un PDF
+    multi-pages en flux, sans garder toutes les étiquettes en mémoire.
+    """
+    try:
+        produits = produits_pour_planche(request.GET)
+        colonnes = int(request.GET.get('colonnes', 4))
+        lignes = int(request.GET.get('lignes', 11))
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    if not (1 <= colonnes <= 10 and 1 <= lignes <= 30):
+        return HttpResponseBadRequest("colonnes doit être entre 1 et 10, lignes entre 1 et 30.")
+
+    if request.GET.get('format') == 'pdf':
+        reponse = StreamingHttpResponse(
+            generer_planches(produits.iterator(chunk_size=500), colonnes, lignes),
+            content_type='application/pdf',
+        )
+        reponse['Content-Disposition'] = 'inline; filename="etiquettes.pdf"'
+        return reponse
+
+    context = {
+        'produits': produits,
+        'colonnes': colonnes,
+        'par_page': colonnes * lignes,
+        'hauteur_mm': 287 / lignes,
+    }
+    return render(request, 'back/imprimer_planche.html', context)
+
 # --- D. LISTE (Optionnel) ---
+TAILLE_PAGE_PRODUITS = 50
+COLONNES_EXPORT = ['id', 'nom', 'prix', 'barcode', 'ean13', 'date_creation']
+
+
+def encoder_curseur(produit):
+    """ Curseur opaque de pagination par clé : position (nom, id) du dernier produit affiché. """
+    return urlsafe_base64_encode(json.dumps([produit.nom, produit.id]).encode())
+
+
+def decoder_curseur(curseur):
+    """ Renvoie (nom, id) ; lève ValueError si le curseur n'a pas été produit par encoder_curseur. """
+    nom, produit_id = json.loads(urlsafe_base64_decode(curseur))
+    # json.loads accepte Infinity, les flottants et les entiers au-delà de la colonne id
+    if not (isinstance(nom, str) and type(produit_id) is int and 0 <= produit_id < 2 ** 63):
+        raise ValueError("Curseur de pagination invalide.")
+    return nom, produit_id
+
+
+class Echo:
+    """ Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de la stocker. """
+    def write(self, valeur):
+        return valeur
+
+
+def exporter_produits(format_export):
+    """
+    Export complet en flux (CSV ou JSON) : les lignes sont lues par paquets
+    avec iterator(chunk_size=...) sans jamais charger toute la table.
+    """
+    lignes = Produit.objects.order_by('nom', 'id').values_list(*COLONNES_EXPORT).iterator(chunk_size=2000)
+
+    if format_export == 'csv':
+        writer = csv.writer(Echo())
+        contenu = itertools.chain(
+            [writer.writerow(COLONNES_EXPORT)],
+            (writer.writerow(ligne) for ligne in lignes),
+        )
+        reponse = StreamingHttpResponse(contenu, content_type='text/csv; charset=utf-8')
+        reponse['Content-Disposition'] = 'attachment; filename="produits.csv"'
+        return reponse
+
+    def json_en_flux():
+        yield '['
+        for rang, ligne in enumerate(lignes):
+            yield (',' if rang else '') + json.dumps(dict(zip(COLONNES_EXPORT, ligne)), cls=DjangoJSONEncoder)
+        yield ']'
+
+    return StreamingHttpResponse(json_en_flux(), content_type='application/json')
+
+
+@login_required()
 def liste_produits(request):
     """
-    Affiche la liste de tous les produits.
+    Affiche la liste des produits, page par page (pagination par clé sur (nom, id)).
+    ?apres=<curseur> donne la page suivante ; ?format=csv|json exporte tout en flux.
     """
-    produits = Produit.objects.all()
-    return render(request, 'produits/liste_produits.html', {'produits': produits})
+    format_export = request.GET.get('format')
+    if format_export in ('csv', 'json'):
+        return exporter_produits(format_export)
+
+    produits = Produit.objects.only('id', 'nom', 'prix', 'barcode', 'ean13', 'date_creation').order_by('nom', 'id')
+    curseur = request.GET.get('apres')
+    if curseur:
+        try:
+            nom, produit_id = decoder_curseur(curseur)
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Curseur de pagination invalide.")
+        # Parcours de l'index (nom, id) à partir de la dernière position affichée
+        produits = produits.filter(Q(nom__gt=nom) | Q(nom=nom, id__gt=produit_id))
+
+    # Une ligne de plus pour savoir s'il existe une page suivante, sans COUNT(*)
+    page = list(produits[:TAILLE_PAGE_PRODUITS + 1])
+    suivant = encoder_curseur(page[TAILLE_PAGE_PRODUITS - 1]) if len(page) > TAILLE_PAGE_PRODUITS else None
+
+    context = {
+        'produits': page[:TAILLE_PAGE_PRODUITS],
+        'suivant': suivant,
+        'premiere_page': not curseur,
+    }
+    return render(request, 'back/liste_produits.html', context)
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark : checksum EAN-13 en arithmétique pure (app.ean13)
+contre la construction d'un objet python-barcode à chaque appel.
+
+Usage (depuis la racine du projet) :
+    python benchmarks/bench_ean13.py [--iterations 200000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import barcode
+
+from app import ean13
+
+CODES = [
+    '601557289109', '737611949835', '229371228917', '854880470967',
+    '854142754554', '673716111833', '289328010440', '788616031920',
+]
+
+
+def via_python_barcode():
+    EAN = barcode.get_barcode_class('ean13')
+    for code in CODES:
+        EAN(code).get_fullcode()
+
+
+def via_arithmetique():
+    for code in CODES:
+        ean13.code_complet(code)
+
+
+def via_normalisation():
+    for code in CODES:
+        ean13.normaliser(ean13.code_complet(code))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    # Les deux implémentations doivent produire exactement le même code
+    EAN = barcode.get_barcode_class('ean13')
+    for code in CODES:
+        assert EAN(code).get_fullcode() == ean13.code_complet(code), code
+
+    appels = args.iterations * len(CODES)
+    resultats = {}
+    for nom, fonction in [
+        ('python-barcode', via_python_barcode),
+        ('app.ean13.code_complet', via_arithmetique),
+        ('app.ean13 complet+normaliser', via_normalisation),
+    ]:
+        duree = min(timeit.repeat(fonction, number=args.iterations, repeat=3))
+        resultats[nom] = duree
+        print(f"{nom:32} {duree / appels * 1e9:10.1f} ns/appel")
+
+    reference = resultats['python-barcode']
+    print(f"\nAccélération code_complet : x{reference / resultats['app.ean13.code_complet']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Micro-benchmark de la recherche approximative par nom (app.recherche)
+sur un catalogue synthétique construit en mémoire, sans base de données.
+
+Usage (depuis la racine du projet) :
+    SECRET_KEY=x python benchmarks/bench_recherche.py [--produits 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
+
+import django
+
+django.setup()
+
+from django.utils import timezone
+from rapidfuzz.utils import default_process
+
+from app.generation import generation_catalogue
+from app.recherche import IndexNoms
+
+MOTS = ['popcorn', 'savon', 'riz', 'sucre', 'huile', 'lait', 'farine', 'sel', 'biscuit',
+        'jus', 'eau', 'cafe', 'samsung', 'tecno', 'chargeur', 'cable', 'caramel', 'bleu']
+REQUETES = ['popcron', 'popcorn caramel', 'samsng chargeur', 'savon bleu 500g', 'frine']
+
+
+def construire(nombre, graine):
+    """ Remplit un index comme le ferait _construire(), à partir de noms aléatoires. """
+    aleatoire = random.Random(graine)
+    vocabulaire = MOTS + [
+        ''.join(aleatoire.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(7)) for _ in range(nombre // 10)
+    ]
+    index = IndexNoms()
+    for produit_id in range(nombre):
+        mots = [aleatoire.choice(vocabulaire) for _ in range(aleatoire.randint(1, 4))]
+        nom = ' '.join(mots) + f' {aleatoire.randint(1, 999)}g'
+        index.produits[produit_id] = (nom, 1, None)
+        index.noms[produit_id] = default_process(nom)
+        for mot in index.noms[produit_id].split():
+            index.postings[mot].add(produit_id)
+    # Index considéré à jour pendant toute la mesure : ni rattrapage ni reconstruction depuis la base
+    index._construit_le = float('inf')
+    index._synchronise_depuis = timezone.now()
+    index._generation = generation_catalogue()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--produits', type=int, default=100000)
+    parser.add_argument('--repetitions', type=int, default=20)
+    args = parser.parse_args()
+
+    index = construire(args.produits, graine=42)
+    print(f"{args.produits} produits, {len(index.postings)} mots distincts")
+    for requete in REQUETES:
+        durees = []
+        for _ in range(args.repetitions):
+            debut = time.perf_counter()
+            resultats = index.rechercher(requete, limite=10)
+            durees.append(time.perf_counter() - debut)
+        durees.sort()
+        print(f"{requete:20} médiane {durees[len(durees) // 2] * 1000:6.2f} ms  "
+              f"max {durees[-1] * 1000:6.2f} ms  ({len(resultats)} résultats)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark de concurrence SQLite : plusieurs processus (comme des workers
+gunicorn) mêlent des scans (lecture d'un prix par code-barres) et des
+créations de produits sur une même base.
+
+Deux configurations sont comparées, chacune sur sa propre copie de la base :
+
+* defaut  : backend sqlite3 sans options (journal DELETE, une connexion par requête) ;
+* optimise : configuration SQLite de conf/database.py (WAL, pragmas, BEGIN IMMEDIATE,
+  connexions persistantes).
+
+Chaque opération est encadrée comme une requête Django (close_old_connections).
+Les images ne sont pas rendues (BARCODE_RENDU_ASYNCHRONE forcé).
+
+Usage (depuis la racine du projet) :
+    SECRET_KEY=x python benchmarks/bench_sqlite.py [--processus 8] [--duree 10] [--ecritures 0.2]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
+
+
+def configurer(chemin, mode):
+    """ Pointe la base par défaut sur chemin avant django.setup(). """
+    from django.conf import settings
+
+    from conf.database import base_sqlite
+
+    if mode == 'defaut':
+        settings.DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': chemin}
+    else:
+        settings.DATABASES['default'] = base_sqlite(chemin)
+    settings.BARCODE_RENDU_ASYNCHRONE = True
+
+    import django
+
+    django.setup()
+
+
+def preparer(chemin, nombre):
+    """ Crée le schéma et nombre produits ; renvoie la liste de leurs codes. """
+    configurer(chemin, 'defaut')
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    from app.models import Produit
+
+    call_command('migrate', verbosity=0)
+    produits = [
+        Produit(nom=f'Produit {i}', prix=random.randint(100, 99999) / 100, barcode=code)
+        for i, code in enumerate(Produit.allouer_codes_barres(nombre))
+    ]
+    for produit in produits:
+        produit.ean13 = produit.get_full_barcode()
+        produit.barcode_image.name = produit.chemin_image()
+    Produit.objects.bulk_create(produits, batch_size=1000)
+    connection.close()
+    return [produit.barcode for produit in produits]
+
+
+def travailler(chemin, mode, codes, duree, part_ecritures, graine, file_resultats):
+    configurer(chemin, mode)
+
+    from django.db import OperationalError, close_old_connections
+
+    from app.models import Produit
+
+    aleatoire = random.Random(graine)
+    lectures, ecritures, erreurs = [], [], 0
+    fin = time.perf_counter() + duree
+    while time.perf_counter() < fin:
+        close_old_connections()
+        ecriture = aleatoire.random() < part_ecritures
+        debut = time.perf_counter()
+        try:
+            if ecriture:
+                Produit.objects.create(nom=f'Nouveau {aleatoire.random()}', prix=1)
+            else:
+                Produit.objects.filter(barcode=aleatoire.choice(codes)).values_list('id', 'nom', 'prix').first()
+        except OperationalError:
+            # « database is locked »
+            erreurs += 1
+            continue
+        finally:
+            close_old_connections()
+        (ecritures if ecriture else lectures).append(time.perf_counter() - debut)
+    file_resultats.put((lectures, ecritures, erreurs))
+
+
+def centile(durees, p):
+    if not durees:
+        return 0.0
+    durees = sorted(durees)
+    return durees[min(len(durees) - 1, int(len(durees) * p))] * 1000
+
+
+def mesurer(modele, mode, codes, args):
+    chemin = os.path.join(os.path.dirname(modele), f'{mode}.sqlite3')
+    shutil.copy(modele, chemin)
+    contexte = multiprocessing.get_context('spawn')
+    file_resultats = contexte.Queue()
+    processus = [
+        contexte.Process(target=travailler,
+                         args=(chemin, mode, codes, args.duree, args.ecritures, graine, file_resultats))
+        for graine in range(args.processus)
+    ]
+    for p in processus:
+        p.start()
+    resultats = [file_resultats.get() for _ in processus]
+    for p in processus:
+        p.join()
+
+    lectures = [d for r in resultats for d in r[0]]
+    ecritures = [d for r in resultats for d in r[1]]
+    erreurs = sum(r[2] for r in resultats)
+    print(f"{mode:9} {(len(lectures) + len(ecritures)) / args.duree:9.0f} op/s  "
+          f"lecture p50 {centile(lectures, 0.5):6.2f} ms p95 {centile(lectures, 0.95):7.2f} ms  "
+          f"écriture p50 {centile(ecritures, 0.5):6.2f} ms p95 {centile(ecritures, 0.95):7.2f} ms  "
+          f"erreurs {erreurs}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processus', type=int, default=8)
+    parser.add_argument('--duree', type=float, default=10, help="Durée de chaque mesure (secondes).")
+    parser.add_argument('--ecritures', type=float, default=0.2, help="Part des opérations qui créent un produit.")
+    parser.add_argument('--produits', type=int, default=20000, help="Taille du catalogue initial.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        modele = os.path.join(dossier, 'modele.sqlite3')
+        codes = preparer(modele, args.produits)
+        print(f"{args.produits} produits, {args.processus} processus, "
+              f"{args.ecritures:.0%} d'écritures, {args.duree:g} s par configuration")
+        for mode in ('defaut', 'optimise'):
+            mesurer(modele, mode, codes, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Charge d'une surface de vente : N postes de caisse travaillent en même temps
+sur un serveur gunicorn local, comme des utilisateurs (session, CSRF).
+
+Chaque poste (un processus, connexion HTTP persistante) se connecte par le
+formulaire de /login/, garde ses cookies, récupère la liste des produits
+(/produits/?format=csv) puis enchaîne des opérations tirées selon --melange :
+
+* scan : page de scan (/scan/?code_barre=...), code à 12 ou 13 chiffres ;
+* creation : formulaire /nouveau/ (POST avec jeton CSRF, redirection attendue) ;
+* etiquette : page d'impression d'un produit puis l'image qu'elle désigne
+  (format de l'image enregistrée, ou BARCODE_FORMAT du serveur) ;
+* planche : planche PDF de 44 étiquettes (/produits/imprimer/?format=pdf).
+
+Sans --url, une base SQLite temporaire est remplie (comme charge_scan.py),
+un utilisateur est créé et gunicorn est lancé avec gunicorn.conf.py dans le
+mode --mode. Les statiques y sont servis sans manifeste (pas de
+collectstatic) : hors DEBUG, le stockage à manifeste ferait échouer toutes
+les pages. Avec --url, le serveur indiqué est utilisé tel quel avec
+--utilisateur / --mot-de-passe.
+
+Le rapport donne, par opération et au total : débit, centiles de latence et
+taux d'erreurs (statut inattendu ou échec de connexion).
+
+Usage (depuis la racine du projet) :
+    python benchmarks/charge_caisse.py [--postes 8] [--duree 20] [--melange scan=85,creation=5,etiquette=8,planche=2]
+    python benchmarks/charge_caisse.py --url http://127.0.0.1:8000 --utilisateur caisse --mot-de-passe ...
+"""
+import argparse
+import csv
+import http.client
+import io
+import multiprocessing
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from charge_scan import RACINE, attendre, port_libre, preparer
+
+UTILISATEUR = 'caisse'
+MOT_DE_PASSE = 'charge-caisse'
+MELANGE = 'scan=85,creation=5,etiquette=8,planche=2'
+OPERATIONS = ('scan', 'creation', 'etiquette', 'planche')
+CHAMP_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+IMAGE_CODE_BARRE = re.compile(r'src="(/code-barre/\d{12,13}\.(?:png|svg))"')
+
+
+def lire_melange(texte):
+    """ 'scan=85,creation=5' -> {'scan': 85.0, 'creation': 5.0} """
+    melange = {}
+    for element in texte.split(','):
+        nom, _, poids = element.partition('=')
+        nom = nom.strip()
+        if nom not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Opération inconnue : {nom} (choix : {', '.join(OPERATIONS)}).")
+        try:
+            melange[nom] = float(poids)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Poids invalide pour {nom} : {poids!r}.")
+    if not any(poids > 0 for poids in melange.values()):
+        raise argparse.ArgumentTypeError("Le mélange doit contenir au moins une opération de poids positif.")
+    return melange
+
+
+class EchecRequete(Exception):
+    pass
+
+
+class Poste:
+    """ Un poste de caisse : une connexion persistante et les cookies de sa session. """
+
+    def __init__(self, hote, port):
+        self.hote = hote
+        self.port = port
+        self.origine = f'http://{hote}:{port}'
+        self.connexion = http.client.HTTPConnection(hote, port, timeout=30)
+        self.cookies = SimpleCookie()
+
+    def requete(self, methode, chemin, corps=None, statuts=(200,)):
+        entetes = {}
+        if self.cookies:
+            entetes['Cookie'] = '; '.join(f'{nom}={morceau.value}' for nom, morceau in self.cookies.items())
+        if corps is not None:
+            corps = urlencode(corps)
+            entetes['Content-Type'] = 'application/x-www-form-urlencoded'
+            entetes['Origin'] = self.origine
+            entetes['Referer'] = self.origine + chemin
+        try:
+            self.connexion.request(methode, chemin, body=corps, headers=entetes)
+            reponse = self.connexion.getresponse()
+            contenu = reponse.read()
+        except (OSError, http.client.HTTPException) as exc:
+            self.connexion.close()
+            raise EchecRequete(f'{methode} {chemin} : {exc}')
+        for valeur in reponse.headers.get_all('Set-Cookie') or ():
+            self.cookies.load(valeur)
+        if reponse.status not in statuts:
+            raise EchecRequete(f'{methode} {chemin} : statut {reponse.status}')
+        return reponse, contenu
+
+    def jeton_csrf(self, chemin):
+        """ Jeton du formulaire de la page (le cookie csrftoken est posé au passage). """
+        _, contenu = self.requete('GET', chemin)
+        trouve = CHAMP_CSRF.search(contenu.decode('utf-8', 'replace'))
+        if not trouve:
+            raise EchecRequete(f'Pas de jeton CSRF dans {chemin}')
+        return trouve.group(1)
+
+    def se_connecter(self, utilisateur, mot_de_passe):
+        jeton = self.jeton_csrf('/login/')
+        reponse, _ = self.requete('POST', '/login/', {
+            'username': utilisateur, 'password': mot_de_passe, 'csrfmiddlewaretoken': jeton,
+        }, statuts=(200, 302))
+        # La vue répond 200 (formulaire réaffiché) quand les identifiants sont refusés
+        if reponse.status != 302 or 'sessionid' not in self.cookies:
+            raise EchecRequete(f'Connexion refusée pour {utilisateur}')
+
+    def produits(self):
+        """ (id, code à 12 chiffres, code EAN-13) de tout le catalogue, par l'export CSV. """
+        _, contenu = self.requete('GET', '/produits/?format=csv')
+        lignes = csv.DictReader(io.StringIO(contenu.decode('utf-8')))
+        return [(int(ligne['id']), ligne['barcode'], ligne['ean13']) for ligne in lignes]
+
+
+def executer(poste, operation, produits, aleatoire):
+    if operation == 'scan':
+        _, code, code13 = aleatoire.choice(produits)
+        poste.requete('GET', '/scan/?' + urlencode({'code_barre': aleatoire.choice((code, code13))}))
+    elif operation == 'creation':
+        jeton = poste.jeton_csrf('/nouveau/')
+        poste.requete('POST', '/nouveau/', {
+            'nom': f'Produit caisse {aleatoire.randrange(10 ** 6)}',
+            'prix': f'{aleatoire.randint(100, 99999) / 100:.2f}',
+            'csrfmiddlewaretoken': jeton,
+        }, statuts=(302,))
+    elif operation == 'etiquette':
+        produit_id, _, _ = aleatoire.choice(produits)
+        _, contenu = poste.requete('GET', f'/produit/{produit_id}/imprimer/')
+        # Même URL que le navigateur : l'extension suit le format servi par le serveur
+        trouve = IMAGE_CODE_BARRE.search(contenu.decode('utf-8', 'replace'))
+        if not trouve:
+            raise EchecRequete(f"Pas d'image de code-barres dans /produit/{produit_id}/imprimer/")
+        poste.requete('GET', trouve.group(1))
+    else:
+        ids = ','.join(str(produit[0]) for produit in aleatoire.sample(produits, min(44, len(produits))))
+        poste.requete('GET', '/produits/imprimer/?' + urlencode({'ids': ids, 'format': 'pdf'}))
+
+
+def poste_de_caisse(hote, port, identifiants, melange, duree, pause, graine, file_resultats):
+    aleatoire = random.Random(graine)
+    operations, poids = zip(*melange.items())
+    durees = {operation: [] for operation in operations}
+    erreurs = dict.fromkeys(operations, 0)
+    messages = []
+
+    poste = Poste(hote, port)
+    try:
+        poste.se_connecter(*identifiants)
+        produits = poste.produits()
+    except EchecRequete as exc:
+        file_resultats.put((durees, erreurs, [str(exc)]))
+        return
+
+    fin = time.perf_counter() + duree
+    while time.perf_counter() < fin:
+        operation = aleatoire.choices(operations, poids)[0]
+        debut = time.perf_counter()
+        try:
+            executer(poste, operation, produits, aleatoire)
+        except EchecRequete as exc:
+            erreurs[operation] += 1
+            if len(messages) < 5:
+                messages.append(str(exc))
+        else:
+            durees[operation].append(time.perf_counter() - debut)
+        if pause:
+            time.sleep(aleatoire.expovariate(1 / pause))
+    file_resultats.put((durees, erreurs, messages))
+
+
+def centile(durees, p):
+    return durees[min(len(durees) - 1, int(len(durees) * p))] * 1000 if durees else 0.0
+
+
+def rapport(resultats, duree):
+    print(f"{'operation':10} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erreurs':>8}")
+    toutes, total_erreurs = [], 0
+    for operation in OPERATIONS:
+        durees = sorted(d for r in resultats for d in r[0].get(operation, ()))
+        erreurs = sum(r[1].get(operation, 0) for r in resultats)
+        if not durees and not erreurs:
+            continue
+        toutes.extend(durees)
+        total_erreurs += erreurs
+        print(f"{operation:10} {len(durees) / duree:8.1f} {centile(durees, 0.5):8.2f} {centile(durees, 0.95):8.2f} "
+              f"{centile(durees, 0.99):8.2f} {erreurs / (len(durees) + erreurs):8.1%}")
+    toutes.sort()
+    nombre = len(toutes) + total_erreurs
+    print(f"{'total':10} {len(toutes) / duree:8.1f} {centile(toutes, 0.5):8.2f} {centile(toutes, 0.95):8.2f} "
+          f"{centile(toutes, 0.99):8.2f} {total_erreurs / nombre if nombre else 0:8.1%}")
+    messages = [message for r in resultats for message in r[2]]
+    for message in dict.fromkeys(messages):
+        print(f"  ! {message}")
+
+
+def lancer_postes(hote, port, identifiants, args):
+    contexte = multiprocessing.get_context('spawn')
+    file_resultats = contexte.Queue()
+    # Préchauffage (imports paresseux, caches, index), non mesuré
+    poste_de_caisse(hote, port, identifiants, args.melange, 1, 0, -1, file_resultats)
+    file_resultats.get()
+
+    postes = [
+        contexte.Process(target=poste_de_caisse,
+                         args=(hote, port, identifiants, args.melange, args.duree, args.pause, graine, file_resultats))
+        for graine in range(args.postes)
+    ]
+    for p in postes:
+        p.start()
+    resultats = [file_resultats.get() for _ in postes]
+    for p in postes:
+        p.join()
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--postes', type=int, default=8, help="Postes de caisse simultanés (un processus chacun).")
+    parser.add_argument('--duree', type=float, default=20, help="Durée de la mesure (secondes).")
+    parser.add_argument('--melange', type=lire_melange, default=lire_melange(MELANGE),
+                        help=f"Poids relatifs des opérations (défaut : {MELANGE}).")
+    parser.add_argument('--pause', type=float, default=0,
+                        help="Pause moyenne entre deux opérations d'un poste, en secondes (défaut : 0).")
+    parser.add_argument('--url', help="Serveur déjà lancé (ex. http://127.0.0.1:8000) au lieu d'un serveur temporaire.")
+    parser.add_argument('--utilisateur', default=UTILISATEUR, help="Utilisateur des postes avec --url.")
+    parser.add_argument('--mot-de-passe', default=MOT_DE_PASSE, help="Mot de passe des postes avec --url.")
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi', help="Mode gunicorn du serveur temporaire.")
+    parser.add_argument('--produits', type=int, default=10000, help="Taille du catalogue temporaire.")
+    args = parser.parse_args()
+
+    if args.url:
+        adresse = urlsplit(args.url)
+        print(f"{args.url}, {args.postes} postes, {args.duree:g} s")
+        rapport(lancer_postes(adresse.hostname, adresse.port or 80, (args.utilisateur, args.mot_de_passe), args),
+                args.duree)
+        return
+
+    with tempfile.TemporaryDirectory() as dossier:
+        env, _ = preparer(dossier, args.produits)
+        env['STATICFILES_BACKEND'] = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        subprocess.run(
+            [sys.executable, os.path.join(RACINE, 'manage.py'), 'createsuperuser', '--noinput',
+             '--username', UTILISATEUR, '--email', f'{UTILISATEUR}@example.com'],
+            env={**env, 'DJANGO_SUPERUSER_PASSWORD': MOT_DE_PASSE}, cwd=RACINE, check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        port = port_libre()
+        serveur = subprocess.Popen(
+            ['gunicorn', '--config', os.path.join(RACINE, 'gunicorn.conf.py')],
+            env={**env, 'GUNICORN_MODE': args.mode, 'PORT': str(port)}, cwd=RACINE,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            attendre(port)
+            print(f"{args.produits} produits, {args.postes} postes, {args.duree:g} s, gunicorn {args.mode}")
+            resultats = lancer_postes('127.0.0.1', port, (UTILISATEUR, MOT_DE_PASSE), args)
+        finally:
+            serveur.terminate()
+            serveur.wait()
+    rapport(resultats, args.duree)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Test de charge de l'API de scan (GET /api/scan/<code>/) servie par gunicorn
+avec gunicorn.conf.py, dans chacun des modes demandés :
+
+* wsgi : workers gthread, vues synchrones ;
+* asgi : workers uvicorn, vues asynchrones (aobtenir, auser).
+
+Avec --sans-cache, le cache des prix est désactivé et chaque scan lit la base.
+
+Une base SQLite temporaire est remplie avec import_produits, puis pour chaque
+mode un serveur est lancé et des clients (un processus chacun, connexion
+HTTP persistante) scannent des codes au hasard pendant --duree secondes.
+
+Usage (depuis la racine du projet) :
+    python benchmarks/charge_scan.py [--modes wsgi asgi] [--clients 16] [--duree 10] [--sans-cache]
+"""
+import argparse
+import csv
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JETON = 'charge-scan'
+
+
+def preparer(dossier, nombre):
+    """ Crée et remplit la base ; renvoie l'environnement des serveurs et les codes. """
+    base = os.path.join(dossier, 'charge.sqlite3')
+    env = {
+        **os.environ,
+        'DATABASE_URL': f'sqlite:///{base}',
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'charge'),
+        'ALLOWED_HOSTS': '127.0.0.1',
+        'CSRF_TRUSTED_ORIGINS': 'http://127.0.0.1',
+        'SCAN_API_JETONS': JETON,
+        'BARCODE_RENDU_ASYNCHRONE': 'True',
+    }
+    fichier = os.path.join(dossier, 'catalogue.csv')
+    with open(fichier, 'w', newline='') as sortie:
+        ecrivain = csv.writer(sortie)
+        ecrivain.writerow(['nom', 'prix'])
+        for i in range(nombre):
+            ecrivain.writerow([f'Produit {i}', f'{random.randint(100, 99999) / 100:.2f}'])
+
+    manage = [sys.executable, os.path.join(RACINE, 'manage.py')]
+    subprocess.run(manage + ['migrate', '--verbosity', '0'], env=env, cwd=RACINE, check=True)
+    subprocess.run(manage + ['import_produits', fichier, '--rendu', 'aucun'],
+                   env=env, cwd=RACINE, check=True, stdout=subprocess.DEVNULL)
+    with sqlite3.connect(base) as connexion:
+        codes = [code for code, in connexion.execute('SELECT barcode FROM app_produit')]
+    return env, codes
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def attendre(port, delai=30):
+    fin = time.monotonic() + delai
+    while time.monotonic() < fin:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Le serveur n'écoute pas sur le port {port}.")
+
+
+def client(port, codes, duree, graine, file_resultats):
+    aleatoire = random.Random(graine)
+    connexion = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    entetes = {'Authorization': f'Token {JETON}'}
+    durees, erreurs = [], 0
+    fin = time.perf_counter() + duree
+    while time.perf_counter() < fin:
+        debut = time.perf_counter()
+        try:
+            connexion.request('GET', f'/api/scan/{aleatoire.choice(codes)}/', headers=entetes)
+            reponse = connexion.getresponse()
+            reponse.read()
+        except (OSError, http.client.HTTPException):
+            erreurs += 1
+            connexion.close()
+            continue
+        if reponse.status != 200:
+            erreurs += 1
+            continue
+        durees.append(time.perf_counter() - debut)
+    file_resultats.put((durees, erreurs))
+
+
+def centile(durees, p):
+    return durees[min(len(durees) - 1, int(len(durees) * p))] * 1000 if durees else 0.0
+
+
+def mesurer(mode, env, codes, args):
+    port = port_libre()
+    env = {**env, 'GUNICORN_MODE': mode, 'PORT': str(port)}
+    if args.sans_cache:
+        env['CACHE_PRIX_TAILLE'] = '0'
+    serveur = subprocess.Popen(
+        ['gunicorn', '--config', os.path.join(RACINE, 'gunicorn.conf.py')],
+        env=env, cwd=RACINE,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        attendre(port)
+        contexte = multiprocessing.get_context('spawn')
+        file_resultats = contexte.Queue()
+        # Préchauffage (imports paresseux, caches), non mesuré
+        client(port, codes, 1, -1, file_resultats)
+        file_resultats.get()
+
+        clients = [
+            contexte.Process(target=client, args=(port, codes, args.duree, graine, file_resultats))
+            for graine in range(args.clients)
+        ]
+        for p in clients:
+            p.start()
+        resultats = [file_resultats.get() for _ in clients]
+        for p in clients:
+            p.join()
+    finally:
+        serveur.terminate()
+        serveur.wait()
+
+    durees = sorted(d for r in resultats for d in r[0])
+    erreurs = sum(r[1] for r in resultats)
+    print(f"{mode:5} {len(durees) / args.duree:8.0f} req/s  p50 {centile(durees, 0.5):6.2f} ms  "
+          f"p95 {centile(durees, 0.95):6.2f} ms  p99 {centile(durees, 0.99):6.2f} ms  erreurs {erreurs}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+    parser.add_argument('--clients', type=int, default=16, help="Clients simultanés (un processus chacun).")
+    parser.add_argument('--duree', type=float, default=10, help="Durée de chaque mesure (secondes).")
+    parser.add_argument('--produits', type=int, default=10000, help="Taille du catalogue.")
+    parser.add_argument('--sans-cache', action='store_true', help="Désactive le cache des prix.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        env, codes = preparer(dossier, args.produits)
+        print(f"{args.produits} produits, {args.clients} clients, {args.duree:g} s par mode")
+        for mode in args.modes:
+            mesurer(mode, env, codes, args)
+
+
+if __name__ == '__main__':
+    main()
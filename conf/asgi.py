@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
+# Sous ASGI, le scan et les recherches JSON sont routés vers leurs vues asynchrones (app/urls.py)
+os.environ['SERVEUR_ASYNCHRONE'] = 'True'
 
 application = get_asgi_application()
@@ -1,12 +1,15 @@
 """
 Django settings for conf project.
 
-Adapté pour le déploiement sur Render, en utilisant SQLite (attention aux données éphémères).
+Adapté pour le déploiement sur Render : PostgreSQL via DATABASE_URL, ou SQLite
+par défaut (attention aux données éphémères).
 """
 
 from pathlib import Path
 import os
 
+from .database import base_de_donnees
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # En tête pour mesurer toute la pile : Server-Timing et histogrammes par vue (app/middleware.py)
+    'app.middleware.MesureRequetesMiddleware',
     # WhiteNoise doit être placé juste après SecurityMiddleware.
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Pour servir les statiques en prod
@@ -75,13 +80,11 @@ TEMPLATES = [
 WSGI_APPLICATION = 'conf.wsgi.application'
 
 
-# --- 2. DATABASE CONFIG (SQLITE FOR RENDER) ---
-# ATTENTION : Les données seront perdues à chaque redéploiement sur Render !
+# --- 2. DATABASE CONFIG ---
+# PostgreSQL (avec pool de connexions) si DATABASE_URL est défini, SQLite sinon : voir conf/database.py.
+# ATTENTION : avec SQLite, les données seront perdues à chaque redéploiement sur Render !
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': base_de_donnees(BASE_DIR / 'db.sqlite3'),
 }
 
 
@@ -122,8 +125,12 @@ STATICFILES_DIRS = [
 # Configuration de WhiteNoise pour la gestion des statiques en production.
 if not DEBUG:
     STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+        },
+        # Surchargeable pour un serveur local sans collectstatic (benchmarks/charge_caisse.py)
         "staticfiles": {
-            "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+            "BACKEND": os.environ.get('STATICFILES_BACKEND', "whitenoise.storage.CompressedManifestStaticFilesStorage"),
         },
     }
 
@@ -136,4 +143,83 @@ LOGOUT_REDIRECT_URL = '/home/'
 
 # Media files (Fichiers utilisateurs)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# --- 4. CODES-BARRES ---
+# Rendu des images hors de la requête : save() place un travail dans la file
+# et le worker (python manage.py rendre_codes_barres) génère les PNG.
+BARCODE_RENDU_ASYNCHRONE = os.environ.get('BARCODE_RENDU_ASYNCHRONE', 'True') == 'True'
+
+# Format des images enregistrées : 'png' (Pillow) ou 'svg' (vectoriel, compact et bien plus rapide
+# à produire). manage.py convertir_codes_barres convertit les images existantes.
+BARCODE_FORMAT = os.environ.get('BARCODE_FORMAT', 'png')
+
+# Allocation des codes : 'aleatoire' (12 chiffres au hasard) ou 'sequentiel' (préfixe GS1 +
+# référence d'article tirée d'un compteur en base, par blocs de BARCODE_TAILLE_BLOC par worker).
+# Le préfixe par défaut, 200, est réservé par GS1 à la circulation interne (magasin).
+BARCODE_ALLOCATEUR = os.environ.get('BARCODE_ALLOCATEUR', 'aleatoire')
+BARCODE_PREFIXE_GS1 = os.environ.get('BARCODE_PREFIXE_GS1', '200')
+BARCODE_TAILLE_BLOC = int(os.environ.get('BARCODE_TAILLE_BLOC', 100))
+
+# Taille maximale (octets) du cache LRU des rendus servis par image_code_barre
+BARCODE_CACHE_RENDUS_OCTETS = int(os.environ.get('BARCODE_CACHE_RENDUS_OCTETS', 8 * 1024 * 1024))
+
+
+# --- 5. RECHERCHE PAR NOM ---
+# Intervalle (secondes) entre deux rattrapages de l'index des noms d'un worker sur le flux des changements
+RECHERCHE_INDEX_TTL = int(os.environ.get('RECHERCHE_INDEX_TTL', 300))
+
+
+# --- 6. CACHE ET API DE SCAN ---
+# La génération du catalogue (ETag de l'API de scan) est conservée dans ce cache. Il doit être
+# partagé par tous les processus (workers gunicorn, import_produits, rendre_codes_barres) :
+# fichiers sous BASE_DIR/.cache par défaut, ou Redis / Memcached. LocMemCache, propre à chaque
+# processus, laisserait les autres workers répondre 304 avec un prix périmé.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    }
+}
+
+# Jetons acceptés par l'API de scan (en-tête « Authorization: Token <jeton> »), séparés par des virgules
+SCAN_API_JETONS = [jeton for jeton in os.environ.get('SCAN_API_JETONS', '').split(',') if jeton]
+
+# Cache des prix du scan : 'local' (LRU par worker) ou 'django' (cache CACHE_PRIX_ALIAS, partageable)
+CACHE_PRIX_BACKEND = os.environ.get('CACHE_PRIX_BACKEND', 'local')
+CACHE_PRIX_ALIAS = os.environ.get('CACHE_PRIX_ALIAS', 'default')
+CACHE_PRIX_TAILLE = int(os.environ.get('CACHE_PRIX_TAILLE', 10000))
+# Durée de vie (secondes) d'un prix en cache. Les entrées sont aussi rattachées à la génération du
+# catalogue (CACHES['default']) : une modification, dans n'importe quel processus, les périme toutes.
+CACHE_PRIX_TTL = int(os.environ.get('CACHE_PRIX_TTL', 300))
+
+
+# --- 7. CATALOGUE HORS LIGNE ---
+# Intervalle minimal (s) entre deux relectures du catalogue, âge (s) au-delà duquel
+# il est relu même sans changement de génération, et nombre de versions gardées pour les deltas
+CATALOGUE_INTERVALLE_MIN = int(os.environ.get('CATALOGUE_INTERVALLE_MIN', 60))
+CATALOGUE_AGE_MAX = int(os.environ.get('CATALOGUE_AGE_MAX', 600))
+CATALOGUE_VERSIONS_CONSERVEES = int(os.environ.get('CATALOGUE_VERSIONS_CONSERVEES', 20))
+
+
+# --- 8. FLUX DES CHANGEMENTS ---
+# Les changements plus récents que cette marge (secondes) ne sont pas encore servis,
+# le temps que les transactions en cours soient validées
+CHANGEMENTS_MARGE = int(os.environ.get('CHANGEMENTS_MARGE', 5))
+
+
+# --- 9. SERVEUR ---
+# Activé par conf/asgi.py : le scan et les recherches JSON sont servis par leurs vues
+# asynchrones et SQLite n'utilise pas de connexions persistantes (conf/database.py)
+SERVEUR_ASYNCHRONE = os.environ.get('SERVEUR_ASYNCHRONE', 'False') == 'True'
+
+
+# --- 10. MÉTRIQUES ---
+# Nombre de requêtes récentes conservées par vue pour les centiles p50 / p95 / p99
+METRIQUES_FENETRE = int(os.environ.get('METRIQUES_FENETRE', 1000))
+
+# Registre Prometheus (/metrics) : dossier partagé par tous les processus de la machine (workers
+# web, worker de rendu du Procfile, commandes), vide = processus courant seul. Un processus dans un
+# autre conteneur doit monter le même dossier. Jeton attendu en « Authorization: Bearer <jeton> »
+METRIQUES_DOSSIER = os.environ.get('METRIQUES_DOSSIER', str(BASE_DIR / '.metriques'))
+METRIQUES_JETON = os.environ.get('METRIQUES_JETON', '')
@@ -0,0 +1,75 @@
+"""
+Configuration de gunicorn (chargée automatiquement depuis la racine du projet).
+
+Deux modes, choisis par GUNICORN_MODE :
+
+* wsgi (défaut) : workers gthread (conf.wsgi), plusieurs threads par processus
+  pour recouvrir les attentes base de données / disque des vues synchrones ;
+* asgi : workers uvicorn (conf.asgi), une boucle d'événements par processus
+  pour les vues asynchrones.
+
+Les valeurs se règlent par l'environnement : WEB_CONCURRENCY (processus),
+GUNICORN_THREADS, GUNICORN_MAX_REQUESTS, GUNICORN_KEEPALIVE, GUNICORN_TIMEOUT.
+"""
+import multiprocessing
+import os
+
+MODE = os.environ.get('GUNICORN_MODE', 'wsgi')
+CPU = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if MODE == 'asgi':
+    wsgi_app = 'conf.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # Une boucle d'événements sert déjà de nombreuses connexions : un processus par CPU
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPU))
+else:
+    wsgi_app = 'conf.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CPU * 2 + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Application chargée une fois dans le maître puis partagée par copie sur écriture
+# (index, modules, caches de rendu) au lieu d'être importée par chaque worker
+preload_app = True
+
+# Recyclage des workers pour borner la mémoire ; la gigue évite qu'ils redémarrent tous ensemble
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+
+# Battement de cœur des workers en mémoire plutôt que sur un disque parfois lent (conteneurs)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+
+# Métriques /metrics agrégées entre workers : un fichier par processus dans METRIQUES_DOSSIER
+# (app/registre.py), partagé avec le worker de rendu du Procfile. Il n'est pas vidé au démarrage :
+# les fichiers des autres processus en cours y sont encore lus.
+
+
+def on_starting(server):
+    if workers > 1 and 'locmem' in os.environ.get('CACHE_BACKEND', ''):
+        server.log.warning(
+            "CACHE_BACKEND=LocMemCache avec %d workers : chaque worker garde sa génération du "
+            "catalogue et peut répondre 304 avec un prix périmé. Utiliser un cache partagé.", workers
+        )
+
+
+def post_fork(server, worker):
+    # Aucune connexion ouverte dans le maître ne doit être partagée entre workers
+    from django.db import connections
+
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # Les compteurs du worker recyclé sont conservés dans l'archive
+    from app.registre import registre
+
+    registre.archiver()